@@ -0,0 +1,496 @@
+"""Alert notifications for sensor status changes.
+
+The monitor turns every debounced status change (see debounce.py) into an
+alert event: a sensor going red or flapping, or recovering. The result
+listener only puts the event on a bounded queue, so probing never waits
+on a mail server or a webhook, and a full queue drops events (counted on
+/metrics) instead of blocking.
+
+A dispatcher thread groups the events that arrive within ``group_window``
+seconds of the first one into one notification. A whole NPort box going
+down is one message listing its ports, not one per sensor. A sensor that
+went down and came back within the window is left out.
+
+Each sink has its own delivery thread with:
+
+* a rate limit of ``max_per_minute`` notifications, with bursts of
+  ``burst``. Notifications that arrive while it is exhausted are merged
+  into the next one sent, not queued one by one;
+* retries after a failure, ``retry_delay`` seconds doubling up to
+  ``max_retry_delay``, for ``max_attempts`` attempts. Notifications that
+  arrive in the meantime are merged into the retry.
+
+Sinks are configured in the JSON file named by ``ALERTS_CONFIG``
+(``alerts.json`` by default); without it nothing is sent::
+
+    {
+      "group_window": 10,
+      "sinks": [
+        {"type": "webhook", "url": "http://chat.example/hook", "max_per_minute": 6},
+        {"type": "smtp", "host": "mail.example", "port": 25, "from": "nport@example",
+         "to": ["ops@example"], "starttls": false},
+        {"type": "command", "command": ["/usr/local/bin/page-oncall"]},
+        {"type": "file", "path": "/var/log/nport-alerts.jsonl"}
+      ]
+    }
+
+Every sink also takes ``max_per_minute``, ``burst``, ``max_attempts``,
+``retry_delay`` and ``timeout``. ``python alerts.py test`` sends a test
+notification through every configured sink.
+"""
+import collections
+import email.message
+import json
+import logging
+import os
+import queue
+import shlex
+import smtplib
+import subprocess
+import threading
+import time
+import urllib.request
+
+import metrics
+
+# JSON file listing the alert sinks
+ALERTS_CONFIG = os.environ.get('ALERTS_CONFIG', 'alerts.json')
+
+# Seconds after the first event during which further events join the same notification
+GROUP_WINDOW = 10
+
+# Events waiting for the dispatcher; beyond this they are dropped and counted
+MAX_EVENTS = 10000
+
+# Events merged into one sink's pending notification; the oldest go first beyond this
+MAX_PENDING_EVENTS = 5000
+
+# Per-sink defaults, each overridable in the sink's configuration
+MAX_PER_MINUTE = 6
+BURST = 3
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 5  # seconds before the first retry, doubling after each failure
+MAX_RETRY_DELAY = 300
+SINK_TIMEOUT = 10  # seconds for one delivery attempt
+
+# Sensors listed in a notification's text; the JSON payload always has all of them
+TEXT_LIMIT = 50
+
+# Statuses alerted on when a sensor enters them; leaving them for green is alerted as a recovery
+ALERT_STATUSES = ("red", "flapping")
+
+ALERT_EVENTS_DROPPED = metrics.Counter("nport_alert_events_dropped_total",
+                                       "Status changes not alerted because the alert queue was full")
+ALERTS_SENT = metrics.Counter("nport_alerts_sent_total", "Notifications delivered, by sink", ("sink",))
+ALERTS_FAILED = metrics.Counter("nport_alerts_failed_total",
+                                "Notifications given up on after every attempt failed, by sink", ("sink",))
+ALERT_RETRIES = metrics.Counter("nport_alert_retries_total", "Failed delivery attempts that were retried, by sink",
+                                ("sink",))
+ALERT_QUEUE_DEPTH = metrics.Gauge("nport_alert_queue_depth", "Status changes waiting to be grouped into alerts")
+
+
+class Notification:
+    """Status changes sent as one message; ``events`` are alert event dicts, oldest first."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def merge(self, other):
+        return Notification(_net_changes(self.events + other.events)[-MAX_PENDING_EVENTS:])
+
+    def counts(self):
+        return collections.Counter(event["status"] for event in self.events)
+
+    @property
+    def title(self):
+        counts = self.counts()
+        parts = [f"{counts['red']} down"] if counts["red"] else []
+        if counts["flapping"]:
+            parts.append(f"{counts['flapping']} flapping")
+        if counts["green"]:
+            parts.append(f"{counts['green']} recovered")
+        stations = sorted({event["station"] or "?" for event in self.events})
+        where = stations[0] if len(stations) == 1 else f"{len(stations)} stations"
+        return f"N-Port monitor: {', '.join(parts) or 'no changes'} at {where}"
+
+    @property
+    def text(self):
+        """Plain-text body: one line per sensor, grouped by station and NPort address."""
+        boxes = collections.defaultdict(list)
+        for event in self.events:
+            boxes[(event["station"] or "?", event["ip"])].append(event)
+        lines, listed = [], 0
+        for (station_name, ip), events in sorted(boxes.items()):
+            lines.append(f"{station_name}, NPort {ip}:")
+            for event in events:
+                if listed == TEXT_LIMIT:
+                    break
+                listed += 1
+                detail = f" ({event['error']})" if event["status"] == "red" and event["error"] else ""
+                lines.append(f"  {event['platform'] or '?'} / {event['sensor']} port {event['port']}: "
+                             f"{event['previous']} -> {event['status']}{detail} at "
+                             f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['ts']))}")
+        if listed < len(self.events):
+            lines.append(f"... and {len(self.events) - listed} more")
+        return "\n".join(lines)
+
+    def payload(self):
+        return {"title": self.title, "text": self.text, "counts": dict(self.counts()), "events": self.events}
+
+
+def _net_changes(events):
+    """Keep one event per sensor, from its first previous status to its last status; drop round trips."""
+    first, last = {}, {}
+    for event in events:
+        first.setdefault(event["id"], event)
+        last[event["id"]] = event
+    changes = []
+    for sensor_id, event in last.items():
+        previous = first[sensor_id]["previous"]
+        if previous != event["status"]:
+            changes.append(dict(event, previous=previous))
+    return sorted(changes, key=lambda event: event["ts"])
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``capacity``; ``take`` returns how long to wait for one."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Sink:
+    """Base of the delivery targets; subclasses implement ``send(notification)`` and raise on failure."""
+
+    kind = "sink"
+
+    def __init__(self, name=None, max_per_minute=MAX_PER_MINUTE, burst=BURST, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY, timeout=SINK_TIMEOUT):
+        self.name = name or self.kind
+        self.max_per_minute = max_per_minute
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.timeout = timeout
+
+    def send(self, notification):
+        raise NotImplementedError
+
+
+class WebhookSink(Sink):
+    """POST the notification as JSON; any non-2xx answer is a failure."""
+
+    kind = "webhook"
+
+    def __init__(self, url, headers=None, **options):
+        super().__init__(**options)
+        self.url = url
+        self.headers = headers or {}
+
+    def send(self, notification):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(notification.payload()).encode(), method="POST",
+            headers={"Content-Type": "application/json", **self.headers},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpSink(Sink):
+    """Mail the notification's text."""
+
+    kind = "smtp"
+
+    def __init__(self, host, to, port=25, sender="nport-monitor@localhost", starttls=False, username=None,
+                 password=None, **options):
+        super().__init__(**options)
+        self.host = host
+        self.port = port
+        self.to = [to] if isinstance(to, str) else list(to)
+        self.sender = sender
+        self.starttls = starttls
+        self.username = username
+        self.password = password
+
+    def send(self, notification):
+        message = email.message.EmailMessage()
+        message["Subject"] = notification.title
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.to)
+        message.set_content(notification.text)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class CommandSink(Sink):
+    """Run a local command with the JSON payload on stdin and the title in ``ALERT_TITLE``."""
+
+    kind = "command"
+
+    def __init__(self, command, **options):
+        super().__init__(**options)
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+
+    def send(self, notification):
+        subprocess.run(
+            self.command, input=json.dumps(notification.payload()).encode(), timeout=self.timeout, check=True,
+            stdout=subprocess.DEVNULL, env=dict(os.environ, ALERT_TITLE=notification.title),
+        )
+
+
+class FileSink(Sink):
+    """Append the JSON payload as one line to a file."""
+
+    kind = "file"
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def send(self, notification):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(notification.payload(), sent=time.time())) + "\n")
+
+
+SINK_TYPES = {sink.kind: sink for sink in (WebhookSink, SmtpSink, CommandSink, FileSink)}
+
+
+def sink_from_config(config):
+    """Build a sink from one ``{"type": ..., ...}`` entry of the configuration."""
+    options = dict(config)
+    kind = options.pop("type", None)
+    if kind not in SINK_TYPES:
+        raise ValueError(f"Unknown alert sink type {kind!r}, expected one of {', '.join(SINK_TYPES)}")
+    if "from" in options:
+        options["sender"] = options.pop("from")
+    return SINK_TYPES[kind](**options)
+
+
+def load_config(path=ALERTS_CONFIG):
+    """Return ``(sinks, group_window)`` from the JSON file at ``path``; no sinks if it does not exist."""
+    if not os.path.exists(path):
+        return [], GROUP_WINDOW
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return [sink_from_config(entry) for entry in config.get("sinks", [])], config.get("group_window", GROUP_WINDOW)
+
+
+class SinkWorker(threading.Thread):
+    """Delivers notifications to one sink, rate limited and with retries, on its own thread."""
+
+    def __init__(self, sink):
+        super().__init__(name=f"alert-{sink.name}", daemon=True)
+        self.sink = sink
+        self._bucket = TokenBucket(sink.max_per_minute / 60, sink.burst)
+        self._pending = None
+        self._condition = threading.Condition()
+        self._stopping = False
+
+    def offer(self, notification):
+        """Queue a notification, merged with whatever is still waiting to go out."""
+        with self._condition:
+            self._pending = notification if self._pending is None else self._pending.merge(notification)
+            self._condition.notify()
+
+    def stop(self, timeout=None):
+        """Deliver what is pending, without waiting for the rate limit or retries, then stop."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.join(timeout)
+
+    def _wait(self, seconds):
+        """Sleep ``seconds`` unless stopping; return False once stopping."""
+        deadline = time.monotonic() + seconds
+        with self._condition:
+            # New notifications wake the condition too; they wait their turn
+            while not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._condition.wait(remaining)
+            return False
+
+    def _take(self):
+        with self._condition:
+            while self._pending is None and not self._stopping:
+                self._condition.wait()
+            notification, self._pending = self._pending, None
+            return notification
+
+    def run(self):
+        while True:
+            wait = self._bucket.take()
+            if wait:
+                self._wait(wait)
+            notification = self._take()
+            if notification is None:
+                return
+            if notification.events:
+                self._deliver(notification)
+
+    def _deliver(self, notification):
+        delay = self.sink.retry_delay
+        for attempt in range(1, self.sink.max_attempts + 1):
+            try:
+                self.sink.send(notification)
+                ALERTS_SENT.inc(self.sink.name)
+                return
+            except Exception as e:
+                if attempt == self.sink.max_attempts or not self._wait(delay):
+                    logging.error(f"Giving up on alert {notification.title!r} to {self.sink.name}: {e}")
+                    ALERTS_FAILED.inc(self.sink.name)
+                    return
+                logging.warning(f"Alert to {self.sink.name} failed (attempt {attempt}), retrying in {delay}s: {e}")
+                ALERT_RETRIES.inc(self.sink.name)
+                delay = min(delay * 2, self.sink.max_retry_delay)
+                # Whatever came in meanwhile goes out with the retry
+                with self._condition:
+                    if self._pending is not None:
+                        notification, self._pending = notification.merge(self._pending), None
+
+
+class AlertDispatcher(threading.Thread):
+    """Groups alert events into notifications and hands them to every sink's worker.
+
+    ``locate(sensor_id)`` returns ``(station, platform)`` or None; it is
+    how events name where a sensor is (see ``StateCache.locate``).
+    """
+
+    def __init__(self, sinks, locate=None, group_window=GROUP_WINDOW, max_events=MAX_EVENTS):
+        super().__init__(name="alert-dispatcher", daemon=True)
+        self.locate = locate or (lambda sensor_id: None)
+        self.group_window = group_window
+        self.workers = [SinkWorker(sink) for sink in sinks]
+        self._events = queue.Queue(maxsize=max_events)
+        self._stopping = threading.Event()
+        ALERT_QUEUE_DEPTH.set_function(self._events.qsize)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        super().start()
+        return self
+
+    def stop(self, timeout=None):
+        """Send what is grouped so far, then stop the dispatcher and the sinks."""
+        self._stopping.set()
+        self.join(timeout)
+        for worker in self.workers:
+            worker.stop(timeout)
+
+    def on_result(self, sensor, previous_status):
+        """Result listener: queue an event for alerting status changes. Never blocks."""
+        status = sensor["status"]
+        if status == previous_status:
+            return
+        if status not in ALERT_STATUSES and not (status == "green" and previous_status in ALERT_STATUSES):
+            return
+        location = self.locate(sensor.get("id")) or (None, None)
+        event = {
+            "id": sensor.get("id"),
+            "station": location[0],
+            "platform": location[1],
+            "sensor": sensor["sensor_name"],
+            "ip": sensor["ip"],
+            "port": sensor["port"],
+            "previous": previous_status,
+            "status": status,
+            "error": sensor.get("last_error"),
+            "ts": time.time(),
+        }
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            ALERT_EVENTS_DROPPED.inc()
+
+    def _collect(self):
+        """Wait for an event, then gather everything arriving within the group window."""
+        try:
+            events = [self._events.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.group_window
+        while not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                events.append(self._events.get(timeout=min(remaining, 1)))
+            except queue.Empty:
+                continue
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def run(self):
+        while not (self._stopping.is_set() and self._events.empty()):
+            events = _net_changes(self._collect())
+            if not events:
+                continue
+            notification = Notification(events)
+            logging.info(f"Alerting: {notification.title}")
+            for worker in self.workers:
+                worker.offer(notification)
+
+
+def start_alerting(locate=None, path=ALERTS_CONFIG):
+    """Start alerting through the sinks configured at ``path`` and register the result listener.
+
+    Returns the dispatcher, or None when no sink is configured.
+    """
+    from probe import result_listeners
+
+    sinks, group_window = load_config(path)
+    if not sinks:
+        return None
+    dispatcher = AlertDispatcher(sinks, locate, group_window).start()
+    result_listeners.append(dispatcher.on_result)
+    logging.info(f"Alerting through {', '.join(sink.name for sink in sinks)}")
+    return dispatcher
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the alert configuration.")
+    parser.add_argument("command", choices=["test"])
+    parser.add_argument("--config", default=ALERTS_CONFIG)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    sinks, _ = load_config(args.config)
+    if not sinks:
+        raise SystemExit(f"No alert sinks configured in {args.config}")
+    test = Notification([{
+        "id": None, "station": "Test", "platform": "Test", "sensor": "test", "ip": "127.0.0.1", "port": 0,
+        "previous": "green", "status": "red", "error": "test", "ts": time.time(),
+    }])
+    failed = 0
+    for sink in sinks:
+        try:
+            sink.send(test)
+            print(f"{sink.name}: sent")
+        except Exception as e:
+            failed += 1
+            print(f"{sink.name}: failed: {e}")
+    raise SystemExit(1 if failed else 0)
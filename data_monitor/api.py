@@ -0,0 +1,182 @@
+"""Versioned JSON API for dashboards and integrations.
+
+    GET /api/v1/overview
+    GET /api/v1/stations
+    GET /api/v1/stations/<name>
+    GET /api/v1/sensors/<id>/history[?from=&to=&resolution=]
+
+Payloads are compact: no whitespace, and no probe history in the station
+listings. Responses carry a weak ETag derived from the state cache's
+versions (see state.py). A client that sends it back in ``If-None-Match``
+gets an empty ``304 Not Modified``, decided before any payload is built,
+so polling an unchanged station costs a dict lookup. Bodies of
+``GZIP_MIN_SIZE`` bytes or more are gzip-compressed for clients that
+accept it.
+"""
+import gzip
+import json
+import time
+
+from flask import Blueprint, Response, request
+
+from rollups import RESOLUTIONS, get_history_series
+from state import state
+from station import get_db_connection
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+# Smaller bodies are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+# zlib's default trade-off between CPU and size
+GZIP_LEVEL = 6
+
+# Seconds of history returned when a range gives only its end or resolution
+HISTORY_DEFAULT_RANGE = 24 * 3600
+
+
+def history_range(args):
+    """Read ``from``, ``to`` and ``resolution`` query arguments.
+
+    Returns ``(start, end, resolution)``; raises ValueError with a message
+    for the client when they are invalid.
+    """
+    try:
+        end = float(args.get("to", time.time()))
+        start = float(args.get("from", end - HISTORY_DEFAULT_RANGE))
+    except ValueError:
+        raise ValueError("'from' and 'to' must be Unix timestamps")
+    resolution = args.get("resolution", "auto")
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise ValueError(f"'resolution' must be one of auto, {', '.join(RESOLUTIONS)}")
+    if start >= end:
+        raise ValueError("empty range")
+    return start, end, resolution
+
+
+def _not_modified(tag):
+    """Return a 304 response when the client already holds ``tag``, else None."""
+    if not request.if_none_match.contains_weak(tag):
+        return None
+    response = Response(status=304)
+    response.set_etag(tag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _json(payload, tag=None, status=200):
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    response = Response(body, status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_SIZE and "gzip" in request.accept_encodings:
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    if tag is not None:
+        response.set_etag(tag, weak=True)
+        # Cacheable, but revalidated on every poll
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _error(message, status):
+    return _json({"error": message}, status=status)
+
+
+@api.route("/overview")
+def overview():
+    """Fleet, station and platform status counts and the failing sensors."""
+    tag = f"{state.epoch}-{state.status_version}"
+    response = _not_modified(tag)
+    if response is not None:
+        return response
+    return _json(state.overview(), tag)
+
+
+@api.route("/stations")
+def list_stations():
+    tag = f"{state.epoch}-{state.status_version}"
+    response = _not_modified(tag)
+    if response is not None:
+        return response
+
+    stations = []
+    for name in state.station_names():
+        counts = state.status_counts(name)
+        if counts is not None:
+            stations.append({"name": name, **counts})
+    return _json({"stations": stations}, tag)
+
+
+@api.route("/stations/<name>")
+def get_station(name):
+    tag = f"{state.epoch}-{name}-{state.station_version(name)}"
+    response = _not_modified(tag)
+    if response is not None:
+        return response
+
+    platforms = state.snapshot_station(name, history=False)
+    if platforms is None:
+        return _error(f"Station {name} not found", 404)
+    return _json({
+        "name": name,
+        "platforms": [
+            {
+                "name": platform_name,
+                "sensors": [
+                    {
+                        "id": sensor["id"],
+                        "name": sensor["sensor_name"],
+                        "ip": sensor["ip"],
+                        "port": sensor["port"],
+                        "mode": sensor.get("mode") or "poll",
+                        "status": sensor["status"],
+                        "bytes_per_sec": sensor.get("bytes_per_sec"),
+                    }
+                    for sensor in sensors
+                ],
+            }
+            for platform_name, sensors in platforms.items()
+        ],
+    }, tag)
+
+
+@api.route("/sensors/<int:sensor_id>/history")
+def sensor_history(sensor_id):
+    """Samples probed since the monitor started, as parallel ``ts``/``status``/``latency_ms`` arrays.
+
+    With ``from``, ``to`` or ``resolution`` the stored history is returned
+    instead, as by ``/history``.
+    """
+    if any(key in request.args for key in ("from", "to", "resolution")):
+        return _ranged_history(sensor_id)
+
+    version = state.history_version(sensor_id)
+    if version is None:
+        return _error(f"Sensor {sensor_id} not found", 404)
+    tag = f"{state.epoch}-{sensor_id}-{version[0]}-{version[1]}"
+    response = _not_modified(tag)
+    if response is not None:
+        return response
+
+    samples = state.sensor_samples(sensor_id)
+    if samples is None:
+        return _error(f"Sensor {sensor_id} not found", 404)
+    timestamps, statuses, latencies = samples
+    return _json({
+        "id": sensor_id,
+        "ts": [None if ts is None else round(ts, 3) for ts in timestamps],
+        "status": statuses,
+        "latency_ms": [None if latency is None else round(latency, 2) for latency in latencies],
+    }, tag)
+
+
+def _ranged_history(sensor_id):
+    # Rollups change behind the live state's back, so ranged answers carry no ETag
+    if state.history_version(sensor_id) is None:
+        return _error(f"Sensor {sensor_id} not found", 404)
+    try:
+        start, end, resolution = history_range(request.args)
+    except ValueError as e:
+        return _error(str(e), 400)
+    resolution, points = get_history_series(get_db_connection(), sensor_id, start, end, resolution)
+    return _json({"id": sensor_id, "from": start, "to": end, "resolution": resolution, "points": points})
@@ -1,44 +1,125 @@
-from flask import Flask, render_template, redirect, url_for, request, jsonify
+from flask import Flask, Response, render_template, redirect, url_for, request, jsonify, stream_with_context
 from station import (
     add_station_to_db,
     delete_station_from_db,
     edit_station_in_db,
     get_station_data,
     get_platform_data,
-    get_sensor_data
+    get_sensor_data,
+    remove_platform_from_db,
+    remove_sensor_from_db
 )
 
-from station import get_station_data, edit_station_in_db, get_db_connection
+from station import get_station_data, edit_station_in_db, get_db_connection, start_monitoring
+from db import release_connection
+from inventory import FORMATS, export_inventory, format_of, import_inventory, read_records, write_records
+from rollups import get_history_series
+from state import ensure_loaded, follow_monitor as start_following, state
+from follower import record_station_change
+from alerts import start_alerting
+from api import api, history_range
+import metrics
 
+import io
+import logging
+import os
 import sqlite3
 import json
 import urllib.parse
 
 app = Flask(__name__)
-app.debug = True
+app.teardown_appcontext(release_connection)
+app.register_blueprint(api)
+# Serve results written by a separate monitor.py instead of probing in-process
+app.config['FOLLOW_MONITOR'] = os.environ.get('FOLLOW_MONITOR', '') in ('1', 'true')
+
+def create_app(follow_monitor=None):
+    """Set up logging, the database schema and the station state, and return the app.
+
+    Importing this module does none of that, so it stays cheap whatever
+    the size of the fleet. Entry points call this once; anything that
+    serves ``app`` without it gets the same set-up on its first request.
+
+    With ``follow_monitor`` the app expects a monitor daemon (monitor.py)
+    to do the probing and follows its results from the database; see
+    wsgi.py.
+    """
+    logging.basicConfig(level=logging.INFO)
+    if follow_monitor is not None:
+        app.config['FOLLOW_MONITOR'] = follow_monitor
+    ensure_loaded()
+    if app.config['FOLLOW_MONITOR']:
+        start_following()
+    return app
+
+@app.before_request
+def _load_state():
+    ensure_loaded()
+    if app.config['FOLLOW_MONITOR']:
+        # Once per process; a forked worker starts its own follower here
+        start_following()
+
+def _station_changed(name, previous_name=None):
+    """Reload a station this request changed, and tell the other processes about it."""
+    state.invalidate_station(name, previous_name=previous_name)
+    record_station_change(get_db_connection(), name, previous_name)
 
 @app.route('/')
 def index():
     try:
-        conn = get_db_connection()
-        stations = conn.execute('SELECT name FROM stations').fetchall()
-        conn.close()
-        if not stations:
-            return render_template('index.html', stations=[])
-        return render_template('index.html', stations=[s['name'] for s in stations])
+        stations = state.station_names()
+        counts = {name: state.status_counts(name) for name in stations}
+        return render_template('index.html', stations=stations, counts=counts)
     except Exception as e:
         app.logger.error(f"Failed to load stations: {e}")
         return "Error loading stations", 500
 
 
+@app.route('/overview')
+def overview():
+    return render_template('overview.html', overview=state.overview())
+
 @app.route('/station/<name>')
 def station(name):
-    station_info = get_station_data(name)
-    if station_info:
-        return render_template('station.html', station_name=name, platforms=station_info)
+    # The page shows status only; history is fetched per sensor from /history
+    platforms = state.snapshot_station(name, history=False)
+    if platforms is not None:
+        return render_template('station.html', station_name=name, platforms=platforms)
     else:
         return f"Station {name} not found", 404
 
+# Seconds between keep-alive comments on idle event streams
+STREAM_KEEPALIVE = 15
+
+
+@app.route('/stream/station/<name>')
+def stream_station(name):
+    """Server-sent events carrying only the status changes of one station."""
+    if name not in state.station_names():
+        return f"Station {name} not found", 404
+
+    subscriber = state.subscribe(name)
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscriber.overflowed:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                changes = subscriber.drain(STREAM_KEEPALIVE)
+                if not changes:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {changes[-1]['version']}\ndata: {json.dumps(changes)}\n\n"
+        finally:
+            state.unsubscribe(subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/add_station', methods=['GET', 'POST'])
 def add_station_page():
     if request.method == 'POST':
@@ -59,35 +140,121 @@ def add_station_page():
             platforms[platform_name] = sensors
 
         add_station_to_db(name, platforms)
+        _station_changed(name)
         return redirect(url_for('index'))
     
     return render_template('add_station.html')
 
 @app.route('/history/<platform_name>/<sensor_name>')
-def get_history(platform_name, sensor_name):
+@app.route('/history/<station_name>/<platform_name>/<sensor_name>')
+def get_history(platform_name, sensor_name, station_name=None):
     platform_name = urllib.parse.unquote(platform_name)
     sensor_name = urllib.parse.unquote(sensor_name)
 
-    history = get_sensor_data(platform_name, sensor_name).get('history', [])
-    return jsonify(history)
+    sensor = state.find_sensor(platform_name, sensor_name, station_name)
+    if sensor is None:
+        return jsonify([]), 404
+    if not any(key in request.args for key in ('from', 'to', 'resolution')):
+        return jsonify(sensor['history'])
+
+    # Long-range variant: stored history, downsampled to a bounded number of points
+    try:
+        start, end, resolution = history_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if sensor.get('id') is None:
+        return jsonify({"error": "empty range"}), 400
+
+    resolution, points = get_history_series(get_db_connection(), sensor['id'], start, end, resolution)
+    return jsonify({"from": start, "to": end, "resolution": resolution, "points": points})
+
+@app.route('/import', methods=['POST'])
+def import_stations():
+    """Upsert a JSON Lines or CSV inventory, sent as a 'file' upload or as the request body."""
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = request.args.get('format') or format_of(upload.filename)
+        body = upload.stream
+    else:
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+        body = request.stream
+    if fmt not in FORMATS:
+        return jsonify({"error": f"'format' must be one of {', '.join(FORMATS)}"}), 400
+    sync = request.values.get('sync') in ('1', 'true', 'on')
+
+    lines = io.TextIOWrapper(body, encoding='utf-8', newline='')
+    try:
+        counts, station_names = import_inventory(get_db_connection(), read_records(lines, fmt), sync=sync)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    for name in station_names:
+        _station_changed(name)
+    return jsonify(counts)
+
+@app.route('/export')
+def export_stations():
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in FORMATS:
+        return jsonify({"error": f"'format' must be one of {', '.join(FORMATS)}"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    records = export_inventory(get_db_connection())
+    return Response(stream_with_context(write_records(records, fmt)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=stations.{fmt}',
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Probe engine, database writer and per-sensor metrics in the Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _platforms_from_form(form):
+    """Read the edit form back into ``edit_station_in_db``'s platform list.
+
+    Every platform block posts its key in ``platform-key[]``; its fields and
+    sensor rows are suffixed with that key. Ids are empty for rows added in
+    the browser.
+    """
+    platforms = []
+    for key in form.getlist('platform-key[]'):
+        columns = [form.getlist(f'sensor-{field}-{key}[]') for field in ('id', 'name', 'ip', 'port')]
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError(f"incomplete sensor rows for platform {key}")
+        sensors = zip(*columns)
+        platforms.append({
+            "id": int(form[f'platform-id-{key}']) if form.get(f'platform-id-{key}') else None,
+            "name": form[f'platform-name-{key}'].strip(),
+            "sensors": [
+                {"id": int(sensor_id) if sensor_id else None, "sensor_name": name.strip(), "ip": ip.strip(), "port": int(port)}
+                for sensor_id, name, ip, port in sensors
+            ],
+        })
+    return platforms
 
 @app.route('/edit_station/<station_name>', methods=['GET', 'POST'])
 def edit_station(station_name):
     if request.method == 'POST':
-        new_name = request.form['new_name']
-        platforms = request.form.getlist('platforms')  # Assuming this is a list of platforms
-        edit_station_in_db(station_name, new_name, platforms)
-        return redirect(url_for('index'))  # Redirect to the index or another page
+        new_name = request.form['name'].strip()
+        try:
+            platforms = _platforms_from_form(request.form)
+            edit_station_in_db(station_name, new_name, platforms)
+        except (KeyError, ValueError, sqlite3.IntegrityError) as e:
+            return f"Failed to update station {station_name}: {e}", 400
+        _station_changed(new_name, previous_name=station_name)
+        return redirect(url_for('station', name=new_name))
 
     # On GET request, fetch the station data
     station_data = get_station_data(station_name)
-    return render_template('edit_station.html', station_data=station_data)
+    if "error" in station_data:
+        return f"Station {station_name} not found", 404
+    return render_template('edit_station.html', station_name=station_name, platforms=station_data["platforms"])
     
     
     
 @app.route('/delete_station/<name>', methods=['POST'])
 def delete_station_view(name):
     delete_station_from_db(name)
+    _station_changed(name)
     return redirect(url_for('index'))
 
 @app.route('/remove_platform', methods=['POST'])
@@ -97,6 +264,7 @@ def remove_platform():
     
     if get_platform_data(station_name, platform_name):
         remove_platform_from_db(station_name, platform_name)
+        _station_changed(station_name)
         return jsonify({"success": True})
     return jsonify({"success": False}), 404
 
@@ -108,9 +276,18 @@ def remove_sensor():
 
     if get_sensor_data(station_name, platform_name, sensor_index):
         remove_sensor_from_db(station_name, platform_name, sensor_index)
+        _station_changed(station_name)
         return jsonify({"success": True})
     return jsonify({"success": False}), 404
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    # Single-process mode for development: probes and pages share this process.
+    # For production run monitor.py and serve wsgi:app with a WSGI server.
+    create_app()
+    if not app.config['FOLLOW_MONITOR']:
+        start_alerting(state.locate)
+        state.monitor = start_monitoring()
+    # The reloader would run a second copy of the monitor in its child process;
+    # FLASK_DEBUG=1 turns on the debugger
+    app.run(host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
 
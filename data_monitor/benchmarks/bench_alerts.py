@@ -0,0 +1,194 @@
+"""Simulate a mass outage and count the alerts that reach each sink.
+
+Every sink type is pointed at a local stand-in: an HTTP server for the
+webhook, a minimal SMTP server, ``cat`` appending to a file for the
+command, and a plain file. A fleet of sensors behind a few NPort boxes
+goes down at once and comes back, fed through ``probe.record_result``
+like probe results. The benchmark reports the time the result listener
+adds to each result (what probing pays), and the notifications and
+events each sink received. With ``--fail-webhook N`` the webhook answers
+500 to its first N requests, to exercise the retries.
+
+    python benchmarks/bench_alerts.py --boxes 4 --ports 16 --group-window 2
+"""
+import argparse
+import email
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerts  # noqa: E402
+import probe  # noqa: E402
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failing = server.requests <= server.fail_first
+            if not failing:
+                server.received.append(json.loads(body))
+        self.send_response(500 if failing else 204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def webhook_server(fail_first):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.fail_first = fail_first
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.send_message: every command is accepted."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                message = []
+                for data in iter(self.rfile.readline, b""):
+                    if data == b".\r\n":
+                        break
+                    message.append(data.decode())
+                self.server.received.append("".join(message))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SmtpHandler)
+    server.daemon_threads = True
+    server.received = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fleet(boxes, ports):
+    sensors, locations = [], {}
+    for box in range(boxes):
+        for port in range(ports):
+            sensor_id = len(sensors) + 1
+            sensors.append({"id": sensor_id, "sensor_name": f"Sensor{port}", "ip": f"10.0.{box}.1",
+                            "port": 4001 + port, "status": "green", "history": []})
+            locations[sensor_id] = (f"Station{box % 2}", f"Platform{box}")
+    return sensors, locations
+
+
+def feed(sensors, entry, probes, step):
+    """Feed ``probes`` results of ``entry`` to every sensor, a probe round at a time; return seconds spent."""
+    elapsed = 0.0
+    for _ in range(probes):
+        for sensor in sensors:
+            started = time.perf_counter()
+            probe.record_result(sensor, "red" if entry else "green", entry, 1.0, step)
+            elapsed += time.perf_counter() - started
+        step += 1
+    return elapsed, step
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_alerts_")
+    webhook = webhook_server(args.fail_webhook)
+    smtp = smtp_server()
+    command_out = os.path.join(workdir, "command.jsonl")
+    file_out = os.path.join(workdir, "file.jsonl")
+    limits = {"max_per_minute": args.max_per_minute, "burst": args.burst, "retry_delay": 0.5, "timeout": 5}
+    sinks = [
+        alerts.WebhookSink(f"http://127.0.0.1:{webhook.server_address[1]}/hook", **limits),
+        alerts.SmtpSink("127.0.0.1", ["ops@localhost"], port=smtp.server_address[1], **limits),
+        alerts.CommandSink(["sh", "-c", f"cat >> {command_out}; echo >> {command_out}"], **limits),
+        alerts.FileSink(file_out, **limits),
+    ]
+
+    sensors, locations = fleet(args.boxes, args.ports)
+    dispatcher = alerts.AlertDispatcher(sinks, locations.get, args.group_window).start()
+
+    # Baseline: the same results with no listener registered
+    baseline, _ = feed(fleet(args.boxes, args.ports)[0], 1, args.outages * 8, 0)
+
+    probe.result_listeners.append(dispatcher.on_result)
+    elapsed, step = 0.0, 0
+    try:
+        for _ in range(args.outages):
+            # Down long enough to go red, then back long enough to recover
+            spent, step = feed(sensors, 1, 4, step)
+            elapsed += spent
+            time.sleep(args.outage_seconds)
+            spent, step = feed(sensors, 0, 4, step)
+            elapsed += spent
+            time.sleep(args.outage_seconds)
+    finally:
+        probe.result_listeners.remove(dispatcher.on_result)
+    time.sleep(args.group_window + 1)
+    dispatcher.stop(30)
+
+    results = args.outages * 8 * len(sensors)
+    changes = args.outages * 2 * len(sensors)
+    print(f"{len(sensors)} sensors on {args.boxes} NPort boxes, {args.outages} outage(s) and recoveries: "
+          f"{changes} alerting status changes")
+    print(f"record_result: {baseline / results * 1e6:.2f} us/result without alerting, "
+          f"{elapsed / results * 1e6:.2f} us with")
+    received = {
+        "webhook": [len(payload["events"]) for payload in webhook.received],
+        "smtp": [email.message_from_string(message).get_payload(decode=True).decode().count(" -> ")
+                 for message in smtp.received],
+        "command": [len(payload["events"]) for payload in read_lines(command_out)],
+        "file": [len(payload["events"]) for payload in read_lines(file_out)],
+    }
+    for name, counts in received.items():
+        print(f"{name:>8}: {len(counts)} notification(s), events per notification {counts}")
+    if args.fail_webhook:
+        print(f"webhook answered 500 to {min(args.fail_webhook, webhook.requests)} of {webhook.requests} requests")
+    webhook.shutdown()
+    smtp.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boxes", type=int, default=4)
+    parser.add_argument("--ports", type=int, default=16)
+    parser.add_argument("--outages", type=int, default=3)
+    parser.add_argument("--outage-seconds", type=float, default=3.0,
+                        help="seconds between outage and recovery; longer than the group window, or they cancel out")
+    parser.add_argument("--group-window", type=float, default=2.0)
+    parser.add_argument("--max-per-minute", type=float, default=2)
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--fail-webhook", type=int, default=0)
+    main(parser.parse_args())
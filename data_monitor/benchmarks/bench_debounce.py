@@ -0,0 +1,80 @@
+"""Count status transitions on noisy links with and without debouncing.
+
+Every simulated sensor fails each probe independently with the given
+probability, like a serial link that drops the odd line. The same result
+sequences are fed through ``probe.record_result`` once as they come (every
+result sets the status, which is what the monitor did before debounce.py)
+and once debounced. Transitions are what listeners react to: state cache
+versions, SSE pushes, log lines and sensors.status writes.
+
+    python benchmarks/bench_debounce.py --sensors 1000 --probes 200 --failure-rates 0 0.05 0.2 0.5 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import debounce  # noqa: E402
+import probe  # noqa: E402
+
+
+def sequences(sensors, probes, failure_rate, seed):
+    rng = random.Random(seed)
+    return [[int(rng.random() < failure_rate) for _ in range(probes)] for _ in range(sensors)]
+
+
+def run(results, debounced):
+    transitions = 0
+
+    def count(sensor, previous_status):
+        nonlocal transitions
+        if sensor["status"] != previous_status and previous_status != "unknown":
+            transitions += 1
+
+    sensors = [{"id": i + 1, "sensor_name": f"Sensor{i}", "ip": "127.0.0.1", "port": 4001, "status": "unknown",
+                "history": [], "flap_threshold": None if debounced else 0} for i in range(len(results))]
+    if not debounced:
+        # One failure turns it red and one success green again, as before
+        for sensor in sensors:
+            sensor["fail_threshold"] = sensor["fail_window"] = sensor["recover_threshold"] = 1
+    probe.result_listeners.append(count)
+    try:
+        started = time.perf_counter()
+        for step in range(len(results[0])):
+            for sensor, entries in zip(sensors, results):
+                entry = entries[step]
+                probe.record_result(sensor, "red" if entry else "green", entry, 1.0, step)
+        elapsed = time.perf_counter() - started
+    finally:
+        probe.result_listeners.remove(count)
+    statuses = {}
+    for sensor in sensors:
+        statuses[sensor["status"]] = statuses.get(sensor["status"], 0) + 1
+    return transitions, elapsed, statuses
+
+
+def main(args):
+    total = args.sensors * args.probes
+    print(f"{args.sensors} sensors x {args.probes} probes; debounce defaults: "
+          f"{debounce.FAIL_THRESHOLD} of {debounce.FAIL_WINDOW} to go red, {debounce.RECOVER_THRESHOLD} to recover, "
+          f"flapping at {debounce.FLAP_THRESHOLD} changes in {debounce.FLAP_WINDOW}")
+    print(f"{'failure rate':>12}  {'raw changes':>11}  {'debounced':>9}  {'us/result raw':>13}  {'debounced':>9}  "
+          f"final statuses")
+    for rate in args.failure_rates:
+        results = sequences(args.sensors, args.probes, rate, args.seed)
+        raw, raw_elapsed, _ = run(results, debounced=False)
+        changes, elapsed, statuses = run(results, debounced=True)
+        print(f"{rate:>12.2f}  {raw:>11}  {changes:>9}  {raw_elapsed / total * 1e6:>13.2f}  "
+              f"{elapsed / total * 1e6:>9.2f}  {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=1000)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--failure-rates", type=float, nargs="+", default=[0, 0.05, 0.2, 0.5, 1])
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
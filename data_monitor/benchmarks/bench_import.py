@@ -0,0 +1,59 @@
+"""Time a bulk inventory import, a re-import and an export.
+
+Generates a synthetic fleet as JSON Lines, imports it into a throwaway
+database, imports it again with every tenth port changed (the sync case),
+and exports it.
+
+    python benchmarks/bench_import.py --stations 125 --platforms 10 --sensors 16
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_import_")
+os.environ["STATIONS_DB"] = os.path.join(DB_DIR, "stations.db")
+logging.disable(logging.CRITICAL)
+
+import inventory  # noqa: E402
+import station  # noqa: E402
+from db import get_connection  # noqa: E402
+
+
+def fleet(stations, platforms, sensors, port_offset=0):
+    for s in range(stations):
+        for p in range(platforms):
+            for n in range(sensors):
+                i = (s * platforms + p) * sensors + n
+                yield {"station": f"Station{s}", "platform": f"Platform{p}", "sensor": f"Sensor{n}",
+                       "ip": f"10.{s % 256}.{p}.{n + 1}", "port": 4001 + (port_offset if i % 10 == 0 else 0)}
+
+
+def main(args):
+    station.create_tables()
+    conn = get_connection()
+    lines = list(inventory.write_jsonl(fleet(args.stations, args.platforms, args.sensors)))
+    changed = list(inventory.write_jsonl(fleet(args.stations, args.platforms, args.sensors, port_offset=1)))
+    print(f"sensors: {len(lines)}")
+
+    for label, data in (("initial import", lines), ("re-import, 10% changed", changed)):
+        started = time.perf_counter()
+        counts, _ = inventory.import_inventory(conn, inventory.read_jsonl(data), sync=True)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<24} {elapsed:7.2f}s  {counts}")
+
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in inventory.write_csv(inventory.export_inventory(conn)))
+    print(f"{'export (csv)':<24} {time.perf_counter() - started:7.2f}s  {size} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=125)
+    parser.add_argument("--platforms", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,196 @@
+"""Load-test the web routes over HTTP while the monitor probes a simulated fleet.
+
+Imports a simulated fleet (see simulator.py) into a throwaway database,
+starts the probe engine on it and serves the app with a threaded WSGI
+server. ``--clients`` threads then request the routes round-robin for
+``--duration`` seconds, each over its own connection per request.
+Reports throughput and latency percentiles per route, then how the probes
+fared meanwhile: results written per second, TCP connect times (measured
+on the probe engine's event loop, so they grow when it is starved) and
+how late probes started after falling due.
+
+By default the probes run in the web server's process, as ``python
+app.py`` does. With ``--split`` they run in a separate ``monitor.py`` and
+the app follows its results from the database, as in the production
+layout (see wsgi.py).
+
+    python benchmarks/bench_load.py --ports 2000 --clients 16 --duration 20 [--split]
+"""
+import argparse
+import collections
+import http.client
+import logging
+import os
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_load_")
+os.environ["STATIONS_DB"] = os.path.join(DB_DIR, "stations.db")
+logging.disable(logging.CRITICAL)
+
+from simulator import parse_mix, raise_fd_limit, start_process  # noqa: E402
+
+
+def client(port, paths, stop, results):
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+        results[path].append((time.perf_counter() - started, ok))
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def lag_buckets(port):
+    """Scrape the cumulative schedule-lag histogram as ``{upper bound: count}``."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/metrics")
+    text = conn.getresponse().read().decode()
+    conn.close()
+    pattern = r'^nport_probe_schedule_lag_seconds_bucket\{le="([^"]+)"\} (\S+)$'
+    return {float(le): float(count) for le, count in re.findall(pattern, text, re.MULTILINE)}
+
+
+def bucket_percentile(before, after, fraction):
+    """Upper bound of the bucket holding the ``fraction`` percentile of what was observed in between."""
+    total = after[float("inf")] - before.get(float("inf"), 0)
+    for bound in sorted(after):
+        if total and after[bound] - before.get(bound, 0) >= total * fraction:
+            return bound
+    return float("nan")
+
+
+def report_probes(started, ended, elapsed, lag_before, lag_after):
+    conn = sqlite3.connect(os.environ["STATIONS_DB"])
+    rows = conn.execute("SELECT latency_ms FROM probe_results WHERE ts >= ? AND ts < ?", (started, ended)).fetchall()
+    conn.close()
+    connects = sorted(row[0] for row in rows if row[0] is not None)
+    print(f"probes: {len(rows) / elapsed:7.1f} results/s   connect p50 {percentile(connects, 0.5):6.2f} ms   "
+          f"p95 {percentile(connects, 0.95):6.2f} ms   p99 {percentile(connects, 0.99):6.2f} ms")
+    print(f"schedule lag: p50 <= {bucket_percentile(lag_before, lag_after, 0.5)}s   "
+          f"p95 <= {bucket_percentile(lag_before, lag_after, 0.95)}s   "
+          f"p99 <= {bucket_percentile(lag_before, lag_after, 0.99)}s")
+
+
+def main(args):
+    raise_fd_limit()
+    process, simulator = start_process(parse_mix(args.mix, args.ports))
+    monitor = None
+    try:
+        import inventory
+        import station
+        from db import get_connection
+
+        station.create_tables()
+        records = inventory.read_jsonl(inventory.write_jsonl(simulator.records()))
+        inventory.import_inventory(get_connection(), records)
+
+        from werkzeug.serving import make_server
+
+        from app import app, create_app
+        from state import state
+        from supervisor import MonitorSupervisor
+
+        if args.split:
+            metrics_port = free_port()
+            monitor = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "monitor.py"), "--interval", str(args.interval),
+                 "--metrics-port", str(metrics_port)],
+                cwd=ROOT, stderr=subprocess.DEVNULL,
+            )
+        create_app(follow_monitor=args.split)
+        if not args.split:
+            state.monitor = MonitorSupervisor(station.stations, writer=station.get_result_writer(),
+                                              interval=args.interval).start()
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        if not args.split:
+            metrics_port = server.port
+
+        name = next(iter(station.stations))
+        sensor_id = next(iter(station.stations[name].values()))[0]["id"]
+        paths = [
+            "/", f"/station/{name}", "/overview", "/api/v1/overview", f"/api/v1/stations/{name}",
+            f"/api/v1/sensors/{sensor_id}/history", "/metrics",
+        ]
+        # Let the first probes land so pages have statuses to show
+        time.sleep(args.warmup)
+
+        results = collections.defaultdict(list)
+        stop = threading.Event()
+        threads = [threading.Thread(target=client, args=(server.port, paths, stop, results))
+                   for _ in range(args.clients)]
+        lag_before = lag_buckets(metrics_port)
+        window_started = time.time()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        window_ended = time.time()
+        lag_after = lag_buckets(metrics_port)
+        server.shutdown()
+        # Let the writer flush what was probed during the window
+        time.sleep(2)
+        if state.monitor is not None:
+            state.monitor.stop(5)
+
+        mode = "split (monitor.py + follower)" if args.split else "in-process monitor"
+        print(f"ports: {args.ports}  clients: {args.clients}  duration: {elapsed:.1f}s  {mode}")
+        total = 0
+        for path in paths:
+            samples = sorted(t for t, _ in results[path])
+            errors = sum(1 for _, ok in results[path] if not ok)
+            total += len(samples)
+            print(f"{path:<36} {len(samples) / elapsed:7.1f} req/s   "
+                  f"p50 {percentile(samples, 0.5) * 1000:7.1f} ms   p95 {percentile(samples, 0.95) * 1000:7.1f} ms   "
+                  f"p99 {percentile(samples, 0.99) * 1000:7.1f} ms   errors {errors}")
+        print(f"{'all routes':<36} {total / elapsed:7.1f} req/s")
+        report_probes(window_started, window_ended, elapsed, lag_before, lag_after)
+    finally:
+        if monitor is not None:
+            monitor.terminate()
+            monitor.wait(30)
+        process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=2000)
+    parser.add_argument("--mix", default="stream=80,silent=5,refuse=5,slow=3,slow_accept=2,drop=5")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--interval", type=float, default=10, help="seconds between probes of a healthy sensor")
+    parser.add_argument("--split", action="store_true", help="probe from a separate monitor.py process")
+    main(parser.parse_args())
@@ -0,0 +1,130 @@
+"""Compare the single-JOIN station loader with the old per-station/per-platform queries.
+
+Builds a throwaway database (default 1000 stations x 10 platforms x 16
+sensors) and times loading the whole tree and a single station's subtree.
+
+    python benchmarks/bench_loader.py --stations 1000 --platforms 10 --sensors 16
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_loader_")
+os.environ["STATIONS_DB"] = os.path.join(DB_DIR, "stations.db")
+logging.disable(logging.CRITICAL)
+
+import station  # noqa: E402
+
+
+def populate(stations, platforms, sensors):
+    station.create_tables()
+    conn = sqlite3.connect(station.DB_PATH)
+    with conn:
+        conn.executemany("INSERT INTO stations (id, name) VALUES (?, ?)",
+                         [(s + 1, f"Station{s}") for s in range(stations)])
+        conn.executemany("INSERT INTO platforms (id, station_id, name) VALUES (?, ?, ?)",
+                         [(s * platforms + p + 1, s + 1, f"Platform{p}")
+                          for s in range(stations) for p in range(platforms)])
+        conn.executemany("INSERT INTO sensors (platform_id, sensor_name, ip, port, status) VALUES (?, ?, ?, ?, ?)",
+                         [(pid + 1, f"Sensor{n}", "10.0.0.1", 4001 + n, "green")
+                          for pid in range(stations * platforms) for n in range(sensors)])
+    conn.close()
+
+
+def legacy_load_stations():
+    """The pre-JOIN loader: one query per station and one per platform."""
+    conn = sqlite3.connect(station.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name FROM stations")
+    stations = {}
+    for station_id, station_name in cursor.fetchall():
+        cursor.execute("SELECT id, name FROM platforms WHERE station_id = ?", (station_id,))
+        platforms = {}
+        for platform_id, platform_name in cursor.fetchall():
+            cursor.execute("SELECT id, sensor_name, ip, port, status FROM sensors WHERE platform_id = ?", (platform_id,))
+            platforms[platform_name] = [
+                {"id": sensor_id, "sensor_name": name, "ip": ip, "port": port, "status": status, "history": [],
+                 "connect_timeout": None, "first_byte_timeout": None, "mode": "poll", "silence_window": None,
+                 "fail_threshold": None, "fail_window": None, "recover_threshold": None, "flap_threshold": None,
+                 "interval": None}
+                for sensor_id, name, ip, port, status in cursor.fetchall()
+            ]
+        stations[station_name] = platforms
+    conn.close()
+    return stations
+
+
+def legacy_load_station(station_name):
+    conn = sqlite3.connect(station.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM stations WHERE name = ?", (station_name,))
+    station_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id, name FROM platforms WHERE station_id = ?", (station_id,))
+    platforms = {}
+    for platform_id, platform_name in cursor.fetchall():
+        cursor.execute("SELECT id, sensor_name, ip, port, status FROM sensors WHERE platform_id = ?", (platform_id,))
+        platforms[platform_name] = cursor.fetchall()
+    conn.close()
+    return platforms
+
+
+def join_load_stations():
+    conn = sqlite3.connect(station.DB_PATH)
+    tree = station.build_station_tree(station.query_station_tree(conn.cursor()))
+    conn.close()
+    return tree
+
+
+def join_load_station(station_name):
+    conn = sqlite3.connect(station.DB_PATH)
+    tree = station.build_station_tree(station.query_station_tree(conn.cursor(), station_name))
+    conn.close()
+    return tree
+
+
+def drop_indexes():
+    conn = sqlite3.connect(station.DB_PATH)
+    conn.execute("DROP INDEX idx_platforms_station_id")
+    conn.execute("DROP INDEX idx_sensors_platform_id")
+    conn.close()
+
+
+def timed(label, func, *args, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+    return result
+
+
+def main(args):
+    populate(args.stations, args.platforms, args.sensors)
+    total = args.stations * args.platforms * args.sensors
+    print(f"{args.stations} stations x {args.platforms} platforms x {args.sensors} sensors = {total} sensors\n")
+
+    legacy = timed("full tree, N+1 queries", legacy_load_stations)
+    joined = timed("full tree, single JOIN", join_load_stations)
+    assert legacy == joined, "loaders disagree"
+
+    name = f"Station{args.stations // 2}"
+    timed("one station, N+1 queries", legacy_load_station, name, repeat=50)
+    timed("one station, single JOIN", join_load_station, name, repeat=50)
+
+    # The old schema had no index on the foreign keys, so each per-platform
+    # query was a full scan of sensors.
+    drop_indexes()
+    timed("one station, N+1 queries, no indexes", legacy_load_station, name, repeat=5)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--platforms", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""Measure result-handling and snapshot throughput under lock contention.
+
+Worker threads record a fixed number of probe results on their own sensors
+as fast as they can while one reader thread keeps taking station snapshots
+through ``StateCache.snapshot_station``, like the dashboard does. The
+reader either copies histories, which takes every sensor's lock, or takes
+the status-only snapshot the station page and the JSON API use, which
+takes none.
+
+Each combination of worker count, lock (one global lock or the striped
+per-sensor locks from probe.py) and reader is run ``--repeat`` times and
+the median of each rate is reported, so one lucky or starved run does not
+decide the table.
+
+    python benchmarks/bench_locks.py --workers 1 2 4 8 16 --results 100000 --repeat 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_locks_")
+os.environ["STATIONS_DB"] = os.path.join(DB_DIR, "stations.db")
+logging.disable(logging.CRITICAL)
+
+import probe  # noqa: E402
+from state import StateCache  # noqa: E402
+
+STATION = "Station0"
+
+
+def build_stations(sensors):
+    platforms = {}
+    for i in range(sensors):
+        platforms.setdefault(f"Platform{i // 16}", []).append({
+            "id": i + 1,
+            "sensor_name": f"Sensor{i}",
+            "ip": "127.0.0.1",
+            "port": 4001,
+            "status": "unknown",
+            "history": [],
+        })
+    return {STATION: platforms}
+
+
+def run(cache, stations, workers, results, history):
+    """Record ``results`` results over ``workers`` threads; return (results/s, snapshots/s)."""
+    sensors = [sensor for group in stations[STATION].values() for sensor in group]
+    done = threading.Event()
+    snapshots = [0]
+
+    def worker(index):
+        own = sensors[index::workers]
+        for n in range(results // workers):
+            probe.record_result(own[n % len(own)], "green", 0, 1.0)
+
+    def reader():
+        while not done.is_set():
+            cache.snapshot_station(STATION, history=history)
+            if not done.is_set():
+                snapshots[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    watcher = threading.Thread(target=reader)
+    started = time.perf_counter()
+    watcher.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    watcher.join()
+    return (results // workers) * workers / elapsed, snapshots[0] / elapsed
+
+
+def main(args):
+    stations = build_stations(args.sensors)
+    cache = StateCache(stations, loader=None)
+    striped = probe.sensor_lock
+    global_lock = threading.Lock()
+
+    print(f"sensors: {args.sensors}, {args.results} results per run, median of {args.repeat} runs, one reader")
+    print(f"{'workers':>8} {'lock':>8} {'reader':>8} {'results/s':>12} {'snapshots/s':>12}")
+    for workers in args.workers:
+        for name, lock_for in (("global", lambda sensor: global_lock), ("striped", striped)):
+            for reader, history in (("history", True), ("status", False)):
+                probe.sensor_lock = lock_for
+                runs = [run(cache, stations, workers, args.results, history) for _ in range(args.repeat)]
+                probe.sensor_lock = striped
+                results = statistics.median(r for r, _ in runs)
+                snapshots = statistics.median(s for _, s in runs)
+                print(f"{workers:>8} {name:>8} {reader:>8} {results:>12.0f} {snapshots:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--results", type=int, default=100000, help="probe results recorded per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,73 @@
+"""Measure log output of the probe engine at the app's INFO level.
+
+Probes a set of simulated N-Port ports for several cycles, with a share of
+them closed so that those sensors fail every probe, and counts the lines
+and bytes the root logger writes. Status-change logging is enabled the
+same way ``start_monitoring`` does it.
+
+    python benchmarks/bench_logging.py --ports 2000 --dead 0.1 --cycles 5
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import probe  # noqa: E402
+from bench_probe import build_stations, start_listeners  # noqa: E402
+from probe import ProbeEngine  # noqa: E402
+
+
+async def main(args):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    servers = await start_listeners(args.ports)
+    stations = build_stations(servers)
+    dead = int(args.ports * args.dead)
+    for server in servers[:dead]:
+        server.close()  # connection refused from now on
+        await server.wait_closed()
+
+    log = io.StringIO()
+    handler = logging.StreamHandler(log)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.root.addHandler(handler)
+    logging.root.setLevel(getattr(logging, args.level))
+    if hasattr(probe, "log_status_change"):
+        probe.result_listeners.append(probe.log_status_change)
+
+    engine = ProbeEngine(max_concurrent=args.concurrency, connect_timeout=args.timeout, first_byte_timeout=args.timeout)
+    started = time.perf_counter()
+    for _ in range(args.cycles):
+        await engine.run_cycle(stations)
+    elapsed = time.perf_counter() - started
+    logging.root.removeHandler(handler)
+
+    for server in servers[dead:]:
+        server.close()
+
+    output = log.getvalue()
+    probes = args.ports * args.cycles
+    print(f"ports:          {args.ports} ({dead} closed)")
+    print(f"probes:         {probes} in {elapsed:.2f}s")
+    print(f"log level:      {args.level}")
+    print(f"log lines:      {output.count(chr(10))}")
+    print(f"log bytes:      {len(output.encode())}")
+    print(f"bytes/probe:    {len(output.encode()) / probes:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=2000)
+    parser.add_argument("--dead", type=float, default=0.1, help="share of ports that are closed")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--level", default="INFO", choices=("DEBUG", "INFO", "WARNING"))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""Sweep a simulated N-Port fleet with the probe engine and report resource use.
+
+The fleet (see simulator.py) runs in a child process, so the CPU time,
+memory, thread and file descriptor counts below are the monitor's alone.
+Each sweep probes every port once; the last result of each port is checked
+against what its behaviour should produce, so a wrong answer shows up next
+to the timings. Sensor statuses are debounced (see debounce.py), so a
+failing port only turns red after a few sweeps.
+
+    python benchmarks/bench_monitor.py --ports 5000 --sweeps 3 --timeout 2
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probe import ProbeEngine  # noqa: E402
+from simulator import expected_status, parse_mix, raise_fd_limit, start_process  # noqa: E402
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else -1
+
+
+async def sweep(engine, stations, samples):
+    """Run one cycle while sampling threads and open descriptors."""
+    task = asyncio.ensure_future(engine.run_cycle(stations))
+    while not task.done():
+        samples.append((threading.active_count(), open_fds()))
+        await asyncio.wait([task], timeout=0.05)
+    return task.result()
+
+
+async def main(args):
+    raise_fd_limit()
+    mix = parse_mix(args.mix, args.ports)
+    process, simulator = start_process(mix, slow_delay=args.slow_delay)
+    try:
+        stations = simulator.stations()
+        behaviours = {record["sensor"]: record["sensor"].split("-")[0] for record in simulator.records()}
+        engine = ProbeEngine(max_concurrent=args.concurrency, connect_timeout=args.timeout,
+                             first_byte_timeout=args.timeout)
+
+        print(f"ports:        {args.ports}  {mix}")
+        print(f"concurrency:  {args.concurrency}   timeout: {args.timeout}s")
+        samples = []
+        cpu_started, wall_started = cpu_seconds(), time.perf_counter()
+        for n in range(args.sweeps):
+            started = time.perf_counter()
+            counts = await sweep(engine, stations, samples)
+            elapsed = time.perf_counter() - started
+            print(f"sweep {n + 1}:      {elapsed:7.2f}s  {args.ports / elapsed:8.0f} probes/s  {counts}")
+        cpu, wall = cpu_seconds() - cpu_started, time.perf_counter() - wall_started
+
+        wrong = collections.Counter()
+        for platforms in stations.values():
+            for sensors in platforms.values():
+                for sensor in sensors:
+                    behaviour = behaviours[sensor["sensor_name"]]
+                    result = "green" if sensor["history"].recent() == 0 else "red"
+                    if result != expected_status(behaviour, args.timeout, args.slow_delay):
+                        wrong[behaviour] += 1
+
+        print(f"CPU:          {cpu:.2f}s ({cpu / wall:.0%} of one core)")
+        print(f"max RSS:      {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+        print(f"threads:      peak {max(s[0] for s in samples)}")
+        print(f"open fds:     peak {max(s[1] for s in samples)}")
+        print(f"wrong status: {dict(wrong) or 'none'}")
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=5000)
+    parser.add_argument("--mix", default="stream=80,silent=5,refuse=5,slow=3,slow_accept=2,drop=5")
+    parser.add_argument("--sweeps", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=2, help="connect and first-byte timeout")
+    parser.add_argument("--slow-delay", type=float, default=1, help="seconds before a slow port sends")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""Benchmark one probe cycle of the asyncio engine against simulated N-Port ports.
+
+Every simulated port is a localhost listener that writes a few bytes on
+accept, like an NPort in TCP-server mode with a sensor attached.
+
+    python benchmarks/bench_probe.py --ports 5000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probe import ProbeEngine  # noqa: E402
+
+
+async def _serve(reader, writer):
+    writer.write(b"$WIMDA,29.9,I,1.013,B*00\r\n")
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_listeners(count):
+    servers = []
+    for _ in range(count):
+        servers.append(await asyncio.start_server(_serve, "127.0.0.1", 0))
+    return servers
+
+
+def build_stations(servers, sensors_per_platform=16, platforms_per_station=10):
+    stations = {}
+    for i, server in enumerate(servers):
+        port = server.sockets[0].getsockname()[1]
+        station = f"Station{i // (sensors_per_platform * platforms_per_station)}"
+        platform = f"Platform{(i // sensors_per_platform) % platforms_per_station}"
+        stations.setdefault(station, {}).setdefault(platform, []).append({
+            "sensor_name": f"Sensor{i}",
+            "ip": "127.0.0.1",
+            "port": port,
+            "status": "unknown",
+            "history": [],
+        })
+    return stations
+
+
+async def main(args):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    servers = await start_listeners(args.ports)
+    stations = build_stations(servers)
+    engine = ProbeEngine(max_concurrent=args.concurrency, connect_timeout=args.timeout, first_byte_timeout=args.timeout)
+
+    started = time.perf_counter()
+    counts = await engine.run_cycle(stations)
+    elapsed = time.perf_counter() - started
+
+    for server in servers:
+        server.close()
+
+    print(f"ports:        {args.ports}")
+    print(f"stations:     {len(stations)}")
+    print(f"concurrency:  {args.concurrency}")
+    print(f"cycle time:   {elapsed:.3f}s")
+    print(f"probes/sec:   {args.ports / elapsed:.0f}")
+    print(f"green / red:  {counts['green']} / {counts['red']}")
+    print(f"OS threads:   {threading.active_count()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=5)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Time the Flask dashboard routes with the test client.
+
+Builds a throwaway database, then requests ``/``, ``/station/<name>`` and
+the JSON API repeatedly and reports mean and p95 latency per route. API
+routes are also timed as a polling client sees them once nothing changes:
+revalidated with the ETag of the previous answer.
+
+    python benchmarks/bench_routes.py --stations 200 --requests 500
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_routes_")
+os.environ["STATIONS_DB"] = os.path.join(DB_DIR, "stations.db")
+logging.disable(logging.CRITICAL)
+
+
+def populate(db_path, stations, platforms, sensors, history):
+    conn = sqlite3.connect(db_path)
+    now = time.time()
+    with conn:
+        conn.executemany("INSERT INTO stations (id, name) VALUES (?, ?)",
+                         [(s + 1, f"Station{s}") for s in range(stations)])
+        conn.executemany("INSERT INTO platforms (id, station_id, name) VALUES (?, ?, ?)",
+                         [(s * platforms + p + 1, s + 1, f"Platform{p}")
+                          for s in range(stations) for p in range(platforms)])
+        conn.executemany("INSERT INTO sensors (platform_id, sensor_name, ip, port, status) VALUES (?, ?, ?, ?, ?)",
+                         [(pid + 1, f"Sensor{n}", "10.0.0.1", 4001 + n, "green")
+                          for pid in range(stations * platforms) for n in range(sensors)])
+        sensor_ids = [row[0] for row in conn.execute("SELECT id FROM sensors")]
+        conn.executemany("INSERT INTO probe_results (sensor_id, ts, status) VALUES (?, ?, ?)",
+                         [(sensor_id, now - 60 * i, i % 7 == 0)
+                          for sensor_id in sensor_ids for i in range(history)])
+    conn.close()
+
+
+def measure(client, path, count, label=None, headers=None, expected=200):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == expected, (path, response.status_code)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label or path:<36} mean {mean * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms   {len(response.data)} bytes")
+    return response
+
+
+def main(args):
+    import station
+    station.create_tables()
+    populate(station.DB_PATH, args.stations, args.platforms, args.sensors, args.history)
+
+    from app import app, create_app
+    create_app()
+    app.debug = False
+    client = app.test_client()
+
+    measure(client, "/", args.requests)
+    measure(client, f"/station/Station{args.stations // 2}", args.requests)
+    measure(client, "/overview", args.requests)
+
+    gzip_ok = {"Accept-Encoding": "gzip"}
+    for path in ("/api/v1/overview", "/api/v1/stations", f"/api/v1/stations/Station{args.stations // 2}", "/api/v1/sensors/1/history"):
+        response = measure(client, path, args.requests, headers=gzip_ok)
+        measure(client, path, args.requests, label=f"{path} (304)",
+                headers=dict(gzip_ok, **{"If-None-Match": response.headers["ETag"]}), expected=304)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--platforms", type=int, default=10)
+    parser.add_argument("--sensors", type=int, default=16)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=300)
+    main(parser.parse_args())
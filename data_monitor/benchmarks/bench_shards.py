@@ -0,0 +1,131 @@
+"""Measure probe throughput as the fleet is split across shard processes.
+
+Simulated N-Port ports are localhost listeners hosted by their own
+processes, so the listeners do not compete with the engine being measured.
+For each shard count the ports are split across that many processes, each
+running a ProbeEngine whose results travel back over the same
+``ResultForwarder`` queue the sharded monitor uses. Timing starts once
+every shard has started up, and stops when the main process has received
+every result.
+
+    python benchmarks/bench_shards.py --ports 8000 --processes 1 2 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probe import ProbeEngine  # noqa: E402
+from shards import ResultForwarder  # noqa: E402
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def _serve(reader, writer):
+    writer.write(b"$WIMDA,29.9,I,1.013,B*00\r\n")
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def listener_main(count, ports, stop):
+    _raise_fd_limit()
+
+    async def run():
+        servers = [await asyncio.start_server(_serve, "127.0.0.1", 0, backlog=1024) for _ in range(count)]
+        ports.put([server.sockets[0].getsockname()[1] for server in servers])
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+
+
+def shard_main(ports, cycles, concurrency, results, ready, go):
+    _raise_fd_limit()
+    logging.basicConfig(level=logging.WARNING)
+    stations = {"Station": {"Platform": [
+        {"id": port, "sensor_name": f"Sensor{port}", "ip": "127.0.0.1", "port": port, "status": "unknown",
+         "history": []}
+        for port in ports
+    ]}}
+
+    async def run():
+        forwarder = ResultForwarder(results)
+        engine = ProbeEngine(max_concurrent=concurrency, writer=forwarder)
+        ready.release()
+        go.wait()
+        for _ in range(cycles):
+            await engine.run_cycle(stations)
+            forwarder.flush()
+
+    asyncio.run(run())
+
+
+def run(context, ports, processes, cycles, concurrency):
+    results = context.Queue()
+    ready = context.Semaphore(0)
+    go = context.Event()
+    shards = [
+        context.Process(target=shard_main, args=(ports[i::processes], cycles, concurrency, results, ready, go))
+        for i in range(processes)
+    ]
+    for shard in shards:
+        shard.start()
+    for _ in shards:
+        ready.acquire()
+
+    expected = len(ports) * cycles
+    received = 0
+    started = time.perf_counter()
+    go.set()
+    while received < expected:
+        received += len(results.get())
+    elapsed = time.perf_counter() - started
+    for shard in shards:
+        shard.join()
+    return elapsed
+
+
+def main(args):
+    _raise_fd_limit()
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    stop = context.Event()
+    per_listener = -(-args.ports // args.listeners)
+    listeners = [
+        context.Process(target=listener_main, args=(per_listener, port_queue, stop), daemon=True)
+        for _ in range(args.listeners)
+    ]
+    for listener in listeners:
+        listener.start()
+    ports = [port for _ in listeners for port in port_queue.get()][:args.ports]
+
+    print(f"ports: {len(ports)}, cycles per run: {args.cycles}, concurrency per shard: {args.concurrency}")
+    print(f"{'processes':>9} {'seconds':>9} {'probes/s':>10}")
+    for processes in args.processes:
+        elapsed = run(context, ports, processes, args.cycles, args.concurrency)
+        print(f"{processes:>9} {elapsed:>9.2f} {len(ports) * args.cycles / elapsed:>10.0f}")
+
+    stop.set()
+    for listener in listeners:
+        listener.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=8000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--listeners", type=int, default=4, help="processes hosting the simulated ports")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""Time a cold start of the web app for fleets of different sizes.
+
+For each size a throwaway database is filled with that many sensors, then
+a fresh interpreter measures ``import app`` and the first request to
+``/``, which is where the station tree gets loaded. Import time should
+not depend on the fleet size; only the first request may.
+
+    python benchmarks/bench_startup.py --sensors 1000 20000 100000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Sensors per platform and platforms per station of the generated fleets
+SENSORS_PER_PLATFORM = 16
+PLATFORMS_PER_STATION = 10
+
+CHILD = """
+import json, logging, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+status = client.get("/").status_code
+served = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": served - imported, "status": status}))
+"""
+
+
+def populate(db_path, sensors):
+    # The schema comes from the app itself, created in a child so this process never opens the pool
+    subprocess.run([sys.executable, "-c", "import station; station.create_tables()"], cwd=ROOT,
+                   env=dict(os.environ, STATIONS_DB=db_path), capture_output=True, check=True)
+    conn = sqlite3.connect(db_path)
+    platforms = (sensors + SENSORS_PER_PLATFORM - 1) // SENSORS_PER_PLATFORM
+    with conn:
+        conn.executemany("INSERT INTO stations (id, name) VALUES (?, ?)",
+                         [(s + 1, f"Station{s}") for s in range(platforms // PLATFORMS_PER_STATION + 1)])
+        conn.executemany("INSERT INTO platforms (id, station_id, name) VALUES (?, ?, ?)",
+                         [(p + 1, p // PLATFORMS_PER_STATION + 1, f"Platform{p % PLATFORMS_PER_STATION}")
+                          for p in range(platforms)])
+        conn.executemany("INSERT INTO sensors (platform_id, sensor_name, ip, port, status) VALUES (?, ?, ?, ?, ?)",
+                         [(n // SENSORS_PER_PLATFORM + 1, f"Sensor{n}", "10.0.0.1", 4001, "green")
+                          for n in range(sensors)])
+    conn.close()
+
+
+def cold_start(db_path):
+    env = dict(os.environ, STATIONS_DB=db_path)
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    print(f"{'sensors':>8}  {'import app':>11}  {'first request':>14}")
+    for sensors in args.sensors:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bench_startup_"), "stations.db")
+        populate(db_path, sensors)
+        cold_start(db_path)  # first run creates the schema and warms the page cache
+        runs = [cold_start(db_path) for _ in range(args.runs)]
+        imported = min(run["import"] for run in runs)
+        first_request = min(run["first_request"] for run in runs)
+        print(f"{sensors:>8}  {imported * 1000:>8.0f} ms  {first_request * 1000:>11.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, nargs="+", default=[1000, 20000, 100000])
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per size; the fastest is reported")
+    main(parser.parse_args())
@@ -0,0 +1,230 @@
+"""Fake N-Port fleet on localhost for benchmarks and manual testing.
+
+Every simulated port behaves like one NPort serial port in TCP-server mode
+with a sensor behind it:
+
+* ``stream`` -- sends an NMEA-like line on connect and every ``line_interval`` seconds
+* ``silent`` -- accepts the connection but never sends (sensor unplugged)
+* ``refuse`` -- the port is bound but not listening, so connects are refused
+* ``slow``   -- accepts, but the first line only comes after ``slow_delay`` seconds
+* ``slow_accept`` -- listening, but its accept queue is full and never
+  drained, so a connect hangs until the client's connect timeout
+* ``drop``   -- streams for ``drop_after`` seconds, then closes the connection
+
+All listeners run on one asyncio loop in a background thread. Run on its
+own, it prints the fleet as an inventory CSV (see inventory.py) and serves
+until interrupted:
+
+    python benchmarks/simulator.py --ports 2000 --mix stream=80,silent=5,refuse=5,slow=3,slow_accept=2,drop=5 > fleet.csv
+    python inventory.py import fleet.csv
+"""
+import argparse
+import asyncio
+import functools
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import threading
+
+BEHAVIOURS = ("stream", "silent", "refuse", "slow", "slow_accept", "drop")
+
+# What a weather sensor behind an NPort typically sends
+LINE = b"$WIMDA,29.9,I,1.013,B,4.2,C,,,,,,,,,,,,,,*00\r\n"
+
+# Sensors per platform and platforms per station in generated inventories
+SENSORS_PER_PLATFORM = 16
+PLATFORMS_PER_STATION = 10
+
+
+def parse_mix(text, ports):
+    """Turn ``"stream=80,silent=20"`` (percentages) into ``{behaviour: count}`` summing to ``ports``."""
+    shares = {}
+    for part in text.split(","):
+        behaviour, _, share = part.partition("=")
+        behaviour = behaviour.strip()
+        if behaviour not in BEHAVIOURS:
+            raise ValueError(f"Unknown behaviour {behaviour!r}, expected one of {', '.join(BEHAVIOURS)}")
+        shares[behaviour] = float(share or 1)
+    total = sum(shares.values())
+    counts = {behaviour: int(ports * share / total) for behaviour, share in shares.items()}
+    # Rounding leftovers go to the first behaviour
+    counts[next(iter(counts))] += ports - sum(counts.values())
+    return counts
+
+
+def expected_status(behaviour, first_byte_timeout, slow_delay):
+    """Status a single poll of a port with this behaviour should report."""
+    if behaviour in ("stream", "drop"):
+        return "green"
+    if behaviour == "slow":
+        return "green" if slow_delay < first_byte_timeout else "red"
+    # silent, refuse, and slow_accept after the connect timeout
+    return "red"
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Simulator:
+    """Thousands of fake NPort ports on one event loop; ``ports`` lists ``(port, behaviour)``."""
+
+    def __init__(self, mix, host="127.0.0.1", line_interval=1.0, slow_delay=3.0, drop_after=5.0):
+        self.mix = mix
+        self.host = host
+        self.line_interval = line_interval
+        self.slow_delay = slow_delay
+        self.drop_after = drop_after
+        self.ports = []
+        self._servers = []
+        self._refusing = []
+        self._stalled = []  # slow_accept listeners and the connections filling their queues
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        raise_fd_limit()
+        self._thread = threading.Thread(target=self._run, name="nport-simulator", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _run(self):
+        self._loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._open())
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            for server in self._servers:
+                server.close()
+            for sock in self._refusing + self._stalled:
+                sock.close()
+            loop.close()
+
+    async def _open(self):
+        for behaviour, count in self.mix.items():
+            for _ in range(count):
+                if behaviour == "refuse":
+                    # Bound but never listening: the kernel answers connects with RST
+                    sock = socket.socket()
+                    sock.bind((self.host, 0))
+                    self._refusing.append(sock)
+                    port = sock.getsockname()[1]
+                elif behaviour == "slow_accept":
+                    # With a backlog of 0 the queue holds one connection; once that
+                    # is taken the kernel drops further SYNs and connects hang
+                    sock = socket.socket()
+                    sock.bind((self.host, 0))
+                    sock.listen(0)
+                    self._stalled += [sock, socket.create_connection(sock.getsockname())]
+                    port = sock.getsockname()[1]
+                else:
+                    server = await asyncio.start_server(
+                        functools.partial(self._serve, behaviour), self.host, 0, backlog=128
+                    )
+                    self._servers.append(server)
+                    port = server.sockets[0].getsockname()[1]
+                self.ports.append((port, behaviour))
+
+    async def _serve(self, behaviour, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            if behaviour == "silent":
+                await reader.read()  # until the client hangs up
+                return
+            if behaviour == "slow":
+                await asyncio.sleep(self.slow_delay)
+            stop_at = loop.time() + self.drop_after if behaviour == "drop" else None
+            while stop_at is None or loop.time() < stop_at:
+                writer.write(LINE)
+                await writer.drain()
+                await asyncio.sleep(self.line_interval)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def records(self):
+        """Yield inventory records (see inventory.py), one per simulated port."""
+        per_station = SENSORS_PER_PLATFORM * PLATFORMS_PER_STATION
+        for i, (port, behaviour) in enumerate(self.ports):
+            yield {
+                "station": f"SimStation{i // per_station}",
+                "platform": f"Platform{(i // SENSORS_PER_PLATFORM) % PLATFORMS_PER_STATION}",
+                "sensor": f"{behaviour}-{i}",
+                "ip": self.host,
+                "port": port,
+            }
+
+    def stations(self):
+        """Return the fleet as an in-memory ``{station: {platform: [sensor]}}`` dict."""
+        stations = {}
+        for i, record in enumerate(self.records()):
+            stations.setdefault(record["station"], {}).setdefault(record["platform"], []).append({
+                "id": i + 1,
+                "sensor_name": record["sensor"],
+                "ip": record["ip"],
+                "port": record["port"],
+                "status": "unknown",
+                "history": [],
+                "mode": "poll",
+            })
+        return stations
+
+
+def _serve_in_process(mix, options, ports):
+    simulator = Simulator(mix, **options).start()
+    ports.put(simulator.ports)
+    threading.Event().wait()
+
+
+def start_process(mix, **options):
+    """Run a ``Simulator`` in a child process so it does not share CPU time with the code measured.
+
+    Returns ``(process, simulator)``; the local ``simulator`` is not
+    started but has the child's ``ports``, so ``records`` and ``stations``
+    work. Terminate ``process`` when done.
+    """
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    process = context.Process(target=_serve_in_process, args=(mix, options, ports), daemon=True)
+    process.start()
+    simulator = Simulator(mix, **options)
+    simulator.ports = ports.get(timeout=120)
+    return process, simulator
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from inventory import write_csv
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ports", type=int, default=1000)
+    parser.add_argument("--mix", default="stream=80,silent=5,refuse=5,slow=3,slow_accept=2,drop=5",
+                        help="behaviour=percentage pairs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--line-interval", type=float, default=1.0)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--drop-after", type=float, default=5.0)
+    args = parser.parse_args()
+
+    simulator = Simulator(parse_mix(args.mix, args.ports), host=args.host, line_interval=args.line_interval,
+                          slow_delay=args.slow_delay, drop_after=args.drop_after).start()
+    sys.stdout.writelines(write_csv(simulator.records()))
+    sys.stdout.flush()
+    print(f"Simulating {len(simulator.ports)} ports; Ctrl-C to stop", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        simulator.stop()
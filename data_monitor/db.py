@@ -0,0 +1,122 @@
+"""Pooled SQLite connections shared by the Flask app and the station module.
+
+Each thread borrows one connection from a small pool the first time it
+needs the database and keeps it until ``release_connection`` hands it back.
+The Flask app releases it at the end of every request via
+``app.teardown_appcontext``; long-lived threads (the probe engine, the
+result writer) simply keep theirs.
+
+Connections are opened once with the pragmas below and a large
+prepared-statement cache, so repeated queries skip both the connect and
+the SQL compile step.
+"""
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+# SQLite database holding the station inventory and probe history
+DB_PATH = os.environ.get('STATIONS_DB', 'stations.db')
+
+# Idle connections kept around for reuse
+POOL_SIZE = 8
+
+# Compiled statements kept per connection (sqlite3's default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-65536",  # 64 MiB
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def open_connection(db_path=None):
+    """Open a new connection with the standard pragmas applied."""
+    conn = sqlite3.connect(
+        db_path or DB_PATH,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of idle connections to one database file."""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return open_connection(self.db_path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def get_connection():
+    """Return this thread's connection, borrowing one from the pool if needed."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = get_pool().acquire()
+    return conn
+
+
+def release_connection(exc=None):
+    """Give this thread's connection back to the pool.
+
+    Signature matches ``app.teardown_appcontext`` so it can be registered
+    directly. Any transaction left open is rolled back.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    try:
+        get_pool().release(conn)
+    except sqlite3.Error as e:
+        logging.error(f"Failed to return connection to the pool: {e}")
+        conn.close()
+
+
+def close_pool():
+    """Close every idle connection, e.g. before forking worker processes."""
+    release_connection()
+    if _pool is not None:
+        _pool.close()
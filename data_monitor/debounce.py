@@ -0,0 +1,123 @@
+"""Debounced sensor status from raw probe results.
+
+A single failed probe no longer turns a sensor red. Each result is fed to a
+small state machine that keeps, next to the sensor's ring of recent results
+(``SensorState``), running counts over the newest results:
+
+* a sensor goes red once ``fail_threshold`` of its last ``fail_window``
+  results failed;
+* a red sensor goes green again after ``recover_threshold`` good results
+  in a row, however many failures are still in the window, and not
+  before, so one lucky probe does not bring it back;
+* a sensor whose raw results changed ``flap_threshold`` times or more over
+  the last ``FLAP_WINDOW`` results is ``flapping``, and stays so until the
+  changes drop to half of that. Then it is red or green by the rules above;
+* a failure whose error is in ``DECISIVE_ERRORS`` turns the sensor red at
+  once. A stream reports ``silent`` only after its silence window passed
+  without data (see streaming.py), which is a debounce of its own.
+
+The counts are updated as each result enters the window and the oldest
+leaves it, so a result costs the same whatever the window sizes. The four
+settings can be set per sensor or platform like the probe timeouts (see
+``station.PROBE_SETTING_COLUMNS``); a ``flap_threshold`` of 0 turns flap
+detection off.
+
+Probe results are still stored as they came; only ``sensor["status"]``,
+and everything that reads it, is debounced.
+"""
+
+# Failed results among the last FAIL_WINDOW that turn a sensor red
+FAIL_THRESHOLD = 3
+FAIL_WINDOW = 5
+
+# Good results in a row that turn a red sensor green again
+RECOVER_THRESHOLD = 2
+
+# Changes between consecutive raw results within FLAP_WINDOW results that mark a sensor flapping
+FLAP_THRESHOLD = 6
+FLAP_WINDOW = 20
+
+# Errors that already stand for a sustained failure and skip the fail window
+DECISIVE_ERRORS = ("silent",)
+
+# Sensor fields read by ``settings``, in order, with their defaults
+DEBOUNCE_FIELDS = ("fail_threshold", "fail_window", "recover_threshold", "flap_threshold")
+DEFAULTS = (FAIL_THRESHOLD, FAIL_WINDOW, RECOVER_THRESHOLD, FLAP_THRESHOLD)
+
+
+def settings(sensor):
+    """Return the sensor's ``(fail_threshold, fail_window, recover_threshold, flap_threshold)``."""
+    values = [sensor.get(field) for field in DEBOUNCE_FIELDS]
+    fail_threshold, fail_window, recover_threshold, flap_threshold = (
+        default if value is None else int(value) for value, default in zip(values, DEFAULTS)
+    )
+    fail_threshold = max(1, fail_threshold)
+    return fail_threshold, max(fail_window, fail_threshold), max(1, recover_threshold), max(0, flap_threshold)
+
+
+class Debouncer:
+    """Running counts over the newest results of one ``SensorState`` ring."""
+
+    __slots__ = ("fail_window", "flap_window", "failures", "flips", "streak", "flapping")
+
+    def __init__(self):
+        self.fail_window = None
+        self.flap_window = None
+        self.failures = 0  # failed results among the last fail_window
+        self.flips = 0  # changes between consecutive results among the last flap_window
+        self.streak = 0  # good results in a row, newest last
+        self.flapping = False
+
+    def _recount(self, history, fail_window, flap_window):
+        statuses = history.statuses()
+        self.fail_window = fail_window
+        self.flap_window = flap_window
+        self.failures = sum(1 for entry in statuses[-fail_window:] if entry)
+        recent = statuses[-flap_window:]
+        self.flips = sum(1 for a, b in zip(recent, recent[1:]) if a != b)
+        self.streak = 0
+        for entry in reversed(statuses):
+            if entry:
+                break
+            self.streak += 1
+
+    def _slide(self, history, entry):
+        """Move both windows on by ``entry``, which is about to be appended to ``history``."""
+        count = len(history)
+        if count >= self.fail_window:
+            self.failures -= history.recent(self.fail_window - 1)
+        self.failures += entry
+        if count:
+            self.flips += entry != history.recent(0)
+            if count >= self.flap_window:
+                self.flips -= history.recent(self.flap_window - 1) != history.recent(self.flap_window - 2)
+        self.streak = 0 if entry else self.streak + 1
+
+    def update(self, history, entry, status, sensor_settings, decisive=False):
+        """Feed one 0/1 result, before it is appended to ``history``; return the sensor's new status.
+
+        A ``decisive`` failure turns the sensor red without waiting for the fail window.
+        """
+        fail_threshold, fail_window, recover_threshold, flap_threshold = sensor_settings
+        fail_window = min(fail_window, history.capacity)
+        flap_window = min(FLAP_WINDOW, history.capacity)
+        if (fail_window, flap_window) != (self.fail_window, self.flap_window):
+            self._recount(history, fail_window, flap_window)
+        self._slide(history, entry)
+
+        if self.flapping:
+            self.flapping = bool(flap_threshold) and self.flips > flap_threshold // 2
+        elif flap_threshold:
+            self.flapping = self.flips >= flap_threshold
+        if self.flapping:
+            return "flapping"
+        if decisive and entry:
+            return "red"
+        if status in ("red", "flapping"):
+            return "green" if self.streak >= recover_threshold else "red"
+        if self.failures >= fail_threshold:
+            return "red"
+        if entry == 0:
+            return "green"
+        # Failing, but not often enough yet to count
+        return status
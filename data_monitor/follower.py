@@ -0,0 +1,142 @@
+"""Keep a process's station state current from what other processes write.
+
+In the split deployment (see monitor.py and wsgi.py) the probe engine runs
+in its own daemon and the web app in any number of WSGI workers. They
+share nothing but the database, so two things are read back from it:
+
+* probe results: the monitor's writer appends them to ``probe_results``;
+  a web worker tails the table by id and replays each row into its
+  ``StateCache``, which keeps statuses, history and the overview counters
+  moving as if the probes ran in-process. They arrive one flush of the
+  writer plus one poll of the follower after the probe. The rows are raw
+  results, so the worker debounces them itself (see debounce.py) and,
+  with the same settings, reaches the same statuses as the monitor.
+* station changes: every process that edits the inventory appends the
+  station's name to ``station_changes``; the others tail it and reload
+  that station, so a sensor added in one web worker is probed by the
+  monitor and shown by every other worker.
+
+Both start from the marks taken just before the state was loaded (see
+``state.ensure_loaded``), so nothing written after the load is missed.
+"""
+import logging
+import os
+import threading
+import time
+
+from db import open_connection
+
+# Seconds between polls of the database for new rows
+FOLLOW_INTERVAL = 1.0
+
+# Probe results replayed per poll; a worker further behind catches up over several polls
+FOLLOW_BATCH = 10000
+
+# Seconds station changes are kept; ``prune_station_changes`` deletes older ones
+CHANGE_RETENTION = 7 * 86400
+
+
+def create_change_table(cursor):
+    """Create the station_changes log."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS station_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        station TEXT NOT NULL,
+        previous_name TEXT,
+        ts REAL NOT NULL,
+        pid INTEGER
+    )
+    ''')
+
+
+def record_station_change(conn, station_name, previous_name=None):
+    """Log that ``station_name`` (formerly ``previous_name``) changed in the database, and commit."""
+    with conn:
+        conn.execute(
+            "INSERT INTO station_changes (station, previous_name, ts, pid) VALUES (?, ?, ?, ?)",
+            (station_name, previous_name, time.time(), os.getpid()),
+        )
+
+
+def prune_station_changes(conn, older_than):
+    """Delete station changes logged before the ``older_than`` Unix timestamp."""
+    with conn:
+        return conn.execute("DELETE FROM station_changes WHERE ts < ?", (older_than,)).rowcount
+
+
+def current_marks(conn):
+    """Return ``(last probe_results id, last station_changes id)``, 0 for an empty table."""
+    last_result = conn.execute("SELECT MAX(id) FROM probe_results").fetchone()[0] or 0
+    last_change = conn.execute("SELECT MAX(id) FROM station_changes").fetchone()[0] or 0
+    if conn.in_transaction:
+        conn.rollback()
+    return last_result, last_change
+
+
+class ResultFollower(threading.Thread):
+    """Background thread that replays other processes' writes into a ``StateCache``.
+
+    With ``results=False`` only station changes are followed, which is what
+    the monitor daemon needs: it produces the results itself.
+    """
+
+    def __init__(self, cache, db_path, marks, results=True, interval=FOLLOW_INTERVAL):
+        super().__init__(name="result-follower", daemon=True)
+        self.cache = cache
+        self.db_path = db_path
+        self.last_result, self.last_change = marks
+        self.results = results
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def follow_changes(self, conn):
+        rows = conn.execute(
+            "SELECT id, station, previous_name, pid FROM station_changes WHERE id > ? ORDER BY id",
+            (self.last_change,),
+        ).fetchall()
+        for change_id, station_name, previous_name, pid in rows:
+            self.last_change = change_id
+            # This process already reloaded the stations it changed itself
+            if pid != os.getpid():
+                self.cache.invalidate_station(station_name, previous_name=previous_name)
+        return len(rows)
+
+    def follow_results(self, conn):
+        rows = conn.execute(
+            "SELECT id, sensor_id, ts, status, latency_ms, error, bytes_received FROM probe_results "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (self.last_result, FOLLOW_BATCH),
+        ).fetchall()
+        for _, sensor_id, ts, status, latency_ms, error, bytes_received in rows:
+            self.cache.apply_result(sensor_id, status, ts, latency_ms, error, bytes_received)
+        if rows:
+            self.last_result = rows[-1][0]
+        return len(rows)
+
+    def run_once(self, conn):
+        try:
+            # Changes first, so results for a sensor added since the last poll find it
+            count = self.follow_changes(conn)
+            if self.results:
+                count += self.follow_results(conn)
+            return count
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def run(self):
+        conn = open_connection(self.db_path)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if self.run_once(conn) >= FOLLOW_BATCH:
+                        continue
+                except Exception as e:
+                    logging.exception(f"Following the monitor's writes failed: {e}")
+                self._stopping.wait(self.interval)
+        finally:
+            conn.close()
@@ -0,0 +1,171 @@
+"""Time-stamped probe history stored in the ``probe_results`` table.
+
+One row per probe: ``(id, sensor_id, ts, status, latency_ms, first_byte_ms,
+bytes_received, error)`` where ``ts`` is a Unix timestamp, ``status``
+follows the history convention used everywhere else (0 = OK, 1 = not OK),
+``latency_ms`` is the TCP connect time, ``first_byte_ms`` the wait for
+data after connecting and ``error`` why a failed probe failed (see
+``probe.connect_error``). Rows are the raw results, before debouncing.
+``id`` is AUTOINCREMENT, so it is never reused after deletes and readers
+that tail the table (rollups.py, follower.py) can resume after the last
+id they saw.
+Reads go through the ``(sensor_id, ts)`` index so their cost depends on
+the requested range, not on how much history has been kept.
+"""
+import json
+import time
+
+HISTORY_LIMIT = 100
+
+# Rows deleted per transaction by prune_probe_results
+PRUNE_BATCH = 20000
+
+
+def add_missing_columns(cursor, table, columns):
+    """ALTER ``table`` to add any of ``{name: type}`` it does not have yet."""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+
+def create_history_table(cursor):
+    """Create the probe_results table and its (sensor_id, ts) index."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS probe_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sensor_id INTEGER NOT NULL,
+        ts REAL NOT NULL,
+        status INTEGER NOT NULL,
+        latency_ms REAL,
+        first_byte_ms REAL,
+        bytes_received INTEGER,
+        error TEXT,
+        FOREIGN KEY (sensor_id) REFERENCES sensors (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_probe_results_sensor_ts
+    ON probe_results (sensor_id, ts)
+    ''')
+
+
+def migrate_history_blobs(cursor, interval=60):
+    """Move JSON lists from the legacy ``sensors.history`` column into probe_results.
+
+    The old lists carry no timestamps, so entries are spread backwards from
+    now, ``interval`` seconds apart. The column is cleared afterwards so the
+    migration only runs once per sensor.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(sensors)")]
+    if "history" not in columns:
+        return 0
+
+    cursor.execute("SELECT id, history FROM sensors WHERE history IS NOT NULL AND history NOT IN ('', '[]')")
+    now = time.time()
+    rows = []
+    for sensor_id, blob in cursor.fetchall():
+        try:
+            entries = json.loads(blob)
+        except ValueError:
+            continue
+        count = len(entries)
+        rows.extend(
+            (sensor_id, now - (count - i) * interval, int(entry), None, None, None, None)
+            for i, entry in enumerate(entries)
+        )
+
+    record_probe_results(cursor, rows)
+    cursor.execute("UPDATE sensors SET history = NULL WHERE history IS NOT NULL")
+    return len(rows)
+
+
+def record_probe_results(conn, rows):
+    """Insert a batch of ``(sensor_id, ts, status, latency_ms, first_byte_ms, bytes_received, error)`` rows.
+
+    The caller owns the transaction and commits it.
+    """
+    if rows:
+        conn.executemany(
+            "INSERT INTO probe_results (sensor_id, ts, status, latency_ms, first_byte_ms, bytes_received, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+def get_probe_history(conn, sensor_id, start=None, end=None, limit=None):
+    """Return probe rows for one sensor with ``start <= ts < end``, oldest first.
+
+    ``start`` and ``end`` are Unix timestamps; ``None`` leaves that side open.
+    With ``limit``, only the newest ``limit`` rows of the range are returned.
+    """
+    query = ("SELECT ts, status, latency_ms, first_byte_ms, bytes_received, error "
+             "FROM probe_results WHERE sensor_id = ?")
+    params = [sensor_id]
+    if start is not None:
+        query += " AND ts >= ?"
+        params.append(start)
+    if end is not None:
+        query += " AND ts < ?"
+        params.append(end)
+
+    if limit is not None:
+        query += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        rows = conn.execute(query, params).fetchall()[::-1]
+    else:
+        query += " ORDER BY ts"
+        rows = conn.execute(query, params).fetchall()
+
+    return [
+        {"ts": ts, "status": status, "latency_ms": latency_ms, "first_byte_ms": first_byte_ms,
+         "bytes_received": bytes_received, "error": error}
+        for ts, status, latency_ms, first_byte_ms, bytes_received, error in rows
+    ]
+
+
+def get_recent_history(conn, sensor_id, limit=HISTORY_LIMIT):
+    """Return the last ``limit`` 0/1 status entries for a sensor, oldest first."""
+    rows = conn.execute(
+        "SELECT status FROM probe_results WHERE sensor_id = ? ORDER BY ts DESC LIMIT ?",
+        (sensor_id, limit),
+    ).fetchall()
+    return [row[0] for row in reversed(rows)]
+
+
+def _id_before(conn, ts, low, high):
+    """Return the highest id in ``low .. high`` whose row is older than ``ts``, or 0, by bisecting ids.
+
+    Ids grow with probe time except for rows delivered late, so rows up to
+    the returned id are older than ``ts`` give or take those.
+    """
+    found = 0
+    while low <= high:
+        middle = (low + high) // 2
+        row = conn.execute("SELECT id, ts FROM probe_results WHERE id >= ? ORDER BY id LIMIT 1", (middle,)).fetchone()
+        if row is None or row[0] > high or row[1] >= ts:
+            high = middle - 1
+        else:
+            found = row[0]
+            low = row[0] + 1
+    return found
+
+
+def prune_probe_results(conn, older_than, up_to_id=None, batch=PRUNE_BATCH):
+    """Delete probe rows from before the ``older_than`` Unix timestamp; return how many.
+
+    With ``up_to_id`` no row with a higher id is deleted. Rows go in id
+    ranges of ``batch`` rows, each committed on its own, so the result
+    writer is never held up for long and no full scan of the table is made.
+    """
+    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM probe_results").fetchone()
+    if low is None:
+        return 0
+    last = _id_before(conn, older_than, low, high if up_to_id is None else min(high, up_to_id))
+    deleted = 0
+    while low <= last:
+        with conn:
+            deleted += conn.execute("DELETE FROM probe_results WHERE id >= ? AND id <= ?",
+                                    (low, min(low + batch - 1, last))).rowcount
+        low += batch
+    return deleted
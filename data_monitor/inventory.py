@@ -0,0 +1,278 @@
+"""Bulk import and export of the station inventory.
+
+The interchange format is one record per sensor with the fields in
+``FIELDS``: ``station``, ``platform``, ``sensor``, ``ip`` and ``port``,
+plus the optional per-sensor probe settings. It is read and written as
+JSON Lines or as CSV with a header row.
+
+An import runs in a single transaction with upsert semantics: stations and
+platforms are created as needed, and sensors are matched on
+(station, platform, sensor name). New sensors are inserted and sensors
+whose address or settings changed are updated in place, so they keep their
+id, status and probe history. With ``sync=True`` the stations named in the
+file are made to match it exactly, which deletes the platforms and sensors
+the file no longer lists. Stations that are not in the file are never
+touched.
+
+    python inventory.py import fleet.csv [--sync]
+    python inventory.py export [--format csv] > fleet.csv
+"""
+import csv
+import io
+import json
+
+# Columns of the interchange format, in export order
+REQUIRED_FIELDS = ("station", "platform", "sensor", "ip", "port")
+SETTING_FIELDS = ("connect_timeout", "first_byte_timeout", "mode", "silence_window",
+                  "fail_threshold", "fail_window", "recover_threshold", "flap_threshold", "interval")
+FIELDS = REQUIRED_FIELDS + SETTING_FIELDS
+
+# Settings that are whole numbers of probe results (see debounce.py)
+COUNT_FIELDS = ("fail_threshold", "fail_window", "recover_threshold", "flap_threshold")
+
+FORMATS = ("jsonl", "csv")
+
+
+def _clean(record, line):
+    """Validate one raw record and return it with typed values."""
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"line {line}: missing {', '.join(missing)}")
+    try:
+        port = int(record["port"])
+    except (TypeError, ValueError):
+        raise ValueError(f"line {line}: port {record['port']!r} is not a number")
+    if not 0 < port < 65536:
+        raise ValueError(f"line {line}: port {port} out of range")
+
+    cleaned = {
+        "station": str(record["station"]).strip(),
+        "platform": str(record["platform"]).strip(),
+        "sensor": str(record["sensor"]).strip(),
+        "ip": str(record["ip"]).strip(),
+        "port": port,
+    }
+    for field in ("connect_timeout", "first_byte_timeout", "silence_window", "interval"):
+        value = record.get(field)
+        try:
+            cleaned[field] = None if value in (None, "") else float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"line {line}: {field} {value!r} is not a number")
+    if cleaned["interval"] is not None and cleaned["interval"] <= 0:
+        raise ValueError(f"line {line}: interval must be positive")
+    for field in COUNT_FIELDS:
+        value = record.get(field)
+        try:
+            cleaned[field] = None if value in (None, "") else int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"line {line}: {field} {value!r} is not a whole number")
+        if cleaned[field] is not None and cleaned[field] < 0:
+            raise ValueError(f"line {line}: {field} must not be negative")
+    mode = record.get("mode") or None
+    if mode not in (None, "poll", "stream"):
+        raise ValueError(f"line {line}: mode must be 'poll' or 'stream', not {mode!r}")
+    cleaned["mode"] = mode
+    return cleaned
+
+
+def read_jsonl(lines):
+    """Yield validated records from an iterable of JSON Lines text lines."""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {line_number}: {e}")
+        if not isinstance(record, dict):
+            raise ValueError(f"line {line_number}: expected a JSON object")
+        yield _clean(record, line_number)
+
+
+def read_csv(lines):
+    """Yield validated records from an iterable of CSV text lines with a header row."""
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield _clean(record, reader.line_num)
+
+
+def read_records(lines, fmt):
+    if fmt == "jsonl":
+        return read_jsonl(lines)
+    if fmt == "csv":
+        return read_csv(lines)
+    raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def import_inventory(conn, records, sync=False):
+    """Upsert ``records`` in one transaction.
+
+    Returns ``(counts, stations)``: the number of rows added, updated,
+    unchanged and deleted, and the set of station names touched.
+    """
+    counts = dict.fromkeys((
+        "stations_added", "platforms_added", "sensors_added", "sensors_updated", "sensors_unchanged",
+        "platforms_deleted", "sensors_deleted",
+    ), 0)
+
+    # Last record wins when the file repeats a sensor
+    wanted = {}
+    for record in records:
+        wanted[(record["station"], record["platform"], record["sensor"])] = record
+    station_names = {station for station, _, _ in wanted}
+
+    with conn:
+        station_ids = dict(conn.execute("SELECT name, id FROM stations"))
+        new_stations = sorted(station_names - station_ids.keys())
+        conn.executemany("INSERT INTO stations (name) VALUES (?)", [(name,) for name in new_stations])
+        counts["stations_added"] = len(new_stations)
+        if new_stations:
+            station_ids = dict(conn.execute("SELECT name, id FROM stations"))
+
+        def load_platforms():
+            return {
+                (station_name, platform_name): platform_id
+                for station_name, platform_name, platform_id in conn.execute(
+                    "SELECT s.name, p.name, p.id FROM platforms p JOIN stations s ON s.id = p.station_id"
+                )
+                if station_name in station_names
+            }
+
+        platform_ids = load_platforms()
+        new_platforms = sorted({(station, platform) for station, platform, _ in wanted} - platform_ids.keys())
+        conn.executemany(
+            "INSERT INTO platforms (station_id, name) VALUES (?, ?)",
+            [(station_ids[station], platform) for station, platform in new_platforms],
+        )
+        counts["platforms_added"] = len(new_platforms)
+        if new_platforms:
+            platform_ids = load_platforms()
+        platform_keys = {platform_id: key for key, platform_id in platform_ids.items()}
+
+        existing = {}
+        columns = ", ".join(SETTING_FIELDS)
+        for row in conn.execute(f"SELECT id, platform_id, sensor_name, ip, port, {columns} FROM sensors"):
+            platform_key = platform_keys.get(row[1])
+            if platform_key is not None:
+                existing[platform_key + (row[2],)] = row
+
+        inserts, updates = [], []
+        for key, record in wanted.items():
+            values = (record["ip"], record["port"]) + tuple(record[field] for field in SETTING_FIELDS)
+            row = existing.get(key)
+            if row is None:
+                inserts.append((platform_ids[key[:2]], record["sensor"]) + values)
+            elif tuple(row[3:]) != values:
+                updates.append(values + (row[0],))
+            else:
+                counts["sensors_unchanged"] += 1
+        conn.executemany(
+            f"INSERT INTO sensors (platform_id, sensor_name, ip, port, {columns}, status) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in SETTING_FIELDS)}, 'unknown')",
+            inserts,
+        )
+        conn.executemany(
+            f"UPDATE sensors SET ip = ?, port = ?, {', '.join(f'{field} = ?' for field in SETTING_FIELDS)} "
+            "WHERE id = ?",
+            updates,
+        )
+        counts["sensors_added"] = len(inserts)
+        counts["sensors_updated"] = len(updates)
+
+        if sync:
+            stale_sensors = [(row[0],) for key, row in existing.items() if key not in wanted]
+            wanted_platforms = {key[:2] for key in wanted}
+            stale_platforms = [(platform_id,) for key, platform_id in platform_ids.items() if key not in wanted_platforms]
+            conn.executemany("DELETE FROM probe_results WHERE sensor_id = ?", stale_sensors)
+            conn.executemany("DELETE FROM sensors WHERE id = ?", stale_sensors)
+            conn.executemany(
+                "DELETE FROM probe_results WHERE sensor_id IN (SELECT id FROM sensors WHERE platform_id = ?)",
+                stale_platforms,
+            )
+            conn.executemany("DELETE FROM sensors WHERE platform_id = ?", stale_platforms)
+            conn.executemany("DELETE FROM platforms WHERE id = ?", stale_platforms)
+            counts["sensors_deleted"] = len(stale_sensors)
+            counts["platforms_deleted"] = len(stale_platforms)
+
+    return counts, station_names
+
+
+def export_inventory(conn):
+    """Yield one record per sensor, in station, platform, sensor order."""
+    cursor = conn.execute(f'''
+    SELECT s.name, p.name, se.sensor_name, se.ip, se.port, {', '.join(f'se.{field}' for field in SETTING_FIELDS)}
+    FROM stations s
+    JOIN platforms p ON p.station_id = s.id
+    JOIN sensors se ON se.platform_id = p.id
+    ORDER BY s.id, p.id, se.id
+    ''')
+    for row in cursor:
+        yield dict(zip(FIELDS, row))
+
+
+def write_jsonl(records):
+    """Yield JSON Lines text, one line per record."""
+    for record in records:
+        yield json.dumps({key: value for key, value in record.items() if value is not None}) + "\n"
+
+
+def write_csv(records):
+    """Yield CSV text: a header row, then one line per record."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_records(records, fmt):
+    if fmt == "jsonl":
+        return write_jsonl(records)
+    if fmt == "csv":
+        return write_csv(records)
+    raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def format_of(filename, default="jsonl"):
+    """Guess the format from a file name's extension."""
+    if filename and filename.lower().endswith(".csv"):
+        return "csv"
+    return default
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from db import get_connection
+    from follower import record_station_change
+    from station import create_tables
+
+    parser = argparse.ArgumentParser(description="Import or export the station inventory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--sync", action="store_true", help="delete what the file no longer lists")
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    args = parser.parse_args()
+
+    create_tables()
+    conn = get_connection()
+    if args.command == "import":
+        with open(args.file, newline="", encoding="utf-8") as f:
+            counts, station_names = import_inventory(conn, read_records(f, args.format or format_of(args.file)),
+                                                     sync=args.sync)
+        # A running monitor and web app pick the changes up from this log
+        for name in station_names:
+            record_station_change(conn, name)
+        print(json.dumps(counts))
+    else:
+        sys.stdout.writelines(write_records(export_inventory(conn), args.format))
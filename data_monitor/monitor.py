@@ -0,0 +1,110 @@
+"""Standalone monitor daemon: probes the fleet and writes the results, serves no pages.
+
+This is the probing half of the split deployment. The web half is any
+number of WSGI workers serving ``wsgi:app`` (see wsgi.py), which read the
+results back from the shared database. Each side can then be sized and
+restarted on its own, and page rendering under load cannot delay probes,
+nor probes slow down pages:
+
+    python monitor.py [--processes N] [--interval 60] [--metrics-port 9100]
+    gunicorn -w 4 --threads 8 wsgi:app
+
+Inventory edits made through the web app or ``inventory.py`` reach the
+running probe engine through the ``station_changes`` log (see
+follower.py). SIGTERM or SIGINT stops the probes and flushes the
+results still queued before exiting. Alerts are sent from here too, when
+sinks are configured (see alerts.py).
+
+``--metrics-port`` serves the probe engine's and writer's ``/metrics``,
+which only this process can see.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+import station
+from alerts import start_alerting
+from follower import CHANGE_RETENTION, prune_station_changes
+from probe import CHECK_INTERVAL
+from state import ensure_loaded, follow_monitor, state
+
+# Seconds between prunes of the station_changes log
+PRUNE_INTERVAL = 3600
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers every GET with the Prometheus text exposition."""
+
+    def do_GET(self):
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"metrics: {format % args}")
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    """Serve /metrics on a background thread; return the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def run(processes=station.MONITOR_PROCESSES, interval=CHECK_INTERVAL, metrics_port=None, stop=None):
+    """Probe until ``stop`` is set, then shut down cleanly."""
+    stop = stop or threading.Event()
+    ensure_loaded()
+    # Before probing starts, so no status change goes unalerted
+    alerting = start_alerting(state.locate)
+    state.monitor = station.start_monitoring(processes, interval)
+    # Only inventory changes: this process produces the results itself
+    follower = follow_monitor(results=False)
+    server = serve_metrics(metrics_port) if metrics_port else None
+    logging.info(f"Monitoring {len(state.station_names())} stations with {processes} process(es)")
+
+    try:
+        while not stop.wait(PRUNE_INTERVAL):
+            try:
+                prune_station_changes(station.get_db_connection(), time.time() - CHANGE_RETENTION)
+            except Exception as e:
+                logging.exception(f"Failed to prune station changes: {e}")
+    finally:
+        logging.info("Stopping monitor")
+        if server is not None:
+            server.shutdown()
+        follower.stop(5)
+        state.monitor.stop(5)
+        if station.result_writer is not None:
+            station.result_writer.stop(10)
+        if station.rollup_worker is not None:
+            station.rollup_worker.stop(5)
+        if alerting is not None:
+            alerting.stop(10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=station.MONITOR_PROCESSES,
+                        help="probe processes; more than one shards the stations")
+    parser.add_argument("--interval", type=float, default=CHECK_INTERVAL,
+                        help="seconds between probes of a healthy sensor, backing off to 3x this")
+    parser.add_argument("--metrics-port", type=int, help="serve /metrics on this port")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    run(args.processes, args.interval, args.metrics_port, stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+import weakref
+
+import debounce
+import metrics
+from scheduler import ProbeScheduler
+from sensor_state import HISTORY_CAPACITY, SensorState
+
+# Upper bound on simultaneously open probe sockets across all stations
+MAX_CONCURRENT_PROBES = 500
+
+# Seconds allowed for the TCP connect. A powered-down or unplugged NPort
+# refuses or drops the connection well within this.
+CONNECT_TIMEOUT = 5
+
+# Seconds to wait for the first chunk of data once connected. Serial devices
+# behind the NPort may only report every few tens of seconds.
+FIRST_BYTE_TIMEOUT = 60
+
+# Bytes read to decide that data is flowing
+READ_SIZE = 1024
+
+# Seconds between two probes of a healthy sensor (see scheduler.py for back-off)
+CHECK_INTERVAL = 60
+
+# Seconds between checks of the stations dict for added or removed sensors
+SYNC_INTERVAL = 5
+
+# Sensor fields that decide how a sensor is probed. A reloaded sensor whose
+# fields all match its previous dict is the same sensor to the monitor.
+PROBE_FIELDS = ("ip", "port", "connect_timeout", "first_byte_timeout", "mode", "silence_window", "interval")
+
+# Sensor dicts are guarded by a fixed set of striped locks instead of one
+# global lock, so results for different sensors rarely wait on each other
+# or on readers copying another part of the tree.
+LOCK_STRIPES = 64
+_sensor_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+# Callables run as listener(sensor, previous_status) after every recorded probe
+result_listeners = []
+
+# Probe instrumentation, exported on /metrics. Latencies are labelled by
+# nothing finer than the phase so the series count does not grow with the fleet.
+PROBE_CONNECT_SECONDS = metrics.Histogram(
+    "nport_probe_connect_seconds", "TCP connect time of probes that connected"
+)
+PROBE_FIRST_BYTE_SECONDS = metrics.Histogram(
+    "nport_probe_first_byte_seconds", "Time from connect to the first byte of probes that received data"
+)
+PROBE_LAG_SECONDS = metrics.Histogram(
+    "nport_probe_schedule_lag_seconds", "Time from a probe falling due to it getting a connection slot"
+)
+PROBES_TOTAL = metrics.Counter("nport_probes_total", "Completed probes by resulting status", ("status",))
+
+_engines = weakref.WeakSet()
+
+
+def sensor_lock(sensor):
+    """Return the lock guarding one sensor's status, history and live fields.
+
+    Striped by database id, so the old and the reloaded dict of the same
+    sensor (see ``StateCache.invalidate_station``) share a lock.
+    """
+    key = sensor.get("id")
+    if key is None:
+        key = id(sensor) >> 4  # id() is 16-byte aligned in CPython
+    return _sensor_locks[key % LOCK_STRIPES]
+
+
+def _collect_engine_metrics():
+    engines = [engine for engine in list(_engines) if engine._scheduler is not None]
+    yield ("nport_probe_queue_depth", "gauge", "Due probes waiting for a connection slot", (),
+           [((), sum(engine._waiting for engine in engines))])
+    yield ("nport_probe_in_flight", "gauge", "Probe connections currently open", (),
+           [((), sum(engine._active for engine in engines))])
+    yield ("nport_probe_scheduled_sensors", "gauge", "Polled sensors in the probe schedule", (),
+           [((), sum(len(engine._scheduler) for engine in engines))])
+    yield ("nport_streams_open", "gauge", "Streaming sensors with a running stream", (),
+           [((), sum(len(engine._streams) for engine in engines))])
+
+
+metrics.register_collector(_collect_engine_metrics)
+
+
+def log_status_change(sensor, previous_status):
+    """Result listener that logs status changes; per-probe detail is only logged at DEBUG."""
+    status = sensor["status"]
+    if status == previous_status or (previous_status == "unknown" and status == "green"):
+        return
+    where = f"{sensor['sensor_name']} at {sensor['ip']}:{sensor['port']}"
+    if status == "red":
+        logging.warning(f"{where} is down ({sensor.get('last_error') or 'no data'})")
+    elif status == "flapping":
+        logging.warning(f"{where} is flapping")
+    else:
+        logging.info(f"{where} is up again")
+
+
+def connect_error(exc):
+    """Name the way a connect failed, for ``sensor["last_error"]`` and probe_results."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return "connect_timeout"
+    if isinstance(exc, ConnectionRefusedError):
+        return "refused"
+    return "unreachable"
+
+
+def record_result(sensor, status, history_entry, latency_ms=None, ts=None, error=None, bytes_received=None):
+    """Store the outcome of one probe on the in-memory sensor dict and return the sensor's status.
+
+    ``status`` is the probe's own verdict; the sensor's status only follows
+    it as ``debounce.py`` decides. ``error`` names why a failed probe
+    failed (see ``connect_error``); one in ``debounce.DECISIVE_ERRORS``
+    turns the sensor red without waiting for the fail window.
+
+    ``bytes_received``, given for results replayed from another process,
+    sets a streamed sensor's ``bytes_per_sec`` over the time since its
+    previous result. The stream itself updates it more often.
+    """
+    ts = time.time() if ts is None else ts
+    with sensor_lock(sensor):
+        history = sensor["history"]
+        if not isinstance(history, SensorState):
+            history = sensor["history"] = SensorState(HISTORY_CAPACITY, history)
+        if history.debouncer is None:
+            history.debouncer = debounce.Debouncer()
+        previous_status = sensor["status"]
+        status = history.debouncer.update(
+            history, history_entry, previous_status, debounce.settings(sensor), error in debounce.DECISIVE_ERRORS
+        )
+        changes = {"status": status, "last_error": error}
+        if bytes_received is not None and sensor.get("mode") == "stream":
+            previous_ts = history.last_ts()
+            if previous_ts is not None and ts > previous_ts:
+                changes["bytes_per_sec"] = bytes_received / (ts - previous_ts)
+        history.append(history_entry, ts, latency_ms)
+        # One dict update, so readers copying the sensor without its lock
+        # (StateCache.snapshot_station) never see a status without its error
+        sensor.update(changes)
+
+    for listener in result_listeners:
+        try:
+            listener(sensor, previous_status)
+        except Exception as e:
+            logging.exception(f"Result listener failed for {sensor['sensor_name']}: {e}")
+    return status
+
+
+# Outcome of one probe. ``connect_ms`` and ``first_byte_ms`` are None when
+# that phase never completed; ``first_byte_ms`` is measured from the end of
+# the connect. ``error`` says why a failed probe failed and is None otherwise.
+ProbeResult = collections.namedtuple(
+    "ProbeResult", ["status", "history_entry", "connect_ms", "first_byte_ms", "bytes_received", "error"]
+)
+
+
+def _failed(error, connect_ms=None):
+    return ProbeResult("red", 1, connect_ms, None, 0, error)
+
+
+def probe_timeouts(sensor, connect_timeout=CONNECT_TIMEOUT, first_byte_timeout=FIRST_BYTE_TIMEOUT):
+    """Return the sensor's ``(connect, first byte)`` timeouts, falling back to the given defaults.
+
+    The per-sensor values come from the database, already resolved against
+    the platform's settings by the station loader.
+    """
+    return (
+        sensor.get("connect_timeout") or connect_timeout,
+        sensor.get("first_byte_timeout") or first_byte_timeout,
+    )
+
+
+async def probe_sensor(sensor, connect_timeout=CONNECT_TIMEOUT, first_byte_timeout=FIRST_BYTE_TIMEOUT):
+    """Check if data is flowing on the sensor's IP and port.
+
+    Returns a ``ProbeResult``: status ``"green"`` (history entry 0) when at
+    least one byte arrived, ``"red"`` (1) otherwise. A failure's ``error``
+    tells a refused or timed-out connect from a port that accepted but sent
+    nothing (``no_data``) or hung up (``closed``).
+    """
+    ip = sensor["ip"]
+    port = int(sensor["port"])
+    connect_timeout, first_byte_timeout = probe_timeouts(sensor, connect_timeout, first_byte_timeout)
+    logging.debug(f"Checking {sensor['sensor_name']} at {ip}:{port}")
+
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), connect_timeout)
+    except asyncio.TimeoutError as e:
+        logging.debug(f"Connect timeout on {sensor['sensor_name']} at {ip}:{port}")
+        return _failed(connect_error(e))
+    except OSError as e:
+        logging.debug(f"Connection error for {sensor['sensor_name']} at {ip}:{port}: {e}")
+        return _failed(connect_error(e))
+    connected = time.perf_counter()
+    connect_ms = (connected - started) * 1000
+
+    try:
+        data = await asyncio.wait_for(reader.read(READ_SIZE), first_byte_timeout)
+        if data:
+            # Data received, sensor is functioning properly
+            return ProbeResult("green", 0, connect_ms, (time.perf_counter() - connected) * 1000, len(data), None)
+        return _failed("closed", connect_ms)  # Peer closed without sending anything
+    except asyncio.TimeoutError:
+        logging.debug(f"Timeout on {sensor['sensor_name']} at {ip}:{port}")
+        return _failed("no_data", connect_ms)
+    except OSError as e:
+        logging.debug(f"Read error for {sensor['sensor_name']} at {ip}:{port}: {e}")
+        return _failed("read_error", connect_ms)
+    finally:
+        writer.close()
+
+
+class ProbeEngine:
+    """Probe every sensor of every station from a single event loop.
+
+    A semaphore shared by all stations caps the number of sockets that are
+    open at the same time, so the fleet size no longer dictates the number
+    of OS threads or file descriptors in use.
+
+    ``writer``, when given, is a ``writer.ResultWriter``; every probe of a
+    sensor that has a database id is pushed to it as soon as it completes.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_PROBES, connect_timeout=CONNECT_TIMEOUT,
+                 first_byte_timeout=FIRST_BYTE_TIMEOUT, writer=None):
+        self.max_concurrent = max_concurrent
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.writer = writer
+        self._semaphore = None
+        self._scheduler = None
+        self._wakeup = None
+        self._streams = {}  # id(sensor dict) -> task running its SensorStream
+        self._waiting = 0  # due probes waiting on the semaphore
+        self._active = 0  # probes holding a connection slot
+        _engines.add(self)
+
+    async def _check(self, sensor, entry=None):
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._active += 1
+        if entry is not None:
+            PROBE_LAG_SECONDS.observe(max(0.0, time.monotonic() - entry.due))
+        try:
+            result = await probe_sensor(sensor, self.connect_timeout, self.first_byte_timeout)
+        except Exception as e:
+            logging.exception(f"Unexpected error for {sensor['sensor_name']} at {sensor['ip']}:{sensor['port']}: {e}")
+            result = _failed("error")
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+        PROBES_TOTAL.inc(result.status)
+        if result.connect_ms is not None:
+            PROBE_CONNECT_SECONDS.observe(result.connect_ms / 1000)
+        if result.first_byte_ms is not None:
+            PROBE_FIRST_BYTE_SECONDS.observe(result.first_byte_ms / 1000)
+        if entry is not None and entry.removed:
+            # Removed while the probe was in flight; the sensor may be gone from the database
+            return result.status
+        ts = time.time()
+        status = record_result(sensor, result.status, result.history_entry, result.connect_ms, ts, result.error)
+        if self.writer is not None and sensor.get("id") is not None:
+            await self.writer.submit_async((
+                sensor["id"], ts, result.history_entry,
+                result.connect_ms, result.first_byte_ms, result.bytes_received, result.error, status,
+            ))
+        # The scheduler retries on the probe's own verdict, which is what confirms a failure quickly
+        return result.status
+
+    async def run_cycle(self, stations):
+        """Probe every sensor once and return ``{"green": n, "red": n}``."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        checks = [
+            self._check(sensor)
+            for platforms in list(stations.values())
+            for sensors in list(platforms.values())
+            for sensor in list(sensors)
+        ]
+        counts = {"green": 0, "red": 0}
+        for status in await asyncio.gather(*checks):
+            counts[status] += 1
+        return counts
+
+    async def _run_scheduled(self, entry):
+        status = await self._check(entry.sensor, entry)
+        self._scheduler.reschedule(entry, status == "green")
+        self._wakeup.set()  # the new due time may be earlier than the loop's current sleep
+
+    def _start_stream(self, sensor):
+        from streaming import SensorStream
+
+        stream = SensorStream(sensor, self.writer, self.connect_timeout)
+        self._streams[id(sensor)] = asyncio.ensure_future(stream.run())
+
+    def _sync_streams(self, sensors):
+        """Start a stream for each new streaming sensor and cancel those that went away."""
+        current = {id(sensor): sensor for sensor in sensors}
+        for key in [key for key in self._streams if key not in current]:
+            self._streams.pop(key).cancel()
+        for key, sensor in current.items():
+            if key not in self._streams:
+                self._start_stream(sensor)
+
+    def sync(self, stations):
+        """Make the probed set match every sensor in ``stations``."""
+        polled, streamed = [], []
+        for platforms in list(stations.values()):
+            for sensors in list(platforms.values()):
+                for sensor in list(sensors):
+                    (streamed if sensor.get("mode") == "stream" else polled).append(sensor)
+        self._scheduler.sync(polled)
+        self._sync_streams(streamed)
+
+    def add_sensor(self, sensor):
+        """Start probing one sensor right away. Must be called on the engine's event loop."""
+        if sensor.get("mode") == "stream":
+            if id(sensor) not in self._streams:
+                self._start_stream(sensor)
+        else:
+            self._scheduler.add(sensor, immediate=True)
+            self._wakeup.set()
+
+    def remove_sensor(self, sensor):
+        """Stop probing one sensor. Must be called on the engine's event loop."""
+        task = self._streams.pop(id(sensor), None)
+        if task is not None:
+            task.cancel()
+        self._scheduler.remove(sensor)
+
+    async def run_forever(self, stations, scheduler=None, sync_interval=SYNC_INTERVAL):
+        """Probe each sensor whenever the scheduler says it is due, forever.
+
+        The set of sensors is re-read from ``stations`` every ``sync_interval``
+        seconds, so stations added to or removed from the dict are picked up
+        without a restart. With ``sync_interval=None`` it is read once, and
+        later changes must come through ``add_sensor`` / ``remove_sensor``
+        (see supervisor.py). Sensors in streaming mode get a long-lived
+        connection (see streaming.py) instead of scheduled probes.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._scheduler = ProbeScheduler() if scheduler is None else scheduler
+        self._wakeup = wakeup = asyncio.Event()
+        in_flight = set()
+        next_sync = 0
+
+        try:
+            while True:
+                now = time.monotonic()
+                if next_sync is not None and now >= next_sync:
+                    self.sync(stations)
+                    next_sync = None if sync_interval is None else now + sync_interval
+
+                for entry in self._scheduler.pop_due(now):
+                    task = asyncio.ensure_future(self._run_scheduled(entry))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+                wake_at = self._scheduler.next_due()
+                if next_sync is not None:
+                    wake_at = next_sync if wake_at is None else min(wake_at, next_sync)
+                wakeup.clear()
+                timeout = None if wake_at is None else max(0, wake_at - time.monotonic())
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(in_flight) + list(self._streams.values()):
+                task.cancel()
+            self._streams.clear()
+
+
+def run_monitor(stations, max_concurrent=MAX_CONCURRENT_PROBES, connect_timeout=CONNECT_TIMEOUT,
+                first_byte_timeout=FIRST_BYTE_TIMEOUT, interval=CHECK_INTERVAL, writer=None):
+    """Blocking entry point: run the probe engine on its own event loop."""
+    engine = ProbeEngine(max_concurrent=max_concurrent, connect_timeout=connect_timeout,
+                         first_byte_timeout=first_byte_timeout, writer=writer)
+    asyncio.run(engine.run_forever(stations, ProbeScheduler(base_interval=interval)))
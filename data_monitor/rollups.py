@@ -0,0 +1,297 @@
+"""Minute, hour and day rollups of probe_results for long-range charts.
+
+Raw probe rows are folded into three rollup tables, one per tier, holding
+per-sensor buckets of
+
+* ``samples`` and ``failures`` -- uptime is ``1 - failures / samples``;
+* ``flaps`` -- status changes, counted in the bucket of the row that changed;
+* ``latency_sum`` / ``latency_count`` -- for the mean connect latency.
+
+All of them are plain sums, so the ``RollupWorker`` thread folds in only
+the raw rows added since its last run (tracked by probe_results id in
+``rollup_progress``) and adds them onto existing buckets. Late rows and
+restarts are counted exactly once. Raw rows are kept forever unless
+``RAW_RETENTION_DAYS`` is set; the worker then deletes older ones
+(``history.prune_probe_results``), but only once they are rolled up, and
+ranges reaching past the retention are answered from the rollups.
+
+``get_history_series`` answers a ``from``/``to`` range from the coarsest
+table that still gives enough detail, and re-bins the result so that no
+more than ``max_points`` points are returned. NumPy is used for the
+re-binning when it is installed; it is imported on first use, as it would
+otherwise add about 100 ms to every start of the app.
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+from db import open_connection
+from history import prune_probe_results
+
+# Rollup tiers, finest first: (name, bucket width in seconds)
+TIERS = (("minute", 60), ("hour", 3600), ("day", 86400))
+RESOLUTIONS = ("raw",) + tuple(name for name, _ in TIERS)
+
+# Seconds between rollup runs
+ROLLUP_INTERVAL = 60
+
+# Seconds raw probe rows are kept; the default RAW_RETENTION_DAYS=0 keeps them forever
+RAW_RETENTION = float(os.environ.get('RAW_RETENTION_DAYS', '0')) * 86400
+
+# Seconds between prunes of expired raw rows
+PRUNE_INTERVAL = 3600
+
+# Raw rows folded in per transaction
+ROLLUP_BATCH = 50000
+
+# Upper bound on points returned by get_history_series
+MAX_POINTS = 500
+
+
+def create_rollup_tables(cursor):
+    """Create one rollup table per tier and the progress table."""
+    for tier, _ in TIERS:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS probe_rollups_{tier} (
+            sensor_id INTEGER NOT NULL,
+            bucket REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            flaps INTEGER NOT NULL,
+            latency_sum REAL NOT NULL,
+            latency_count INTEGER NOT NULL,
+            PRIMARY KEY (sensor_id, bucket)
+        ) WITHOUT ROWID
+        ''')
+    # last_rowid holds the last probe_results id folded in, equal to its rowid
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_progress (
+        source TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL
+    )
+    ''')
+
+
+def rollup_new_results(conn, last_status=None, batch=ROLLUP_BATCH):
+    """Fold up to ``batch`` raw rows not rolled up yet into every tier; return how many.
+
+    ``last_status`` maps sensor id to the last status seen by the previous
+    call, so a flap that spans two calls is still counted; it is updated
+    in place.
+    """
+    last_status = {} if last_status is None else last_status
+    with conn:
+        row = conn.execute("SELECT last_rowid FROM rollup_progress WHERE source = 'probe_results'").fetchone()
+        last_id = row[0] if row else 0
+        rows = conn.execute(
+            "SELECT id, sensor_id, ts, status, latency_ms FROM probe_results "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch),
+        ).fetchall()
+        if not rows:
+            return 0
+
+        buckets = [{} for _ in TIERS]
+        for _, sensor_id, ts, status, latency_ms in rows:
+            previous = last_status.get(sensor_id)
+            flap = 1 if previous is not None and previous != status else 0
+            last_status[sensor_id] = status
+            for (_, width), tier_buckets in zip(TIERS, buckets):
+                key = (sensor_id, ts // width * width)
+                bucket = tier_buckets.get(key)
+                if bucket is None:
+                    bucket = tier_buckets[key] = [0, 0, 0, 0.0, 0]
+                bucket[0] += 1
+                bucket[1] += status
+                bucket[2] += flap
+                if latency_ms is not None:
+                    bucket[3] += latency_ms
+                    bucket[4] += 1
+
+        for (tier, _), tier_buckets in zip(TIERS, buckets):
+            conn.executemany(
+                f"INSERT INTO probe_rollups_{tier} "
+                "(sensor_id, bucket, samples, failures, flaps, latency_sum, latency_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sensor_id, bucket) DO UPDATE SET "
+                "samples = samples + excluded.samples, "
+                "failures = failures + excluded.failures, "
+                "flaps = flaps + excluded.flaps, "
+                "latency_sum = latency_sum + excluded.latency_sum, "
+                "latency_count = latency_count + excluded.latency_count",
+                [(sensor_id, bucket, *values) for (sensor_id, bucket), values in tier_buckets.items()],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO rollup_progress (source, last_rowid) VALUES ('probe_results', ?)",
+            (rows[-1][0],),
+        )
+    return len(rows)
+
+
+def _point(ts, samples, failures, flaps, latency_sum, latency_count):
+    return {
+        "ts": ts,
+        "samples": samples,
+        "uptime": 1 - failures / samples if samples else None,
+        "flaps": flaps,
+        "latency_ms": latency_sum / latency_count if latency_count else None,
+    }
+
+
+_numpy = None
+
+
+def _load_numpy():
+    """Return the numpy module, or False when it is not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:  # optional; pure-Python re-binning is used instead
+            numpy = False
+        _numpy = numpy
+    return _numpy
+
+
+def _rebin(rows, start, end, max_points):
+    """Merge ``(bucket, samples, failures, flaps, latency_sum, latency_count)`` rows into at most ``max_points`` bins."""
+    width = (end - start) / max_points
+    np = _load_numpy()
+    if np:
+        data = np.array(rows, dtype=float)
+        bins = np.clip(((data[:, 0] - start) // width).astype(int), 0, max_points - 1)
+        used, index = np.unique(bins, return_inverse=True)
+        sums = [np.bincount(index, weights=data[:, column]) for column in range(1, 6)]
+        return [
+            _point(start + b * width, int(samples), failures, int(flaps), latency_sum, int(latency_count))
+            for b, samples, failures, flaps, latency_sum, latency_count in zip(used.tolist(), *(s.tolist() for s in sums))
+        ]
+
+    merged = {}
+    for bucket, *values in rows:
+        b = min(max(int((bucket - start) // width), 0), max_points - 1)
+        totals = merged.setdefault(b, [0, 0, 0, 0.0, 0])
+        for i, value in enumerate(values):
+            totals[i] += value
+    return [_point(start + b * width, *totals) for b, totals in sorted(merged.items())]
+
+
+def _raw_points(conn, sensor_id, start, end):
+    rows = conn.execute(
+        "SELECT ts, status, latency_ms FROM probe_results WHERE sensor_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+        (sensor_id, start, end),
+    ).fetchall()
+    points = []
+    previous = None
+    for ts, status, latency_ms in rows:
+        flaps = 1 if previous is not None and previous != status else 0
+        previous = status
+        points.append(_point(ts, 1, status, flaps, latency_ms or 0.0, 0 if latency_ms is None else 1))
+    return points
+
+
+def _choose_resolution(conn, sensor_id, start, end, max_points, retention=RAW_RETENTION):
+    span = end - start
+    # Raw rows older than the retention may have been pruned
+    if span <= max_points * TIERS[0][1] and not (retention and start < time.time() - retention):
+        count = conn.execute(
+            "SELECT COUNT(*) FROM probe_results WHERE sensor_id = ? AND ts >= ? AND ts < ?",
+            (sensor_id, start, end),
+        ).fetchone()[0]
+        if count <= max_points:
+            return "raw"
+    for tier, width in TIERS:
+        if span / width <= max_points:
+            return tier
+    return TIERS[-1][0]
+
+
+def get_history_series(conn, sensor_id, start, end, resolution=None, max_points=MAX_POINTS):
+    """Return ``(resolution, points)`` for one sensor with ``start <= ts < end``.
+
+    ``resolution`` is one of ``RESOLUTIONS``; ``None`` or ``"auto"`` picks
+    raw rows when there are few enough, otherwise the finest tier that fits
+    in ``max_points`` buckets. Each point is ``{"ts", "samples", "uptime",
+    "flaps", "latency_ms"}``, oldest first, and there are never more than
+    ``max_points`` of them.
+    """
+    if resolution in (None, "auto"):
+        resolution = _choose_resolution(conn, sensor_id, start, end, max_points)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}")
+
+    if resolution == "raw":
+        points = _raw_points(conn, sensor_id, start, end)
+        if len(points) <= max_points:
+            return resolution, points
+        rows = [
+            (p["ts"], 1, 1 - p["uptime"], p["flaps"], p["latency_ms"] or 0.0, 0 if p["latency_ms"] is None else 1)
+            for p in points
+        ]
+    else:
+        width = dict(TIERS)[resolution]
+        rows = conn.execute(
+            f"SELECT bucket, samples, failures, flaps, latency_sum, latency_count FROM probe_rollups_{resolution} "
+            "WHERE sensor_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (sensor_id, math.floor(start / width) * width, end),
+        ).fetchall()
+        if len(rows) <= max_points:
+            return resolution, [_point(*row) for row in rows]
+    return resolution, _rebin(rows, start, end, max_points)
+
+
+class RollupWorker(threading.Thread):
+    """Background thread that folds new probe results into the rollup tables."""
+
+    def __init__(self, db_path, interval=ROLLUP_INTERVAL, retention=RAW_RETENTION, prune_interval=PRUNE_INTERVAL):
+        super().__init__(name="rollup-worker", daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._next_prune = 0
+        self._stopping = threading.Event()
+        self._last_status = {}
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.join(timeout)
+
+    def run_once(self, conn):
+        total = 0
+        while True:
+            count = rollup_new_results(conn, self._last_status)
+            total += count
+            if count < ROLLUP_BATCH:
+                return total
+
+    def prune(self, conn):
+        """Delete raw rows older than the retention that are already rolled up; return how many."""
+        row = conn.execute("SELECT last_rowid FROM rollup_progress WHERE source = 'probe_results'").fetchone()
+        if row is None:
+            return 0
+        return prune_probe_results(conn, time.time() - self.retention, up_to_id=row[0])
+
+    def run(self):
+        conn = open_connection(self.db_path)
+        try:
+            while not self._stopping.is_set():
+                started = time.perf_counter()
+                try:
+                    count = self.run_once(conn)
+                    if count:
+                        logging.debug(f"Rolled up {count} probe results in {time.perf_counter() - started:.3f}s")
+                    if self.retention and time.monotonic() >= self._next_prune:
+                        self._next_prune = time.monotonic() + self.prune_interval
+                        started = time.perf_counter()
+                        pruned = self.prune(conn)
+                        if pruned:
+                            logging.info(f"Pruned {pruned} expired probe results in "
+                                         f"{time.perf_counter() - started:.3f}s")
+                except Exception as e:
+                    logging.exception(f"Probe result rollup failed: {e}")
+                self._stopping.wait(self.interval)
+        finally:
+            conn.close()
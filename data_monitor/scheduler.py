@@ -0,0 +1,138 @@
+"""Per-sensor probe scheduling on a single heap.
+
+Every sensor has its own next-due time instead of the whole fleet being
+swept in lockstep. After each probe the sensor is put back on the heap:
+
+* a healthy sensor backs off gradually, from its base interval up to
+  ``MAX_BACKOFF`` times that interval;
+* a failing sensor is retried quickly, ``retry_interval`` after the first
+  failure, doubling on each further failure up to the same ceiling;
+* a sensor that recovers goes back to its base interval.
+
+The base interval is the sensor's own ``interval`` setting (see
+``station.PROBE_SETTING_COLUMNS``) or else the scheduler's. A fixed
+``max_interval`` replaces the scaled ceiling for every sensor.
+
+Every delay is spread by +/- ``jitter`` (a fraction of the delay), and new
+sensors start at a random offset within their first interval, so probes go
+out at an even rate rather than in bursts.
+"""
+import heapq
+import itertools
+import random
+import time
+
+BASE_INTERVAL = 60  # seconds between probes of a healthy sensor
+MAX_BACKOFF = 3  # ceiling for both healthy back-off and failure retries, in base intervals
+RETRY_INTERVAL = 5  # first retry after a failure
+BACKOFF_FACTOR = 1.5  # growth of the healthy interval per successful probe
+JITTER = 0.1
+
+
+class ScheduledSensor:
+    """Scheduling state of one sensor."""
+
+    __slots__ = ("sensor", "base_interval", "max_interval", "interval", "failures", "due", "removed")
+
+    def __init__(self, sensor, base_interval, max_interval, due):
+        self.sensor = sensor
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.interval = base_interval
+        self.failures = 0
+        self.due = due
+        self.removed = False
+
+
+class ProbeScheduler:
+    """Min-heap of sensors ordered by next-due time (``time.monotonic`` seconds)."""
+
+    def __init__(self, base_interval=BASE_INTERVAL, max_interval=None, retry_interval=RETRY_INTERVAL,
+                 backoff_factor=BACKOFF_FACTOR, jitter=JITTER, rng=None):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.retry_interval = retry_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self._rng = rng or random.Random()
+        self._heap = []
+        self._seq = itertools.count()
+        self._entries = {}  # id(sensor dict) -> ScheduledSensor
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sensor):
+        return id(sensor) in self._entries
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, (entry.due, next(self._seq), entry))
+
+    def _jittered(self, delay):
+        return delay * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def add(self, sensor, now=None, immediate=False):
+        """Schedule a sensor, first due at a random point within its interval.
+
+        With ``immediate`` it is due right away instead, e.g. for a sensor
+        that was just added or changed by a user.
+        """
+        if id(sensor) in self._entries:
+            return self._entries[id(sensor)]
+        now = time.monotonic() if now is None else now
+        base_interval = sensor.get("interval") or self.base_interval
+        due = now if immediate else now + self._rng.uniform(0, base_interval)
+        max_interval = self.max_interval or base_interval * MAX_BACKOFF
+        entry = ScheduledSensor(sensor, base_interval, max(max_interval, base_interval), due)
+        self._entries[id(sensor)] = entry
+        self._push(entry)
+        return entry
+
+    def remove(self, sensor):
+        """Stop scheduling a sensor; a probe already in flight is not rescheduled."""
+        entry = self._entries.pop(id(sensor), None)
+        if entry is not None:
+            entry.removed = True
+
+    def sync(self, sensors, now=None):
+        """Make the scheduled set match ``sensors``: add new ones, drop missing ones."""
+        current = {id(sensor): sensor for sensor in sensors}
+        for key in [key for key in self._entries if key not in current]:
+            self.remove(self._entries[key].sensor)
+        for key, sensor in current.items():
+            if key not in self._entries:
+                self.add(sensor, now)
+
+    def next_due(self):
+        """Return the earliest due time, or None when nothing is scheduled."""
+        while self._heap and self._heap[0][2].removed:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """Remove and return every entry due at or before ``now``."""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)[2]
+            if not entry.removed:
+                due.append(entry)
+        return due
+
+    def reschedule(self, entry, ok, now=None):
+        """Put a probed sensor back on the heap according to its result."""
+        if entry.removed:
+            return
+        now = time.monotonic() if now is None else now
+        if ok:
+            if entry.failures:
+                entry.failures = 0
+                entry.interval = entry.base_interval
+            else:
+                entry.interval = min(entry.interval * self.backoff_factor, entry.max_interval)
+            delay = entry.interval
+        else:
+            entry.failures += 1
+            delay = min(self.retry_interval * 2 ** min(entry.failures - 1, 16), entry.max_interval)
+        entry.due = now + self._jittered(delay)
+        self._push(entry)
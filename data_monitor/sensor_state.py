@@ -0,0 +1,142 @@
+"""Fixed-size in-memory history of one sensor's probe results.
+
+``SensorState`` is what ``sensor["history"]`` holds for monitored sensors.
+Samples live in three parallel typed arrays used as a ring buffer: the 0/1
+status (1 byte each), the Unix timestamp and the connect latency. Appending
+overwrites the oldest sample in place once the buffer is full, so memory
+per sensor is bounded at roughly 13 bytes per sample of capacity, and no
+list is copied or trimmed after every probe.
+
+``debouncer`` holds the running counts ``debounce.py`` keeps over the
+newest samples, so they travel with the ring when a sensor is reloaded.
+
+A ring starts empty when the stations are loaded, and is filled from
+probe_results the first time its history is read (see
+``StateCache.seed_history``), so charts survive a restart without the
+whole fleet's history being read up front.
+
+It behaves like the list of 0/1 entries it replaced: ``len``, iteration
+(oldest first), indexing and ``==`` against a list all work, so existing
+readers keep working unchanged.
+"""
+import math
+import os
+from array import array
+
+from history import HISTORY_LIMIT
+
+# Samples kept in memory per sensor. At about 13 bytes a sample, 5000 for
+# each of 20k ports is 1.3 GB, so raise it with the fleet size in mind.
+HISTORY_CAPACITY = int(os.environ.get('HISTORY_CAPACITY', HISTORY_LIMIT))
+
+
+class SensorState:
+    """Ring buffer of ``(status, ts, latency_ms)`` samples, oldest first."""
+
+    __slots__ = ("capacity", "_status", "_ts", "_latency", "_next", "debouncer", "seeded")
+
+    def __init__(self, capacity=HISTORY_CAPACITY, entries=()):
+        self.capacity = capacity
+        # The arrays grow to ``capacity`` and are then overwritten in place
+        self._status = array("b")
+        self._ts = array("d")
+        self._latency = array("f")
+        self._next = 0  # slot the next sample goes into once full
+        self.debouncer = None
+        self.seeded = False  # whether stored samples were put before the live ones
+        for entry in entries:
+            self.append(entry)
+
+    def append(self, status, ts=0.0, latency_ms=None):
+        """Add one sample, dropping the oldest when full. ``latency_ms`` None is stored as NaN."""
+        latency_ms = math.nan if latency_ms is None else latency_ms
+        if len(self._status) < self.capacity:
+            self._status.append(status)
+            self._ts.append(ts)
+            self._latency.append(latency_ms)
+            return
+        i = self._next
+        self._status[i] = status
+        self._ts[i] = ts
+        self._latency[i] = latency_ms
+        self._next = (i + 1) % self.capacity
+
+    def seed(self, samples):
+        """Put stored ``(ts, status, latency_ms)`` samples, oldest first, before the ones in memory.
+
+        Only samples older than the oldest one in memory are used, and only
+        as many as fit.
+        """
+        self.seeded = True
+        timestamps = self.timestamps()
+        if timestamps:
+            samples = [sample for sample in samples if sample[0] < timestamps[0]]
+        if not samples:
+            return
+        combined = (list(samples) + list(zip(timestamps, self.statuses(), self.latencies())))[-self.capacity:]
+        self._status, self._ts, self._latency, self._next = array("b"), array("d"), array("f"), 0
+        for ts, status, latency_ms in combined:
+            self.append(status, ts, latency_ms)
+        if self.debouncer is not None:
+            # Count the seeded samples on the next result
+            self.debouncer.fail_window = None
+
+    def __len__(self):
+        return len(self._status)
+
+    def _ordered(self, values):
+        """Return the samples of one array as a list, oldest first.
+
+        The array is sliced through memoryviews, so the only copy made is
+        the list itself.
+        """
+        if not self._next:
+            return values.tolist()
+        view = memoryview(values)
+        return view[self._next:].tolist() + view[:self._next].tolist()
+
+    def statuses(self):
+        """Return the 0/1 status entries, oldest first."""
+        return self._ordered(self._status)
+
+    def timestamps(self):
+        return self._ordered(self._ts)
+
+    def latencies(self):
+        """Return connect latencies in ms, with None where none was recorded."""
+        return [None if math.isnan(value) else value for value in self._ordered(self._latency)]
+
+    def recent(self, back=0):
+        """Return the 0/1 status ``back`` samples before the newest one."""
+        # Before the ring is full _next is 0, so this counts back from the end
+        return self._status[(self._next - 1 - back) % len(self._status)]
+
+    def last_ts(self):
+        """Return the timestamp of the newest sample, or None when empty."""
+        if not self._ts:
+            return None
+        # Once full, the newest sample sits just before the next slot
+        return self._ts[self._next - 1]
+
+    def samples(self):
+        """Return ``{"ts", "status", "latency_ms"}`` dicts, oldest first."""
+        return [
+            {"ts": ts, "status": status, "latency_ms": latency_ms}
+            for ts, status, latency_ms in zip(self.timestamps(), self.statuses(), self.latencies())
+        ]
+
+    def __iter__(self):
+        return iter(self.statuses())
+
+    def __getitem__(self, index):
+        return self.statuses()[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (SensorState, list)):
+            return self.statuses() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SensorState({self.statuses()!r}, capacity={self.capacity})"
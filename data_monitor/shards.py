@@ -0,0 +1,288 @@
+"""Monitoring split across several worker processes.
+
+Stations are assigned to ``processes`` shards by a stable hash of their
+name. Each shard process loads its own stations from the database and runs
+its own probe engine, so probing, logging and result bookkeeping for a
+large fleet are spread over several cores instead of sharing one GIL with
+the web app.
+
+Shard processes never write to SQLite. They batch their probe_results rows
+onto one multiprocessing queue; a collector thread in the main process
+applies each result to the in-memory station tree (so the dashboard, the
+state cache and its listeners see it as usual) and hands the rows to the
+main process's ``ResultWriter``. SQLite keeps a single writer.
+
+Shards re-read their stations every ``SHARD_RELOAD_INTERVAL`` seconds, and
+re-read a station right away when the web app reports a change to it
+through ``add_sensor``, ``remove_sensor`` or ``reconfigure`` (the same API
+as ``supervisor.MonitorSupervisor``). Reloads query only the shard's own
+stations and run off the probe event loop. A reload keeps every unchanged
+sensor as it is. Shards are restarted if they die.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+
+from probe import CHECK_INTERVAL, PROBE_FIELDS, ProbeEngine, record_result
+from scheduler import ProbeScheduler
+
+# Seconds between batches sent from a shard to the main process
+FORWARD_INTERVAL = 0.5
+
+# Seconds between reloads of a shard's stations from the database
+SHARD_RELOAD_INTERVAL = 30
+
+# Seconds between refreshes of the main process's sensor-id index
+INDEX_REFRESH_INTERVAL = 5
+
+
+def shard_of(station_name, processes):
+    """Return the shard index (0 .. processes - 1) that monitors a station."""
+    return zlib.crc32(station_name.encode("utf-8")) % processes
+
+
+def _iter_sensors(stations):
+    for platforms in list(stations.values()):
+        for sensors in list(platforms.values()):
+            yield from list(sensors)
+
+
+def merge_stations(current, loaded, names=None):
+    """Replace the contents of ``current`` with ``loaded`` in place.
+
+    With ``names``, only those stations are replaced, and the ones missing
+    from ``loaded`` are dropped. Sensors whose id and probe fields did not
+    change keep their existing dict, so the engine carries on with their
+    state and schedule.
+    """
+    replaced = current if names is None else {name: current[name] for name in names if name in current}
+    known = {sensor["id"]: sensor for sensor in _iter_sensors(replaced)}
+    for platforms in loaded.values():
+        for sensors in platforms.values():
+            for i, sensor in enumerate(sensors):
+                old = known.get(sensor["id"])
+                if old is not None and all(old.get(field) == sensor.get(field) for field in PROBE_FIELDS):
+                    sensors[i] = old
+    if names is None:
+        current.clear()
+        current.update(loaded)
+        return
+    for name in names:
+        if name in loaded:
+            current[name] = loaded[name]
+        else:
+            current.pop(name, None)
+
+
+class ResultForwarder:
+    """Stands in for ``ResultWriter`` inside a shard: batches rows onto a process queue."""
+
+    def __init__(self, results, flush_interval=FORWARD_INTERVAL):
+        self.results = results
+        self.flush_interval = flush_interval
+        self._rows = []
+
+    async def submit_async(self, row, timeout=None):
+        self._rows.append(row)
+        return True
+
+    def flush(self):
+        if self._rows:
+            rows, self._rows = self._rows, []
+            self.results.put(rows)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+def load_shard(index, processes, names=None):
+    """Load this shard's stations, or only the ``names`` among them, from the database.
+
+    Only the shard's own stations are queried. A requested station that no
+    longer exists is missing from the result.
+    """
+    from db import get_connection
+    from station import build_station_tree, query_station_tree
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        if names is None:
+            cursor.execute("SELECT name FROM stations")
+            names = [name for (name,) in cursor.fetchall() if shard_of(name, processes) == index]
+        rows = []
+        for name in names:
+            rows.extend(query_station_tree(cursor, name))
+        stations = build_station_tree(rows)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+    logging.debug(f"Shard {index} loaded {len(stations)} stations")
+    return stations
+
+
+def _wait_for_reload(commands):
+    """Block until reloads are requested or the reload interval passes.
+
+    Returns the names of the stations to reload, or None when the interval
+    passed and all of the shard's stations are due.
+    """
+    try:
+        names = {commands.get(timeout=SHARD_RELOAD_INTERVAL)}
+    except queue.Empty:
+        return None
+    while True:
+        # Coalesce requests that arrived together
+        try:
+            names.add(commands.get_nowait())
+        except queue.Empty:
+            return names
+
+
+async def _reload_forever(stations, index, processes, commands):
+    loop = asyncio.get_running_loop()
+    while True:
+        names = await loop.run_in_executor(None, _wait_for_reload, commands)
+        try:
+            # Off the event loop, so probes keep going while the database is read
+            loaded = await loop.run_in_executor(None, load_shard, index, processes, names)
+            merge_stations(stations, loaded, names)
+        except Exception as e:
+            logging.exception(f"Shard {index} failed to reload its stations: {e}")
+
+
+async def _run_shard(index, processes, results, commands, interval):
+    stations = load_shard(index, processes)
+    logging.info(f"Shard {index}/{processes} monitoring {len(stations)} stations")
+    forwarder = ResultForwarder(results)
+    engine = ProbeEngine(writer=forwarder)
+    await asyncio.gather(
+        engine.run_forever(stations, ProbeScheduler(base_interval=interval)),
+        forwarder.run(),
+        _reload_forever(stations, index, processes, commands),
+    )
+
+
+def shard_main(index, processes, results, commands, interval):
+    """Entry point of one shard process."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_shard(index, processes, results, commands, interval))
+
+
+class ShardedMonitor:
+    """Run and supervise the shard processes and collect their results.
+
+    ``stations`` is the main process's station tree, updated in place by
+    the collector; ``writer`` is the ``ResultWriter`` the rows are
+    persisted through.
+    """
+
+    def __init__(self, stations, processes, writer=None, interval=CHECK_INTERVAL):
+        self.stations = stations
+        self.processes = processes
+        self.writer = writer
+        self.interval = interval
+        # spawn rather than fork: the parent holds threads and SQLite connections
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers = [None] * processes
+        self._commands = [self._context.Queue() for _ in range(processes)]
+        self._index = {}
+        self._index_built = 0
+        self._stopping = threading.Event()
+        self._collector = None
+
+    def start(self):
+        for index in range(self.processes):
+            self._start_worker(index)
+        self._collector = threading.Thread(target=self._collect, name="shard-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        for worker in self._workers:
+            if worker is not None:
+                worker.terminate()
+        for worker in self._workers:
+            if worker is not None:
+                worker.join(timeout)
+        if self._collector is not None:
+            self._collector.join(timeout)
+
+    def _start_worker(self, index):
+        worker = self._context.Process(
+            target=shard_main,
+            args=(index, self.processes, self._results, self._commands[index], self.interval),
+            name=f"probe-shard-{index}",
+            daemon=True,
+        )
+        worker.start()
+        self._workers[index] = worker
+
+    def _request_reload(self, station_name):
+        self._commands[shard_of(station_name, self.processes)].put(station_name)
+
+    def add_sensor(self, station_name, sensor):
+        self._request_reload(station_name)
+
+    def remove_sensor(self, station_name, sensor):
+        self._request_reload(station_name)
+
+    def reconfigure(self, station_name, old_sensor, new_sensor):
+        self._request_reload(station_name)
+
+    def _check_workers(self):
+        for index, worker in enumerate(self._workers):
+            if not worker.is_alive() and not self._stopping.is_set():
+                logging.error(f"Probe shard {index} exited with code {worker.exitcode}, restarting")
+                self._start_worker(index)
+
+    def _sensor(self, sensor_id):
+        sensor = self._index.get(sensor_id)
+        if sensor is None and time.monotonic() - self._index_built > 1:
+            # New sensor, or the station was reloaded since the last refresh
+            self._refresh_index()
+            sensor = self._index.get(sensor_id)
+        return sensor
+
+    def _refresh_index(self):
+        self._index = {sensor.get("id"): sensor for sensor in _iter_sensors(self.stations)}
+        self._index_built = time.monotonic()
+
+    def _apply(self, rows):
+        if time.monotonic() - self._index_built > INDEX_REFRESH_INTERVAL:
+            self._refresh_index()
+        for row in rows:
+            sensor_id, ts, history_entry, connect_ms, bytes_received, error = row[:4] + row[5:7]
+            sensor = self._sensor(sensor_id)
+            if sensor is not None:
+                status = record_result(sensor, "green" if history_entry == 0 else "red", history_entry, connect_ms,
+                                       ts, error, bytes_received)
+                # This process's debounced status is the one the app shows
+                row = row[:7] + (status,)
+            if self.writer is not None:
+                self.writer.submit(row)
+
+    def _collect(self):
+        next_check = time.monotonic() + 1
+        while not self._stopping.is_set():
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + 1
+            try:
+                rows = self._results.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            try:
+                self._apply(rows)
+            except Exception as e:
+                logging.exception(f"Failed to apply {len(rows)} shard results: {e}")
@@ -0,0 +1,564 @@
+"""Versioned in-memory view of station state for the web layer.
+
+The cache wraps the same ``{station: {platform: [sensor, ...]}}`` dict that
+the probe engine updates, so live status and history never have to be
+read back from SQLite. Probe results bump the version through
+``probe.result_listeners``; CRUD routes call ``invalidate_station`` to
+reload just the station they touched.
+
+Besides ``version``, which moves with every probe, the cache keeps a
+``status_version`` and a version per station that only move when a status
+changes or a station is reloaded. The JSON API derives its ETags from
+those, so a polling client gets ``304 Not Modified`` until something it
+can see has changed.
+
+Green/red/unknown counts per station and platform, and the set of failing
+sensors, are kept as counters: a status change moves one sensor from one
+count to another, and only a reload recounts the station it touched. The
+fleet overview is served from them without walking the sensors.
+
+Status *changes* are also fanned out to per-station subscribers, which is
+what the server-sent event stream in ``app.py`` reads from.
+
+In the split deployment a web worker runs no probes; ``follow_monitor()``
+replays the monitor daemon's results and the other workers' inventory
+changes into the cache from the database (see follower.py).
+
+Nothing is read from the database at import time. ``ensure_loaded()``
+creates the schema and loads the whole tree the first time the app needs
+it (see ``app.create_app``), so importing the web app or forking a worker
+costs the same whatever the size of the fleet.
+
+When a monitor is attached (``state.monitor``, a
+``supervisor.MonitorSupervisor`` or ``shards.ShardedMonitor``), every
+reload tells it exactly which sensors were added, removed or
+reconfigured.
+"""
+import os
+import queue
+import threading
+import time
+
+import debounce
+import metrics
+import probe
+import station as station_db
+from db import DB_PATH, get_connection
+from follower import ResultFollower, current_marks
+from history import get_probe_history
+from sensor_state import SensorState
+from streaming import TICK_INTERVAL
+
+
+# Statuses the overview counts; anything else is counted as unknown
+STATUSES = ("green", "red", "flapping", "unknown")
+
+# Changes buffered per subscriber before it is told to resynchronise
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscriber:
+    """Queue of status changes for one station, read by one stream client."""
+
+    def __init__(self, station_name):
+        self.station_name = station_name
+        self.changes = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, change):
+        try:
+            self.changes.put_nowait(change)
+        except queue.Full:
+            # A client this far behind reloads the whole page instead
+            self.overflowed = True
+
+    def drain(self, timeout):
+        """Block up to ``timeout`` for one change, then take everything else queued."""
+        try:
+            changes = [self.changes.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                changes.append(self.changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+
+def _status_key(status):
+    return status if status in STATUSES else "unknown"
+
+
+def _copy_sensor(sensor, history=True):
+    if not history:
+        # dict() copies in one step and writers change a sensor's fields in
+        # one update(), so the copy is consistent without taking the lock
+        copy = dict(sensor)
+        del copy["history"]
+        return copy
+    with probe.sensor_lock(sensor):
+        copy = dict(sensor)
+        copy["history"] = list(sensor["history"])
+    return copy
+
+
+class StateCache:
+    """Single read path for station state, kept current by probes and CRUD routes."""
+
+    def __init__(self, stations, loader):
+        self._stations = stations
+        self._loader = loader
+        self._lock = threading.Lock()
+        # Guards the three kinds of version below, bumped from probe, follower and request threads
+        self._version_lock = threading.Lock()
+        self.version = 0
+        self.status_version = 0
+        self._station_versions = {}
+        # Distinguishes versions handed out before and after a restart
+        self.epoch = format(int(time.time() * 1000), "x")
+        self._locations = {}
+        # Stations with streamed sensors, whose byte rates change without a status change
+        self._streamed = set()
+        self._subscribers = {}
+        self.monitor = None
+        self.loaded = False
+        # (probe_results id, station_changes id) seen by the last load
+        self.marks = (0, 0)
+        # Overview counters, guarded by _counts_lock:
+        # station -> platform -> {status: n}, fleet totals, id -> counted
+        # status, and station -> id -> (platform, sensor, red since)
+        self._counts_lock = threading.Lock()
+        self._counts = {}
+        self._totals = dict.fromkeys(STATUSES, 0)
+        self._counted = {}
+        self._failing = {}
+        for station_name, platforms in list(stations.items()):
+            self._index_station(station_name, platforms)
+            self._count_station(station_name, platforms)
+        probe.result_listeners.append(self._on_result)
+        metrics.register_collector(self._collect_metrics)
+
+    def _index_station(self, station_name, platforms):
+        streamed = False
+        for platform_name, sensors in platforms.items():
+            for sensor in sensors:
+                self._locations[sensor["id"]] = (station_name, platform_name)
+                streamed = streamed or sensor.get("mode") == "stream"
+        if streamed:
+            self._streamed.add(station_name)
+        else:
+            self._streamed.discard(station_name)
+
+    def load(self, stations):
+        """Replace the whole tree with ``stations``, in place, and rebuild the indexes and counters.
+
+        Meant for startup, before a monitor is attached: the monitor is not
+        told about the sensors that change.
+        """
+        with self._lock:
+            self._stations.clear()
+            self._stations.update(stations)
+            self._locations.clear()
+            self._streamed.clear()
+            with self._counts_lock:
+                self._counts.clear()
+                self._totals = dict.fromkeys(STATUSES, 0)
+                self._counted.clear()
+                self._failing.clear()
+            for station_name, platforms in list(stations.items()):
+                self._index_station(station_name, platforms)
+                self._count_station(station_name, platforms)
+            self._bump(list(stations))
+            self.loaded = True
+
+    def _count_station(self, station_name, platforms, drop=()):
+        """Recount one station from its sensors, forgetting the sensor ids in ``drop``."""
+        with self._counts_lock:
+            for sensor_id in drop:
+                self._counted.pop(sensor_id, None)
+            for counts in self._counts.pop(station_name, {}).values():
+                for status, count in counts.items():
+                    self._totals[status] -= count
+            was_failing = self._failing.pop(station_name, {})
+            if platforms is None:
+                return
+
+            station_counts, failing = {}, {}
+            for platform_name, sensors in platforms.items():
+                counts = station_counts[platform_name] = dict.fromkeys(STATUSES, 0)
+                for sensor in sensors:
+                    status = _status_key(sensor["status"])
+                    counts[status] += 1
+                    self._counted[sensor["id"]] = status
+                    if status == "red":
+                        since = was_failing.get(sensor["id"], (None, None, None))[2]
+                        failing[sensor["id"]] = (platform_name, sensor, since)
+                for status, count in counts.items():
+                    self._totals[status] += count
+            self._counts[station_name] = station_counts
+            self._failing[station_name] = failing
+
+    def _count_change(self, sensor, station_name, platform_name):
+        """Move one sensor between counts after its status changed."""
+        sensor_id = sensor["id"]
+        with self._counts_lock:
+            old = self._counted.get(sensor_id)
+            new = _status_key(sensor["status"])
+            counts = self._counts.get(station_name, {}).get(platform_name)
+            if old is None or old == new or counts is None:
+                return
+            counts[old] -= 1
+            counts[new] += 1
+            self._totals[old] -= 1
+            self._totals[new] += 1
+            self._counted[sensor_id] = new
+            failing = self._failing.setdefault(station_name, {})
+            if new == "red":
+                failing[sensor_id] = (platform_name, sensor, time.time())
+            else:
+                failing.pop(sensor_id, None)
+
+    def _bump(self, station_names=(), status=True):
+        """Move ``version`` and, with ``status``, the status and station versions; return the new ``version``."""
+        with self._version_lock:
+            self.version += 1
+            if status:
+                self.status_version += 1
+                for name in station_names:
+                    self._station_versions[name] = self._station_versions.get(name, 0) + 1
+            return self.version
+
+    def _on_result(self, sensor, previous_status):
+        if sensor["status"] == previous_status:
+            self._bump(status=False)
+            return
+        location = self._locations.get(sensor.get("id"))
+        version = self._bump(location[:1] if location is not None else ())
+        if location is None:
+            return
+        self._count_change(sensor, *location)
+        subscribers = self._subscribers.get(location[0])
+        if subscribers:
+            change = {
+                "id": sensor["id"],
+                "platform": location[1],
+                "sensor_name": sensor["sensor_name"],
+                "status": sensor["status"],
+                "version": version,
+            }
+            for subscriber in list(subscribers):
+                subscriber.push(change)
+
+    def _collect_metrics(self):
+        """Per-sensor up/down and per-station probe age for /metrics, read at scrape time."""
+        now = time.time()
+        up, cycle_age, rates = [], [], []
+        for station_name, platforms in list(self._stations.items()):
+            oldest = None
+            for platform_name, sensors in list(platforms.items()):
+                for sensor in list(sensors):
+                    with probe.sensor_lock(sensor):
+                        status = sensor["status"]
+                        history = sensor["history"]
+                        last_ts = history.last_ts() if isinstance(history, SensorState) else None
+                        rate = sensor.get("bytes_per_sec") if sensor.get("mode") == "stream" else None
+                    labels = (station_name, platform_name, sensor["sensor_name"])
+                    if status in ("green", "red"):
+                        up.append((labels, int(status == "green")))
+                    if rate is not None:
+                        rates.append((labels, rate))
+                    if last_ts is not None and (oldest is None or last_ts < oldest):
+                        oldest = last_ts
+            if oldest is not None:
+                cycle_age.append(((station_name,), now - oldest))
+        yield ("nport_sensor_up", "gauge", "1 while data flows on the sensor's port, 0 when it does not",
+               ("station", "platform", "sensor"), up)
+        # With per-sensor scheduling there is no station-wide cycle; the age of
+        # the stalest result is how long a full pass over the station takes.
+        yield ("nport_station_cycle_seconds", "gauge", "Age of the least recently probed sensor's last result",
+               ("station",), cycle_age)
+        yield ("nport_stream_bytes_per_second", "gauge", "Bytes per second arriving on a streamed sensor's port",
+               ("station", "platform", "sensor"), rates)
+
+    def subscribe(self, station_name):
+        """Register for status changes of one station; pair with ``unsubscribe``."""
+        subscriber = Subscriber(station_name)
+        with self._lock:
+            self._subscribers.setdefault(station_name, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.station_name)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.station_name]
+
+    def station_names(self):
+        return list(self._stations)
+
+    def snapshot_station(self, station_name, history=True):
+        """Return a copy of one station's platforms and sensors, or None.
+
+        Each sensor is copied under its own lock, so every sensor is
+        internally consistent while probes keep running on the others.
+        With ``history=False`` the copies leave out the history and take no
+        locks at all, so pages that only show status do not queue behind
+        the probes.
+        """
+        platforms = self._stations.get(station_name)
+        if platforms is None:
+            return None
+        return {
+            platform_name: [_copy_sensor(sensor, history) for sensor in sensors]
+            for platform_name, sensors in list(platforms.items())
+        }
+
+    def status_counts(self, station_name):
+        """Return ``{"green": n, "red": n, "unknown": n}`` for one station, or None."""
+        with self._counts_lock:
+            platforms = self._counts.get(station_name)
+            if platforms is None:
+                return None
+            counts = dict.fromkeys(STATUSES, 0)
+            for platform_counts in platforms.values():
+                for status, count in platform_counts.items():
+                    counts[status] += count
+        return counts
+
+    def overview(self):
+        """Return fleet-wide counts from the counters, without reading any sensor's history.
+
+        ``{"totals", "stations": [{"name", <counts>, "platforms": [{"name",
+        <counts>}]}], "failing": [{"id", "station", "platform", "sensor",
+        "ip", "port", "error", "since"}]}``; ``since`` is when the sensor
+        went red, None if that was before the last reload of its station,
+        and ``error`` why its last probe failed.
+        """
+        with self._counts_lock:
+            totals = dict(self._totals)
+            counts = {name: {p: dict(c) for p, c in platforms.items()} for name, platforms in self._counts.items()}
+            failing = [
+                (station_name, sensor_id, platform_name, sensor, since)
+                for station_name, sensors in self._failing.items()
+                for sensor_id, (platform_name, sensor, since) in sensors.items()
+            ]
+
+        stations = []
+        for name in self.station_names():
+            platforms = counts.get(name)
+            if platforms is None:
+                continue
+            station_counts = dict.fromkeys(STATUSES, 0)
+            for platform_counts in platforms.values():
+                for status, count in platform_counts.items():
+                    station_counts[status] += count
+            stations.append({
+                "name": name,
+                **station_counts,
+                "platforms": [{"name": p, **c} for p, c in platforms.items()],
+            })
+        return {
+            "totals": totals,
+            "stations": stations,
+            "failing": sorted((
+                {
+                    "id": sensor_id,
+                    "station": station_name,
+                    "platform": platform_name,
+                    "sensor": sensor["sensor_name"],
+                    "ip": sensor["ip"],
+                    "port": sensor["port"],
+                    "error": sensor.get("last_error"),
+                    "since": since,
+                }
+                for station_name, sensor_id, platform_name, sensor, since in failing
+            ), key=lambda f: (f["since"] is None, f["since"] or 0)),
+        }
+
+    def station_version(self, station_name):
+        """Return a counter that moves whenever a status in the station changes or it is reloaded.
+
+        For a station with streamed sensors it also moves every
+        ``streaming.TICK_INTERVAL``, as their byte rates are refreshed.
+        """
+        with self._version_lock:
+            version = self._station_versions.get(station_name, 0)
+        if station_name in self._streamed:
+            return f"{version}.{int(time.time() // TICK_INTERVAL)}"
+        return version
+
+    def locate(self, sensor_id):
+        """Return the ``(station, platform)`` a sensor id belongs to, or None if it is unknown."""
+        return self._locations.get(sensor_id)
+
+    def _live_sensor(self, sensor_id):
+        location = self._locations.get(sensor_id)
+        if location is None:
+            return None
+        for sensor in self._stations.get(location[0], {}).get(location[1], ()):
+            if sensor["id"] == sensor_id:
+                return sensor
+        return None
+
+    def seed_history(self, sensor):
+        """Fill a sensor's history ring from probe_results the first time it is read."""
+        history = sensor["history"]
+        if not isinstance(history, SensorState) or history.seeded or sensor.get("id") is None:
+            return
+        rows = get_probe_history(get_connection(), sensor["id"], limit=history.capacity)
+        with probe.sensor_lock(sensor):
+            if not history.seeded:
+                history.seed([(row["ts"], row["status"], row["latency_ms"]) for row in rows])
+
+    def history_version(self, sensor_id):
+        """Return ``(samples, newest timestamp)`` of a sensor's history, or None if the id is unknown."""
+        sensor = self._live_sensor(sensor_id)
+        if sensor is None:
+            return None
+        self.seed_history(sensor)
+        with probe.sensor_lock(sensor):
+            history = sensor["history"]
+            return len(history), history.last_ts() if isinstance(history, SensorState) else None
+
+    def sensor_samples(self, sensor_id):
+        """Return a sensor's in-memory ``(timestamps, statuses, latencies)``, oldest first, or None."""
+        sensor = self._live_sensor(sensor_id)
+        if sensor is None:
+            return None
+        self.seed_history(sensor)
+        with probe.sensor_lock(sensor):
+            history = sensor["history"]
+            if isinstance(history, SensorState):
+                return history.timestamps(), history.statuses(), history.latencies()
+            return [None] * len(history), list(history), [None] * len(history)
+
+    def find_sensor(self, platform_name, sensor_name, station_name=None):
+        """Return a copy of the first matching sensor, or None.
+
+        Without ``station_name`` every station is searched, in load order.
+        """
+        names = [station_name] if station_name is not None else self.station_names()
+        for name in names:
+            sensors = self._stations.get(name, {}).get(platform_name, [])
+            for sensor in sensors:
+                if sensor["sensor_name"] == sensor_name:
+                    self.seed_history(sensor)
+                    return _copy_sensor(sensor)
+        return None
+
+    def apply_result(self, sensor_id, history_entry, ts, latency_ms=None, error=None, bytes_received=None):
+        """Record a probe result made by another process; False if the sensor is not loaded here."""
+        sensor = self._live_sensor(sensor_id)
+        if sensor is None:
+            return False
+        probe.record_result(sensor, "green" if history_entry == 0 else "red", history_entry, latency_ms, ts, error,
+                            bytes_received)
+        return True
+
+    def invalidate_station(self, station_name, previous_name=None):
+        """Reload one station's subtree from the database.
+
+        Sensors that survive the reload (same id) keep their in-memory status
+        and history. Those whose probe settings (``probe.PROBE_FIELDS``) did
+        not change also keep their dict, so the probe engine carries on with
+        them untouched and only starts or stops probing the sensors that
+        actually changed. A station that no longer exists is dropped.
+
+        ``previous_name`` is the station's name before a rename; its sensors
+        are carried over to ``station_name`` the same way.
+        """
+        platforms = self._loader(station_name)
+        added, reconfigured = [], []
+        with self._lock:
+            old_names = [station_name] if previous_name in (None, station_name) else [previous_name, station_name]
+            previous = {
+                sensor["id"]: (name, sensor)
+                for name in old_names
+                for sensors in (self._stations.get(name) or {}).values()
+                for sensor in sensors
+            }
+            for sensor_id in previous:
+                self._locations.pop(sensor_id, None)
+            if previous_name not in (None, station_name):
+                self._stations.pop(previous_name, None)
+                self._streamed.discard(previous_name)
+            if platforms is None:
+                self._stations.pop(station_name, None)
+                self._streamed.discard(station_name)
+            else:
+                for sensors in platforms.values():
+                    for i, sensor in enumerate(sensors):
+                        _, known = previous.pop(sensor["id"], (None, None))
+                        if known is None:
+                            added.append(sensor)
+                            continue
+                        with probe.sensor_lock(known):
+                            if all(known.get(field) == sensor.get(field) for field in probe.PROBE_FIELDS):
+                                known.update({field: sensor[field]
+                                              for field in ("sensor_name",) + debounce.DEBOUNCE_FIELDS})
+                                sensors[i] = known
+                            else:
+                                sensor["status"] = known["status"]
+                                sensor["history"] = known["history"]
+                                reconfigured.append((known, sensor))
+                self._index_station(station_name, platforms)
+                self._stations[station_name] = platforms
+            if previous_name not in (None, station_name):
+                self._count_station(previous_name, None)
+            self._count_station(station_name, platforms, drop=previous)
+            self._bump(old_names)
+
+            # The station's layout changed; open streams must re-render
+            for name in old_names:
+                for subscriber in self._subscribers.get(name, ()):
+                    subscriber.overflowed = True
+
+        if self.monitor is not None:
+            for name, sensor in previous.values():
+                self.monitor.remove_sensor(name, sensor)
+            for known, sensor in reconfigured:
+                self.monitor.reconfigure(station_name, known, sensor)
+            for sensor in added:
+                self.monitor.add_sensor(station_name, sensor)
+
+
+state = StateCache(station_db.stations, station_db.load_station)
+
+_load_lock = threading.Lock()
+
+# Follower started by follow_monitor(), and the process it runs in
+_follower = None
+_follower_pid = None
+
+
+def ensure_loaded():
+    """Create the schema and load every station into ``state``, once per process."""
+    if state.loaded:
+        return
+    with _load_lock:
+        if not state.loaded:
+            station_db.create_tables()
+            # Taken before the load, so a follower replays anything written during it
+            state.marks = current_marks(get_connection())
+            state.load(station_db.load_stations())
+
+
+def follow_monitor(results=True):
+    """Start following the database for writes by other processes, once per process.
+
+    Safe to call on every request: a worker forked from a process that
+    already follows starts its own thread, since threads do not survive
+    the fork. Returns the follower.
+    """
+    global _follower, _follower_pid
+    if _follower_pid == os.getpid():
+        return _follower
+    ensure_loaded()
+    with _load_lock:
+        if _follower_pid != os.getpid():
+            _follower = ResultFollower(state, DB_PATH, state.marks, results=results)
+            _follower.start()
+            _follower_pid = os.getpid()
+    return _follower
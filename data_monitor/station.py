@@ -1,16 +1,16 @@
+import gc
 import json
 import os
-import socket
-import threading
-import time
-import concurrent.futures
 import logging
-import sqlite3
 
-logging.basicConfig(level=logging.INFO)
+from db import DB_PATH, get_connection
+from follower import create_change_table
+from history import add_missing_columns, create_history_table, get_recent_history, migrate_history_blobs
+from probe import CHECK_INTERVAL, log_status_change, result_listeners
+from rollups import RollupWorker, create_rollup_tables
+from sensor_state import HISTORY_CAPACITY, SensorState
+from writer import ResultWriter
 
-# Reduce timeout to make the monitoring faster
-TIMEOUT = 60  # 60-second timeout
 
 # Define the path to the JSON file and the text file for default data
 STATIONS_FILE = os.path.abspath('stations.json')
@@ -18,28 +18,22 @@ DEFAULT_STATIONS_FILE = os.path.abspath('station_data.txt')
 
 
 def connect_db():
-    """Create and return a connection to the SQLite database."""
-    return sqlite3.connect('stations.db')
+    """Return this thread's pooled connection to the SQLite database."""
+    return get_connection()
 
 def get_db_connection():
-    conn = sqlite3.connect('stations.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_connection()
   
 def check_tables():
-    conn = sqlite3.connect('stations.db')
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
     tables = cursor.fetchall()
-    conn.close()
     return tables
 
-print(check_tables())
-
-
 
 def create_tables():
-    conn = sqlite3.connect('stations.db')
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -66,13 +60,22 @@ def create_tables():
         ip TEXT NOT NULL,
         port INTEGER NOT NULL,
         status TEXT,
-        history TEXT,
         FOREIGN KEY (platform_id) REFERENCES platforms (id)
     )
     ''')
 
+    add_missing_columns(cursor, "platforms", PROBE_SETTING_COLUMNS)
+    add_missing_columns(cursor, "sensors", PROBE_SETTING_COLUMNS)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_platforms_station_id ON platforms (station_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sensors_platform_id ON sensors (platform_id)")
+
+    create_history_table(cursor)
+    migrate_history_blobs(cursor)
+    create_rollup_tables(cursor)
+    create_change_table(cursor)
+
     conn.commit()
-    conn.close()
 
     
 def load_default_stations():
@@ -92,47 +95,124 @@ def load_default_stations():
         return {}
 
 
-def load_stations():
-    """Load station data from the SQLite database or return an empty dictionary if the database is empty or cannot be accessed."""
-    conn = None
-    try:
-        conn = sqlite3.connect('stations.db')
-        cursor = conn.cursor()
+# Sensor columns shared by the tree and platform queries. Probe settings set
+# on the sensor win over the platform's; NULL in both means the default.
+SENSOR_COLUMNS = '''se.id, se.sensor_name, se.ip, se.port, se.status,
+       COALESCE(se.connect_timeout, p.connect_timeout),
+       COALESCE(se.first_byte_timeout, p.first_byte_timeout),
+       COALESCE(se.mode, p.mode),
+       COALESCE(se.silence_window, p.silence_window),
+       COALESCE(se.fail_threshold, p.fail_threshold),
+       COALESCE(se.fail_window, p.fail_window),
+       COALESCE(se.recover_threshold, p.recover_threshold),
+       COALESCE(se.flap_threshold, p.flap_threshold),
+       COALESCE(se.interval, p.interval)'''
+
+# Probe settings that platforms and sensors can override
+PROBE_SETTING_COLUMNS = {
+    "connect_timeout": "REAL",  # seconds
+    "first_byte_timeout": "REAL",  # seconds
+    "mode": "TEXT",  # 'poll' (default) or 'stream'
+    "silence_window": "REAL",  # seconds without data before a streamed sensor goes red
+    # Status debouncing, see debounce.py
+    "fail_threshold": "INTEGER",  # failed results among the last fail_window that turn it red
+    "fail_window": "INTEGER",
+    "recover_threshold": "INTEGER",  # good results in a row that turn it green again
+    "flap_threshold": "INTEGER",  # status changes in the flap window that mark it flapping; 0 = never
+    "interval": "REAL",  # seconds between probes of the sensor while healthy, see scheduler.py
+}
+
+# One query for the whole station -> platform -> sensor tree. LEFT JOINs keep
+# stations without platforms and platforms without sensors in the result.
+STATION_TREE_QUERY = '''
+SELECT s.name, p.id, p.name, {sensor_columns}
+FROM stations s
+LEFT JOIN platforms p ON p.station_id = s.id
+LEFT JOIN sensors se ON se.platform_id = p.id
+{where}
+ORDER BY s.id, p.id, se.id
+'''
+
+
+def sensor_from_row(row, history=None, capacity=HISTORY_CAPACITY):
+    """Build a sensor dict from the ``SENSOR_COLUMNS`` part of a row.
+
+    Without ``history`` the sensor gets an empty ring of ``capacity`` samples.
+    """
+    (sensor_id, sensor_name, ip, port, status, connect_timeout, first_byte_timeout, mode, silence_window,
+     fail_threshold, fail_window, recover_threshold, flap_threshold, interval) = row
+    return {
+        'id': sensor_id,
+        'sensor_name': sensor_name,
+        'ip': ip,
+        'port': port,
+        'status': status,
+        'history': SensorState(capacity) if history is None else history,
+        'connect_timeout': connect_timeout,
+        'first_byte_timeout': first_byte_timeout,
+        'mode': mode or 'poll',
+        'silence_window': silence_window,
+        'fail_threshold': fail_threshold,
+        'fail_window': fail_window,
+        'recover_threshold': recover_threshold,
+        'flap_threshold': flap_threshold,
+        'interval': interval,
+    }
 
-        # Query to get all stations
-        cursor.execute("SELECT id, name FROM stations")
-        stations_rows = cursor.fetchall()
 
-        if not stations_rows:
-            logging.warning("No stations found in the database.")
+def query_station_tree(cursor, station_name=None):
+    """Return the flattened station tree rows, optionally for a single station."""
+    if station_name is None:
+        cursor.execute(STATION_TREE_QUERY.format(sensor_columns=SENSOR_COLUMNS, where=""))
+    else:
+        cursor.execute(STATION_TREE_QUERY.format(sensor_columns=SENSOR_COLUMNS, where="WHERE s.name = ?"), (station_name,))
+    return cursor.fetchall()
 
-        stations = {}
-        for station_id, station_name in stations_rows:
-            # Query to get platforms for each station
-            cursor.execute("SELECT id, name FROM platforms WHERE station_id = ?", (station_id,))
-            platforms_rows = cursor.fetchall()
 
-            platforms = {}
-            for platform_id, platform_name in platforms_rows:
-                # Query to get sensors for each platform
-                cursor.execute("SELECT sensor_name, ip, port, status, history FROM sensors WHERE platform_id = ?", (platform_id,))
-                sensors_rows = cursor.fetchall()
+def build_station_tree(rows, capacity=HISTORY_CAPACITY):
+    """Build ``{station: {platform: [sensor, ...]}}`` from tree rows in one pass.
 
-                sensors = []
-                for sensor_name, ip, port, status, history in sensors_rows:
-                    sensors.append({
-                        'sensor_name': sensor_name,
-                        'ip': ip,
-                        'port': port,
-                        'status': status,
-                        'history': json.loads(history)  # Convert JSON string back to list
-                    })
+    Each sensor's history ring holds ``capacity`` samples.
+
+    The cyclic garbage collector is paused while the tree is built: every
+    sensor adds two new containers, and on a large fleet the repeated
+    generation-0 collections cost more than building the tree itself.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _build_station_tree(rows, capacity)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _build_station_tree(rows, capacity):
+    stations = {}
+    for row in rows:
+        platforms = stations.setdefault(row[0], {})
+        if row[1] is None:
+            continue
+        sensors = platforms.setdefault(row[2], [])
+        if row[3] is None:
+            continue
+        # Filled by the monitor, and from probe_results on first read (StateCache.seed_history)
+        sensors.append(sensor_from_row(row[3:], capacity=capacity))
+    return stations
 
-                platforms[platform_name] = sensors
 
-            stations[station_name] = platforms
+def load_stations():
+    """Load station data from the SQLite database or return an empty dictionary if the database is empty or cannot be accessed."""
+    conn = None
+    try:
+        conn = get_connection()
+        stations = build_station_tree(query_station_tree(conn.cursor()))
 
-        logging.info(f"Loaded stations: {stations}")
+        if not stations:
+            logging.warning("No stations found in the database.")
+        else:
+            sensor_count = sum(len(sensors) for platforms in stations.values() for sensors in platforms.values())
+            logging.info(f"Loaded {len(stations)} stations with {sensor_count} sensors")
 
         return stations
 
@@ -141,15 +221,25 @@ def load_stations():
         return {}
     
     finally:
-        if conn:
-            conn.close()
-            
+        if conn and conn.in_transaction:
+            conn.rollback()
             
+
+def load_station(station_name):
+    """Load one station's ``{platform: [sensor, ...]}`` subtree, or None if it does not exist."""
+    conn = get_connection()
+    try:
+        return build_station_tree(query_station_tree(conn.cursor(), station_name)).get(station_name)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
 def save_stations(stations):
     """Save the current station data to the SQLite database."""
     conn = None
     try:
-        conn = sqlite3.connect('stations.db')
+        conn = get_connection()
         cursor = conn.cursor()
 
         # Delete existing data
@@ -170,15 +260,15 @@ def save_stations(stations):
                 for sensor in sensors:
                     # Insert sensor
                     cursor.execute('''
-                    INSERT OR REPLACE INTO sensors (platform_id, sensor_name, ip, port, status, history) 
+                    INSERT OR REPLACE INTO sensors (id, platform_id, sensor_name, ip, port, status)
                     VALUES (?, ?, ?, ?, ?, ?)
                     ''', (
+                        sensor.get('id'),  # Keep the id so probe_results stay attached
                         platform_id, 
                         sensor['sensor_name'], 
                         sensor['ip'], 
                         sensor['port'], 
-                        sensor['status'], 
-                        json.dumps(sensor['history'])  # Convert list to JSON string
+                        sensor['status'],
                     ))
 
         conn.commit()
@@ -188,11 +278,13 @@ def save_stations(stations):
         logging.error(f"Failed to save stations: {e}")
 
     finally:
-        if conn:
-            conn.close()
+        if conn and conn.in_transaction:
+            conn.rollback()
 
-# Load stations from the JSON file or use default data if the file doesn't exist
-stations = load_stations()
+# The station tree shared by the web app and the monitor. Importing this
+# module does not touch the database; ``state.ensure_loaded()`` creates the
+# schema and fills this dict in place on first use.
+stations = {}
 
 
 def add_station(station_name, platform_data):
@@ -214,15 +306,14 @@ def add_station(station_name, platform_data):
             for sensor in sensors:
                 # Insert sensor
                 cursor.execute('''
-                INSERT INTO sensors (platform_id, sensor_name, ip, port, status, history) 
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO sensors (platform_id, sensor_name, ip, port, status)
+                VALUES (?, ?, ?, ?, ?)
                 ''', (
                     platform_id, 
                     sensor['sensor_name'], 
                     sensor['ip'], 
                     sensor['port'], 
-                    sensor['status'], 
-                    json.dumps(sensor['history'])
+                    sensor['status'],
                 ))
 
         conn.commit()
@@ -232,8 +323,8 @@ def add_station(station_name, platform_data):
         logging.error(f"Failed to add station '{station_name}': {e}")
 
     finally:
-        if conn:
-            conn.close()
+        if conn and conn.in_transaction:
+            conn.rollback()
 
 def delete_station(station_name):
     """Delete a station and all associated platforms and sensors."""
@@ -251,6 +342,7 @@ def delete_station(station_name):
         station_id = station_row[0]
 
         # Delete associated sensors and platforms
+        cursor.execute("DELETE FROM probe_results WHERE sensor_id IN (SELECT id FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?))", (station_id,))
         cursor.execute("DELETE FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?)", (station_id,))
         cursor.execute("DELETE FROM platforms WHERE station_id = ?", (station_id,))
         cursor.execute("DELETE FROM stations WHERE id = ?", (station_id,))
@@ -262,182 +354,186 @@ def delete_station(station_name):
         logging.error(f"Failed to delete station '{station_name}': {e}")
 
     finally:
-        if conn:
-            conn.close()
+        if conn and conn.in_transaction:
+            conn.rollback()
             
             
 
 def edit_station(station_name, new_name, new_platform_data):
     """Edit an existing station's name, platforms, and sensors."""
-    conn = None
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
+        edit_station_in_db(station_name, new_name, new_platform_data)
+        logging.info(f"Station '{station_name}' updated successfully")
+    except Exception as e:
+        logging.error(f"Failed to update station '{station_name}': {e}")
 
-        # Check if the station exists
-        cursor.execute("SELECT id FROM stations WHERE name = ?", (station_name,))
-        station_row = cursor.fetchone()
-        if not station_row:
-            raise ValueError(f"Station '{station_name}' does not exist")
+def get_station_data(station_name):
+    conn = get_db_connection()
+    try:
+        rows = query_station_tree(conn.cursor(), station_name)
+        if not rows:
+            return {"error": "Station not found"}
+
+        platform_data = []
+        platforms_by_id = {}
+        for row in rows:
+            platform_id, platform_name, sensor_id = row[1], row[2], row[3]
+            if platform_id is None:
+                continue
+            platform = platforms_by_id.get(platform_id)
+            if platform is None:
+                platform = {"id": platform_id, "name": platform_name, "sensors": []}
+                platforms_by_id[platform_id] = platform
+                platform_data.append(platform)
+            if sensor_id is None:
+                continue
+            platform["sensors"].append(sensor_from_row(row[3:], get_recent_history(conn, sensor_id, HISTORY_CAPACITY)))
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
 
-        station_id = station_row[0]
+    return {
+        "station_name": station_name,
+        "platforms": platform_data
+    }
 
-        # Update station name if changed
-        if station_name != new_name:
-            cursor.execute("UPDATE stations SET name = ? WHERE id = ?", (new_name, station_id))
+def add_station_to_db(name, platforms):
+    conn = get_connection()
+    with conn:
+        cursor = conn.cursor()
 
-        # Delete existing platforms and sensors
-        cursor.execute("DELETE FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?)", (station_id,))
-        cursor.execute("DELETE FROM platforms WHERE station_id = ?", (station_id,))
+        cursor.execute("INSERT INTO stations (name) VALUES (?)", (name,))
+        station_id = cursor.lastrowid
 
-        # Insert new platforms and sensors
-        for platform_name, sensors in new_platform_data.items():
+        for platform_name, sensors in platforms.items():
             cursor.execute("INSERT INTO platforms (station_id, name) VALUES (?, ?)", (station_id, platform_name))
             platform_id = cursor.lastrowid
-
             for sensor in sensors:
                 cursor.execute('''
-                INSERT INTO sensors (platform_id, sensor_name, ip, port, status, history) 
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO sensors (platform_id, sensor_name, ip, port, status)
+                VALUES (?, ?, ?, ?, ?)
                 ''', (
                     platform_id, 
                     sensor['sensor_name'], 
                     sensor['ip'], 
                     sensor['port'], 
-                    sensor['status'], 
-                    json.dumps(sensor['history'])
+                    sensor['status'],
                 ))
 
-        conn.commit()
-        logging.info(f"Station '{station_name}' updated successfully")
+def delete_station_from_db(name):
+    conn = get_connection()
+    with conn:
+        cursor = conn.cursor()
 
-    except Exception as e:
-        logging.error(f"Failed to update station '{station_name}': {e}")
+        cursor.execute("SELECT id FROM stations WHERE name = ?", (name,))
+        station_id = cursor.fetchone()
+        if not station_id:
+            return
+        station_id = station_id[0]
 
-    finally:
-        if conn:
-            conn.close()
-            
-def get_station_data(station_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get station ID
-    cursor.execute("SELECT id FROM stations WHERE name = ?", (station_name,))
-    station_id = cursor.fetchone()
-    if not station_id:
-        conn.close()
-        return {"error": "Station not found"}
-    station_id = station_id[0]
-    
-    # Get platforms and sensors
-    cursor.execute("SELECT id, name FROM platforms WHERE station_id = ?", (station_id,))
-    platforms = cursor.fetchall()
-    
-    platform_data = []
-    for platform in platforms:
-        platform_id = platform[0]
-        cursor.execute("SELECT sensor_name, ip, port, status, history FROM sensors WHERE platform_id = ?", (platform_id,))
-        sensors = cursor.fetchall()
-        sensors_list = [
-            {
-                "sensor_name": sensor[0],
-                "ip": sensor[1],
-                "port": sensor[2],
-                "status": sensor[3],
-                "history": json.loads(sensor[4])  # Convert JSON string back to list
-            }
-            for sensor in sensors
-        ]
-        platform_data.append({
-            "id": platform_id,
-            "name": platform[1],
-            "sensors": sensors_list
-        })
-    
-    conn.close()
-    return {
-        "station_name": station_name,
-        "platforms": platform_data
-    }
+        cursor.execute("DELETE FROM probe_results WHERE sensor_id IN (SELECT id FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?))", (station_id,))
+        cursor.execute("DELETE FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?)", (station_id,))
+        cursor.execute("DELETE FROM platforms WHERE station_id = ?", (station_id,))
+        cursor.execute("DELETE FROM stations WHERE id = ?", (station_id,))
 
-def add_station_to_db(name, platforms):
-    conn = sqlite3.connect('stations.db')
-    cursor = conn.cursor()
+def _platform_list(platforms):
+    """Accept ``{platform: [sensor, ...]}`` as well as a list of platform dicts."""
+    if isinstance(platforms, dict):
+        return [{"id": None, "name": name, "sensors": sensors} for name, sensors in platforms.items()]
+    return platforms
 
-    cursor.execute("INSERT INTO stations (name) VALUES (?)", (name,))
-    station_id = cursor.lastrowid
-
-    for platform_name, sensors in platforms.items():
-        cursor.execute("INSERT INTO platforms (station_id, name) VALUES (?, ?)", (station_id, platform_name))
-        platform_id = cursor.lastrowid
-        for sensor in sensors:
-            cursor.execute('''
-            INSERT INTO sensors (platform_id, sensor_name, ip, port, status, history) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                platform_id, 
-                sensor['sensor_name'], 
-                sensor['ip'], 
-                sensor['port'], 
-                sensor['status'], 
-                json.dumps(sensor['history'])  # Convert list to JSON string
-            ))
-    conn.commit()
-    conn.close()
 
-def delete_station_from_db(name):
-    conn = sqlite3.connect('stations.db')
-    cursor = conn.cursor()
+def edit_station_in_db(old_name, new_name, platforms):
+    """Make a station match ``platforms`` with the fewest inserts, updates and deletes.
 
-    cursor.execute("SELECT id FROM stations WHERE name = ?", (name,))
-    station_id = cursor.fetchone()
-    if not station_id:
-        conn.close()
-        return
-    station_id = station_id[0]
+    ``platforms`` is a list of ``{"id", "name", "sensors"}`` dicts whose
+    sensors are ``{"id", "sensor_name", "ip", "port"}`` dicts, as returned by
+    ``get_station_data``; a ``{platform_name: [sensor, ...]}`` dict is also
+    accepted. Platforms and sensors are matched by id when one is given and
+    by name otherwise. Matched rows are updated in place, so they keep their
+    id, status and probe history; rows that are no longer listed are deleted
+    together with their history. Everything happens in one transaction.
 
-    cursor.execute("DELETE FROM sensors WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?)", (station_id,))
-    cursor.execute("DELETE FROM platforms WHERE station_id = ?", (station_id,))
-    cursor.execute("DELETE FROM stations WHERE id = ?", (station_id,))
-    conn.commit()
-    conn.close()
+    Returns ``{"added": [...], "updated": [...], "removed": [...]}`` sensor ids.
+    """
+    platforms = _platform_list(platforms)
+    changes = {"added": [], "updated": [], "removed": []}
+    conn = get_connection()
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM stations WHERE name = ?", (old_name,))
+        station_row = cursor.fetchone()
+        if not station_row:
+            raise ValueError(f"Station '{old_name}' does not exist")
+        station_id = station_row[0]
+        if new_name != old_name:
+            cursor.execute("UPDATE stations SET name = ? WHERE id = ?", (new_name, station_id))
 
-def edit_station_in_db(old_name, new_name, platforms):
-    if old_name != new_name:
-        # Update station name logic
-        pass
+        current_platforms = dict(cursor.execute("SELECT id, name FROM platforms WHERE station_id = ?", (station_id,)))
+        current_sensors = {
+            row[0]: row
+            for row in cursor.execute('''
+            SELECT id, platform_id, sensor_name, ip, port FROM sensors
+            WHERE platform_id IN (SELECT id FROM platforms WHERE station_id = ?)
+            ''', (station_id,))
+        }
+        platform_ids_by_name = {name: platform_id for platform_id, name in current_platforms.items()}
+        sensor_ids_by_name = {(row[1], row[2]): sensor_id for sensor_id, row in current_sensors.items()}
+
+        kept_platforms, kept_sensors = set(), set()
+        for platform in platforms:
+            platform_id = platform.get("id")
+            if platform_id not in current_platforms or platform_id in kept_platforms:
+                platform_id = platform_ids_by_name.get(platform["name"])
+                if platform_id in kept_platforms:
+                    platform_id = None
+            if platform_id is None:
+                cursor.execute("INSERT INTO platforms (station_id, name) VALUES (?, ?)", (station_id, platform["name"]))
+                platform_id = cursor.lastrowid
+            elif current_platforms[platform_id] != platform["name"]:
+                cursor.execute("UPDATE platforms SET name = ? WHERE id = ?", (platform["name"], platform_id))
+            kept_platforms.add(platform_id)
 
-    # Add or update platforms and sensors
-    for platform_name, sensors in platforms.items():
-        current_sensors = get_platform_data(old_name, platform_name)
-        
-        if not current_sensors:
-            # Add new platform if not exists
-            add_platform_to_db(new_name, platform_name)
-
-        for sensor_index, sensor in enumerate(sensors):
-            sensor_name = sensor["sensor_name"]
-            current_sensor = get_sensor_data(new_name, platform_name, sensor_index)
-
-            if not current_sensor:
-                # Add new sensor
-                add_sensor_to_db(new_name, platform_name, sensor)
-            else:
-                # Update existing sensor
-                update_sensor_in_db(new_name, platform_name, sensor)
-
-    # Logic to remove unused platforms and sensors
-    current_platforms = get_all_platforms_for_station(new_name)
-    for platform in current_platforms:
-        if platform not in platforms:
-            remove_platform_from_db(new_name, platform)
-
-    for platform_name, sensors in platforms.items():
-        current_sensors = get_all_sensors_for_platform(new_name, platform_name)
-        for sensor in current_sensors:
-            if sensor["sensor_name"] not in [s["sensor_name"] for s in sensors]:
-                remove_sensor_from_db(new_name, platform_name, sensor["sensor_name"])
+            inserts, updates = [], []
+            for sensor in platform["sensors"]:
+                values = (platform_id, sensor["sensor_name"], sensor["ip"], int(sensor["port"]))
+                sensor_id = sensor.get("id")
+                if sensor_id not in current_sensors or sensor_id in kept_sensors:
+                    sensor_id = sensor_ids_by_name.get((platform_id, sensor["sensor_name"]))
+                    if sensor_id in kept_sensors:
+                        sensor_id = None
+                if sensor_id is None:
+                    inserts.append(values)
+                    continue
+                kept_sensors.add(sensor_id)
+                if tuple(current_sensors[sensor_id][1:]) != values:
+                    updates.append(values + (sensor_id,))
+                    changes["updated"].append(sensor_id)
+
+            cursor.executemany(
+                "UPDATE sensors SET platform_id = ?, sensor_name = ?, ip = ?, port = ? WHERE id = ?", updates
+            )
+            for values in inserts:
+                cursor.execute(
+                    "INSERT INTO sensors (platform_id, sensor_name, ip, port, status) VALUES (?, ?, ?, ?, 'unknown')",
+                    values,
+                )
+                changes["added"].append(cursor.lastrowid)
+
+        removed = [(sensor_id,) for sensor_id in current_sensors if sensor_id not in kept_sensors]
+        cursor.executemany("DELETE FROM probe_results WHERE sensor_id = ?", removed)
+        cursor.executemany("DELETE FROM sensors WHERE id = ?", removed)
+        cursor.executemany(
+            "DELETE FROM platforms WHERE id = ?",
+            [(platform_id,) for platform_id in current_platforms if platform_id not in kept_platforms],
+        )
+        changes["removed"] = [sensor_id for sensor_id, in removed]
+
+    logging.info(
+        f"Station '{old_name}' edited: {len(changes['added'])} sensors added, "
+        f"{len(changes['updated'])} updated, {len(changes['removed'])} removed"
+    )
+    return changes
 
 
 def remove_platform_from_db(station_name, platform_name):
@@ -454,7 +550,8 @@ def remove_platform_from_db(station_name, platform_name):
 
         platform_id = platform_row[0]
 
-        # Delete associated sensors
+        # Delete associated sensors and their probe history
+        cursor.execute("DELETE FROM probe_results WHERE sensor_id IN (SELECT id FROM sensors WHERE platform_id = ?)", (platform_id,))
         cursor.execute("DELETE FROM sensors WHERE platform_id = ?", (platform_id,))
         # Delete platform
         cursor.execute("DELETE FROM platforms WHERE id = ?", (platform_id,))
@@ -466,8 +563,8 @@ def remove_platform_from_db(station_name, platform_name):
         logging.error(f"Failed to remove platform '{platform_name}' from station '{station_name}': {e}")
 
     finally:
-        if conn:
-            conn.close()
+        if conn and conn.in_transaction:
+            conn.rollback()
 
 def remove_sensor_from_db(station_name, platform_name, sensor_index):
     conn = None
@@ -491,7 +588,8 @@ def remove_sensor_from_db(station_name, platform_name, sensor_index):
 
         sensor_id = sensor_row[0]
 
-        # Delete sensor
+        # Delete sensor and its probe history
+        cursor.execute("DELETE FROM probe_results WHERE sensor_id = ?", (sensor_id,))
         cursor.execute("DELETE FROM sensors WHERE id = ?", (sensor_id,))
 
         conn.commit()
@@ -501,42 +599,34 @@ def remove_sensor_from_db(station_name, platform_name, sensor_index):
         logging.error(f"Failed to remove sensor from platform '{platform_name}' in station '{station_name}': {e}")
 
     finally:
-        if conn:
-            conn.close()
+        if conn and conn.in_transaction:
+            conn.rollback()
 
 
 def get_platform_data(station_name, platform_name):
-    conn = sqlite3.connect('stations.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT id FROM stations WHERE name = ?", (station_name,))
-    station_id = cursor.fetchone()
-    if not station_id:
-        conn.close()
-        return None
-    station_id = station_id[0]
-
-    cursor.execute("SELECT id FROM platforms WHERE station_id = ? AND name = ?", (station_id, platform_name))
-    platform_id = cursor.fetchone()
-    if not platform_id:
-        conn.close()
-        return None
-    platform_id = platform_id[0]
-
-    cursor.execute("SELECT sensor_name, ip, port, status, history FROM sensors WHERE platform_id = ?", (platform_id,))
-    sensors = cursor.fetchall()
-    sensor_list = [
-        {
-            "sensor_name": sensor[0],
-            "ip": sensor[1],
-            "port": sensor[2],
-            "status": sensor[3],
-            "history": json.loads(sensor[4])  # Convert JSON string back to list
-        }
-        for sensor in sensors
-    ]
-    conn.close()
-    return sensor_list
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT {SENSOR_COLUMNS}
+        FROM platforms p
+        JOIN stations s ON s.id = p.station_id
+        LEFT JOIN sensors se ON se.platform_id = p.id
+        WHERE s.name = ? AND p.name = ?
+        ORDER BY p.id, se.id
+        ''', (station_name, platform_name))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+
+        return [
+            sensor_from_row(row, get_recent_history(conn, row[0], HISTORY_CAPACITY))
+            for row in rows
+            if row[0] is not None
+        ]
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
 
 def get_sensor_data(station_name, platform_name, sensor_index):
     sensor_index = int(sensor_index)  # Ensure sensor_index is an integer
@@ -558,37 +648,19 @@ def update_sensor_in_db(station_name, platform_name, sensor_data):
         sensor_data (dict): A dictionary containing sensor details like sensor_name, ip, and port.
 
     Returns:
-        None
+        bool: Whether a sensor with that name was found and updated.
     """
-    # Retrieve the existing platform data
-    platforms = get_station_data(station_name)["platforms"]
-    
-    for platform in platforms:
-        if platform["platform_name"] == platform_name:
-            for sensor in platform["sensors"]:
-                if sensor["sensor_name"] == sensor_data["sensor_name"]:
-                    # Update the sensor's details
-                    sensor["ip"] = sensor_data["ip"]
-                    sensor["port"] = sensor_data["port"]
-                    break
-
-    # Save the updated station data
-    save_station_data(station_name, platforms)    
-    
-def get_db_connection():
-    conn = sqlite3.connect('stations.db')  # Update this path as necessary
-    conn.row_factory = sqlite3.Row
-    return conn
-    
-    
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''
+        UPDATE sensors SET ip = ?, port = ?
+        WHERE sensor_name = ? AND platform_id IN (
+            SELECT p.id FROM platforms p JOIN stations s ON s.id = p.station_id
+            WHERE s.name = ? AND p.name = ?
+        )
+        ''', (sensor_data["ip"], int(sensor_data["port"]), sensor_data["sensor_name"], station_name, platform_name))
+    return cursor.rowcount > 0
     
-def get_station_data(station_name):
-    # Example function body, replace with your actual logic
-    data = {
-        # "platforms" should be a key here if platforms are part of the data
-    }
-    print("DEBUG: Station Data:", data)  # Add this line for debugging
-    return data
 #---------------------------------------------------------------------------------------------------------------------------
 #---------------------------------------------------------------------------------------------------------------------------V
 #---------------------------------------------------------------------------------------------------------------------------
@@ -598,68 +670,57 @@ def get_station_data(station_name):
 #---------------------------------------------------------------------------------------------------------------------------
 
 
-# Lock for synchronizing access to sensor data
-sensor_lock = threading.Lock()
+# Write-behind queue that persists probe results; started by get_result_writer()
+result_writer = None
 
-def check_port(sensor):
-    """Check if data is flowing on the specified IP and port."""
-    ip = sensor["ip"]
-    port = sensor["port"]
+# Background rollup of probe results; started by get_rollup_worker()
+rollup_worker = None
 
-    try:
-        logging.info(f"Checking {sensor['sensor_name']} at {ip}:{port}")
-        with socket.create_connection((ip, port), timeout=TIMEOUT) as sock:
-            try:
-                data = sock.recv(1024)
-                if data:
-                    status = "green"  # Data received, sensor is functioning properly
-                    history_entry = 0  # Status OK (0)
-                else:
-                    status = "red"  # No data received
-                    history_entry = 1  # Status not OK (1)
-            except socket.timeout:
-                logging.warning(f"Timeout on {sensor['sensor_name']} at {ip}:{port}")
-                status = "red"  # Timeout without receiving data
-                history_entry = 1  # Status not OK (1)
-    except socket.error as e:
-        logging.error(f"Connection error for {sensor['sensor_name']} at {ip}:{port}: {e}")
-        status = "red"  # Connection error
-        history_entry = 1  # Status not OK (1)
-    except Exception as e:
-        logging.exception(f"Unexpected error for {sensor['sensor_name']} at {ip}:{port}: {e}")
-        status = "red"  # Connection error
-        history_entry = 1  # Status not OK (1)
-
-    with sensor_lock:
-        # Ensure history and status are updated safely
-        sensor["status"] = status
-        sensor["history"].append(history_entry)
-        # Keep history limited to last 100 entries
-        if len(sensor["history"]) > 100:
-            sensor["history"] = sensor["history"][-100:]
-
-def monitor_station(station_name, platforms):
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        while True:
-            futures = []
-            for platform_name, sensors in platforms.items():
-                for sensor in sensors:
-                    futures.append(executor.submit(check_port, sensor))
-            
-            for future in concurrent.futures.as_completed(futures):
-                pass  # All results are processed inside `check_port`
-            
-            time.sleep(60)  # Sleep before the next check cycle
+# Probe processes used by start_monitoring; more than one shards the stations
+MONITOR_PROCESSES = int(os.environ.get('MONITOR_PROCESSES', '1'))
 
-def start_monitoring():
-    for station_name, platforms in stations.items():
-        t = threading.Thread(target=monitor_station, args=(station_name, platforms))
-        t.daemon = True
-        t.start()
+def get_result_writer():
+    """Return the shared write-behind writer, starting it on first use."""
+    global result_writer
+    if result_writer is None:
+        result_writer = ResultWriter(DB_PATH)
+        result_writer.start()
+    return result_writer
+
+def get_rollup_worker():
+    """Return the shared rollup thread, starting it on first use."""
+    global rollup_worker
+    if rollup_worker is None:
+        rollup_worker = RollupWorker(DB_PATH)
+        rollup_worker.start()
+    return rollup_worker
+
+def start_monitoring(processes=MONITOR_PROCESSES, interval=CHECK_INTERVAL):
+    """Start probing every station in the background and return the monitor.
+
+    With one process the asyncio engine runs on a thread of this process
+    (see supervisor.py); with more, stations are split across that many
+    shard processes (see shards.py) and only the result collector runs
+    here. Either way the returned object takes ``add_sensor``,
+    ``remove_sensor`` and ``reconfigure`` calls for live changes.
+    """
+    get_rollup_worker()
+    if log_status_change not in result_listeners:
+        result_listeners.append(log_status_change)
+    if processes > 1:
+        from shards import ShardedMonitor
+
+        return ShardedMonitor(stations, processes, writer=get_result_writer(), interval=interval).start()
+
+    from supervisor import MonitorSupervisor
+
+    return MonitorSupervisor(stations, writer=get_result_writer(), interval=interval).start()
 
 if __name__ == "__main__":
-    start_monitoring()
-    app.run(debug=True)
+    # The monitor daemon lives in monitor.py; the web app is served separately
+    from monitor import main
+
+    main()
 
 
 
@@ -0,0 +1,184 @@
+"""Streaming mode: one long-lived connection per sensor.
+
+Sensors with ``mode = 'stream'`` are not probed on a schedule. Instead the
+probe engine keeps one TCP connection open to each of them and drains it
+with non-blocking reads straight into a reusable buffer (the data itself is
+discarded; only its arrival matters). That costs one socket per NPort port
+instead of a new connection every interval, and leaves the port alone for
+the rest of the time rather than fighting other clients for it.
+
+A streamed sensor is green while bytes keep arriving and goes red once
+nothing has been received for its silence window, or as soon as the
+connection drops. Results are recorded like probe results: immediately when
+the status changes, every ``TICK_INTERVAL`` seconds while the sensor's
+status has not caught up with the stream's, and every ``REPORT_INTERVAL``
+seconds otherwise, with the bytes received in that period. Like probe
+results they go through ``debounce.py``, so a single dropped connection
+does not turn the sensor red. Silence (error ``silent``) is the exception:
+the silence window already waited long enough, so it turns the sensor red
+at once, within a ``TICK_INTERVAL`` of the window ending. The live rate is
+kept on the sensor dict as ``bytes_per_sec``, refreshed every tick, and
+shown on the station page, in ``/api/v1/stations/<name>`` and as
+``nport_stream_bytes_per_second``. Other processes derive it from the
+bytes of each recorded result (see ``probe.record_result``).
+"""
+import asyncio
+import logging
+import socket
+import time
+
+from probe import CONNECT_TIMEOUT, connect_error, probe_timeouts, record_result, sensor_lock
+
+# Bytes read per receive; the buffer is allocated once per stream and reused
+STREAM_BUFFER_SIZE = 65536
+
+# Seconds without data before a streamed sensor is marked red
+SILENCE_WINDOW = 30
+
+# Seconds between silence checks and byte-rate updates
+TICK_INTERVAL = 5
+
+# Seconds between recorded results while the status stays the same
+REPORT_INTERVAL = 60
+
+# Reconnect back-off after a failed or dropped connection
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 60
+
+
+class _StreamProtocol(asyncio.BufferedProtocol):
+    """Counts incoming bytes, reading them into a caller-owned buffer."""
+
+    def __init__(self, buffer, closed):
+        self._buffer = buffer
+        self._closed = closed
+        self.bytes_received = 0
+        self.first_data = None
+        self.last_data = None
+
+    def connection_made(self, transport):
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            # Let the kernel notice a peer that vanished without closing
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    def get_buffer(self, sizehint):
+        return self._buffer
+
+    def buffer_updated(self, nbytes):
+        self.last_data = time.monotonic()
+        if self.first_data is None:
+            self.first_data = self.last_data
+        self.bytes_received += nbytes
+
+    def eof_received(self):
+        return False  # close the transport
+
+    def connection_lost(self, exc):
+        if not self._closed.done():
+            self._closed.set_result(exc)
+
+
+class SensorStream:
+    """Hold a connection to one streaming sensor and report on it, forever.
+
+    ``writer``, when given, is a ``writer.ResultWriter`` that receives a
+    probe_results row for every recorded result.
+    """
+
+    def __init__(self, sensor, writer=None, connect_timeout=CONNECT_TIMEOUT):
+        self.sensor = sensor
+        self.writer = writer
+        self.connect_timeout = connect_timeout
+        self._buffer = bytearray(STREAM_BUFFER_SIZE)
+        self._reported_bytes = 0
+
+    @property
+    def silence_window(self):
+        return self.sensor.get("silence_window") or SILENCE_WINDOW
+
+    async def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            received = await self._session()
+            delay = RECONNECT_DELAY if received else min(delay * 2, MAX_RECONNECT_DELAY)
+            await asyncio.sleep(delay)
+
+    async def _report(self, status, connect_ms=None, first_byte_ms=None, bytes_received=0, error=None):
+        history_entry = 0 if status == "green" else 1
+        ts = time.time()
+        sensor_status = record_result(self.sensor, status, history_entry, connect_ms, ts, error)
+        if self.writer is not None and self.sensor.get("id") is not None:
+            await self.writer.submit_async((
+                self.sensor["id"], ts, history_entry, connect_ms, first_byte_ms, bytes_received, error, sensor_status,
+            ))
+
+    def _set_rate(self, bytes_per_sec):
+        with sensor_lock(self.sensor):
+            self.sensor["bytes_per_sec"] = bytes_per_sec
+
+    async def _session(self):
+        """Connect and watch one connection until it drops; return whether any data arrived."""
+        sensor = self.sensor
+        ip = sensor["ip"]
+        port = int(sensor["port"])
+        connect_timeout = probe_timeouts(sensor, self.connect_timeout)[0]
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+
+        started = time.perf_counter()
+        try:
+            transport, protocol = await asyncio.wait_for(
+                loop.create_connection(lambda: _StreamProtocol(self._buffer, closed), ip, port),
+                connect_timeout,
+            )
+        except (asyncio.TimeoutError, OSError) as e:
+            logging.debug(f"Stream connect failed for {sensor['sensor_name']} at {ip}:{port}: {e!r}")
+            self._set_rate(0.0)
+            await self._report("red", error=connect_error(e))
+            return False
+        connect_ms = (time.perf_counter() - started) * 1000
+        logging.debug(f"Streaming {sensor['sensor_name']} at {ip}:{port}")
+
+        try:
+            await self._watch(protocol, closed, connect_ms)
+        finally:
+            transport.close()
+        logging.debug(f"Stream closed for {sensor['sensor_name']} at {ip}:{port}")
+        self._set_rate(0.0)
+        await self._report("red", bytes_received=protocol.bytes_received - self._reported_bytes, error="closed")
+        return protocol.bytes_received > 0
+
+    async def _watch(self, protocol, closed, connect_ms):
+        connected = time.monotonic()
+        tick_start = last_report = connected
+        tick_bytes = self._reported_bytes = 0
+        status = None
+
+        while not closed.done():
+            await asyncio.wait([closed], timeout=TICK_INTERVAL)
+            if closed.done():
+                return
+            now = time.monotonic()
+            self._set_rate((protocol.bytes_received - tick_bytes) / (now - tick_start))
+            tick_start, tick_bytes = now, protocol.bytes_received
+
+            last_data = protocol.last_data if protocol.last_data is not None else connected
+            new_status = "green" if now - last_data <= self.silence_window else "red"
+            # Until debouncing agrees with the stream, every tick counts as a result
+            settled = self.sensor["status"] == new_status
+            if new_status == status and settled and now - last_report < REPORT_INTERVAL:
+                continue
+
+            first_byte_ms = None
+            if status is None:
+                # Connection timings go with the session's first result only
+                if protocol.first_data is not None:
+                    first_byte_ms = (protocol.first_data - connected) * 1000
+            else:
+                connect_ms = None
+            status, last_report = new_status, now
+            bytes_received = protocol.bytes_received - self._reported_bytes
+            self._reported_bytes = protocol.bytes_received
+            await self._report(status, connect_ms, first_byte_ms, bytes_received,
+                               None if status == "green" else "silent")
@@ -0,0 +1,85 @@
+"""Live control of the running probe engine.
+
+``MonitorSupervisor`` owns the probe engine's thread and event loop. The
+set of probed sensors is read from the station tree once at start; after
+that the web app reports every change through ``add_sensor``,
+``remove_sensor`` and ``reconfigure`` (``StateCache.invalidate_station``
+does this for all CRUD routes). Each call is handed to the event loop and
+applied to the live scheduler on its own: untouched sensors keep their
+schedule, and no thread is started or left behind per change.
+
+``ShardedMonitor`` (shards.py) offers the same three methods.
+"""
+import asyncio
+import logging
+import threading
+
+from probe import CHECK_INTERVAL, ProbeEngine
+from scheduler import ProbeScheduler
+
+
+class MonitorSupervisor:
+    """Run a ``ProbeEngine`` on a background thread and apply changes to it."""
+
+    def __init__(self, stations, writer=None, interval=CHECK_INTERVAL, engine=None):
+        self.stations = stations
+        self.engine = engine or ProbeEngine(writer=writer)
+        self.interval = interval
+        self._thread = None
+        self._loop = None
+        self._task = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="probe-engine", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._task = loop.create_task(self.engine.run_forever(
+            self.stations, ProbeScheduler(base_interval=self.interval), sync_interval=None,
+        ))
+        self._loop = loop
+        loop.call_soon(self._ready.set)
+        try:
+            loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            self._loop = None
+
+    def stop(self, timeout=None):
+        """Cancel the engine, wait for its thread to exit."""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _call(self, callback, *args):
+        loop = self._loop
+        if loop is None:
+            logging.warning(f"Probe engine is not running; ignoring {callback.__name__}")
+            return
+        loop.call_soon_threadsafe(callback, *args)
+
+    def add_sensor(self, station_name, sensor):
+        """Start probing a sensor dict that is now part of the station tree."""
+        self._call(self.engine.add_sensor, sensor)
+
+    def remove_sensor(self, station_name, sensor):
+        """Stop probing a sensor dict that left the station tree."""
+        self._call(self.engine.remove_sensor, sensor)
+
+    def reconfigure(self, station_name, old_sensor, new_sensor):
+        """Replace a sensor whose probe settings changed."""
+        self._call(self._reconfigure, old_sensor, new_sensor)
+
+    def _reconfigure(self, old_sensor, new_sensor):
+        self.engine.remove_sensor(old_sensor)
+        self.engine.add_sensor(new_sensor)
@@ -0,0 +1,185 @@
+"""Write-behind persistence of probe results.
+
+Probes push probe_results rows (see ``history.record_probe_results``),
+followed by the sensor's debounced status after that result, onto a
+bounded queue and return immediately. One writer thread drains the queue
+and commits everything it collected in a single transaction, either every
+``flush_interval`` seconds or as soon as ``batch_size`` rows are waiting,
+whichever comes first. Each flush appends the rows to probe_results and
+updates ``sensors.status`` to each sensor's latest status, so the last known
+status survives a restart without rewriting the inventory tables.
+"""
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+
+import metrics
+from db import open_connection
+from history import record_probe_results
+
+FLUSH_INTERVAL = 0.5  # seconds
+BATCH_SIZE = 1000
+MAX_QUEUE = 50000
+
+# Commit time of one batch, exported on /metrics
+DB_FLUSH_SECONDS = metrics.Histogram("nport_db_flush_seconds", "Time to commit one batch of probe results")
+
+_writers = weakref.WeakSet()
+
+
+def _collect_writer_metrics():
+    snapshots = [writer.metrics() for writer in list(_writers)]
+    yield ("nport_db_write_queue_depth", "gauge", "Probe results waiting to be written", (),
+           [((), sum(s["queue_depth"] for s in snapshots))])
+    yield ("nport_db_rows_written_total", "counter", "Probe results committed to the database", (),
+           [((), sum(s["rows_written"] for s in snapshots))])
+    yield ("nport_db_rows_dropped_total", "counter", "Probe results dropped because the queue stayed full", (),
+           [((), sum(s["rows_dropped"] for s in snapshots))])
+    yield ("nport_db_failed_batches_total", "counter", "Batches whose transaction failed", (),
+           [((), sum(s["failed_batches"] for s in snapshots))])
+
+
+metrics.register_collector(_collect_writer_metrics)
+
+
+class ResultWriter(threading.Thread):
+    """Single background thread that batches probe results into SQLite.
+
+    The queue is bounded: when the database falls behind, ``submit`` blocks
+    (up to ``timeout``) and ``submit_async`` yields to the event loop until
+    there is room, which slows producers down instead of growing memory
+    without limit. Rows that still do not fit are dropped and counted.
+    """
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE, max_queue=MAX_QUEUE):
+        super().__init__(name="result-writer", daemon=True)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "rows_written": 0,
+            "rows_dropped": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "backpressure_waits": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        _writers.add(self)
+
+    def submit(self, row, timeout=None):
+        """Queue one result row, blocking while the queue is full.
+
+        Returns False if the row had to be dropped because ``timeout`` expired.
+        """
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self._count("backpressure_waits")
+        try:
+            self._queue.put(row, timeout=timeout)
+            return True
+        except queue.Full:
+            self._count("rows_dropped")
+            return False
+
+    async def submit_async(self, row, timeout=None, poll=0.01):
+        """Queue one result row from a coroutine without blocking the event loop."""
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self._count("backpressure_waits")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+            try:
+                self._queue.put_nowait(row)
+                return True
+            except queue.Full:
+                continue
+        self._count("rows_dropped")
+        return False
+
+    def metrics(self):
+        """Return a snapshot of queue depth and flush statistics."""
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        snapshot["queue_depth"] = self._queue.qsize()
+        snapshot["avg_flush_ms"] = snapshot["total_flush_ms"] / snapshot["batches"] if snapshot["batches"] else 0.0
+        return snapshot
+
+    def stop(self, timeout=None):
+        """Flush whatever is queued, then stop the thread."""
+        self._stopping.set()
+        self.join(timeout)
+
+    def _count(self, key, amount=1):
+        with self._metrics_lock:
+            self._metrics[key] += amount
+
+    def _collect(self):
+        """Wait for the first row, then gather more until the batch is full or the interval ends."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stopping.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, conn, batch):
+        started = time.perf_counter()
+        latest = {}
+        for row in batch:
+            latest[row[0]] = row[7]
+        try:
+            with conn:
+                record_probe_results(conn, [row[:7] for row in batch])
+                conn.executemany(
+                    "UPDATE sensors SET status = ? WHERE id = ?",
+                    [(status, sensor_id) for sensor_id, status in latest.items()],
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to flush {len(batch)} probe results: {e}")
+            self._count("failed_batches")
+            self._count("rows_dropped", len(batch))
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        DB_FLUSH_SECONDS.observe(elapsed_ms / 1000)
+        with self._metrics_lock:
+            self._metrics["rows_written"] += len(batch)
+            self._metrics["batches"] += 1
+            self._metrics["last_flush_ms"] = elapsed_ms
+            self._metrics["max_flush_ms"] = max(self._metrics["max_flush_ms"], elapsed_ms)
+            self._metrics["total_flush_ms"] += elapsed_ms
+
+    def run(self):
+        conn = open_connection(self.db_path)
+        try:
+            while not (self._stopping.is_set() and self._queue.empty()):
+                batch = self._collect()
+                if batch:
+                    self._flush(conn, batch)
+        finally:
+            conn.close()
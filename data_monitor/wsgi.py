@@ -0,0 +1,16 @@
+"""WSGI entry point for serving the web app from several worker processes.
+
+The workers run no probes; start ``monitor.py`` next to them. Each worker
+loads the station tree once and then follows the monitor's results and
+the other workers' inventory edits from the database (see follower.py):
+
+    python monitor.py
+    gunicorn -w 4 --threads 8 --bind 0.0.0.0:5000 wsgi:app
+    waitress-serve --threads 16 --port 5000 wsgi:app
+
+Live station pages hold a thread per open event stream, so give gunicorn
+threads (``--threads``) rather than plain sync workers.
+"""
+from app import create_app
+
+app = create_app(follow_monitor=True)